@@ -430,6 +430,34 @@ def add_consistency_flag_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def row_agreement(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    逐行的人机一致得分（0 / 0.5 / 1，自研与竞品两侧各占一半），口径与表1的合格率/满意率/胜出率一致：
+    各列的均值即为表1中的一致率。df 需已经过 _normalize_columns 且剔除了“剔除”行。
+    """
+    def primary(col):
+        return df[col].astype(str).str.split('_', n=1).str[0]
+
+    def rating_match(col_true, col_pred):
+        p1_true, p1_pred = primary(col_true), primary(col_pred)
+        return (p1_true == p1_pred) | ((p1_true == '9') & (p1_pred == '13')) | ((p1_true == '13') & (p1_pred == '9'))
+
+    def binary_match(col_true, col_pred):
+        return pd.to_numeric(df[col_true], errors='coerce') == pd.to_numeric(df[col_pred], errors='coerce')
+
+    def vs_match(col_true, col_pred):
+        return df[col_true].astype(str).str.strip() == df[col_pred].astype(str).str.strip()
+
+    return pd.DataFrame({
+        "合格率": (binary_match("标注员_小v满意度", "LLMs_自研满意度").astype(float)
+                + binary_match("标注员_竞品满意度", "LLMs_竞品满意度")) / 2,
+        "满意率": (rating_match("标注员_小v优质弱智", "LLMs_自研优质弱智").astype(float)
+                + rating_match("标注员_竞品优质弱智", "LLMs_竞品优质弱智")) / 2,
+        "胜出率": (vs_match("标注员_小v竞品对比", "LLMs_自研竞品对比").astype(float)
+                + vs_match("标注员_竞品竞品对比", "LLMs_竞品竞品对比")) / 2,
+    }, index=df.index)
+
+
 # =========================================================
 # 入口
 # =========================================================
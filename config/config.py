@@ -13,8 +13,9 @@ config = None
 
 
 def load_config():
+    """模型配置默认读取 config/model.yaml；环境变量 MODEL_CONFIG 可指定其他文件（测试使用 tests/model.yaml）"""
     global APP_ID, APP_KEY, URI, DOMAIN, config
-    with open(current_dir + "/model.yaml", encoding="utf-8") as f:
+    with open(os.environ.get("MODEL_CONFIG", current_dir + "/model.yaml"), encoding="utf-8") as f:
         config = yaml.safe_load(f)
     APP_ID = str(config["application"]["appid"])
     APP_KEY = config["application"]["appkey"]
@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+
+"""
+数据集级去重：评测前找出完全相同的评测单元，每组只评测一次，结果复制给组内其余行
+评测单元 = (度量一级分类, prompt_time, 自研对话 JSON, 竞品对话 JSON)，
+对话 JSON 先解析再按固定格式序列化（忽略空白、键顺序差异），解析失败时按去掉首尾空白的原文比较。
+重采样的行、重复导出的周报合并数据中这类重复很常见，每组省下 (n-1) × 4 次模型调用。
+
+去重映射写入输出目录的 duplicate_map.json：{"代表行id": ["重复行id", ...]}
+"""
+
+
+def _normalize_conversation(content):
+    text = str(content or "").strip()
+    try:
+        return json.dumps(json.loads(text), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    except Exception:
+        return text
+
+
+def unit_key(row):
+    """单行评测单元的哈希"""
+    unit = [
+        str(row.get("度量一级分类") or "").strip(),
+        str(row.get("prompt_time") or "").strip(),
+        _normalize_conversation(row.get("小Vcompletions_content")),
+        _normalize_conversation(row.get("竞品completions_content")),
+    ]
+    return hashlib.sha1(json.dumps(unit, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def group_duplicates(df):
+    """
+    返回 (去重后的 DataFrame, 重复映射)
+    每组保留第一次出现的行作为代表；重复映射为 {代表行号: [(重复行号, 重复行id), ...]}
+    """
+    first_of, duplicates = {}, {}
+    for idx, row in df.iterrows():
+        key = unit_key(row)
+        if key in first_of:
+            duplicates.setdefault(first_of[key], []).append((idx, row.get("id", idx)))
+        else:
+            first_of[key] = idx
+    if not duplicates:
+        return df, duplicates
+    representatives = set(first_of.values())
+    return df.loc[[idx for idx in df.index if idx in representatives]], duplicates
+
+
+def fan_out(record, duplicates):
+    """把代表行的结果记录复制给组内重复行"""
+    return [dict(record, idx=dup_idx, id=dup_id) for dup_idx, dup_id in duplicates]
+
+
+def write_duplicate_map(output_dir, df, duplicates, filename="duplicate_map.json"):
+    """写出 {代表行id: [重复行id, ...]}，返回文件路径"""
+    dup_map = {}
+    for rep_idx, dups in duplicates.items():
+        rep_id = df.at[rep_idx, "id"] if "id" in df.columns else rep_idx
+        dup_map[str(rep_id)] = [dup_id for _, dup_id in dups]
+    path = os.path.join(output_dir, filename)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dup_map, f, ensure_ascii=False, indent=2, default=lambda v: v.item() if hasattr(v, "item") else str(v))
+    return path
+
+
+def print_dedup_summary(total, duplicates):
+    removed = sum(len(dups) for dups in duplicates.values())
+    if removed:
+        print(f"[去重] {total} 行中有 {removed} 行与其他行的评测单元完全相同（{len(duplicates)} 组），"
+              f"只评测 {total - removed} 行，省去 {removed / total:.1%} 的模型调用")
+    else:
+        print(f"[去重] {total} 行中没有重复的评测单元")
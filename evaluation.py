@@ -11,7 +11,11 @@ from typing import List, Dict, Any, Tuple, Set
 
 from mpmath import re
 
-from utils.vivo_model import vivo_GPT
+from utils.vivo_model import vivo_GPT, call_model, stream_until_json
+from utils.response_cache import get_response_cache
+from utils.retry_policy import Outcome
+from utils.telemetry import CallResult, get_call_stats
+from utils.budget import get_budget
 
 # ========= 规则加载 =========
 def load_rules(yaml_path="config/scoring_rules4.yaml"):
@@ -510,19 +514,87 @@ def create_final_judgment_prompt(analysis_json_str: str, a_single_main_issues: s
 
 
 # ========= 模型调用 =========
-def test(prompt, model="o3", verbose=False, show_prompts=False):
+def _cached_result(model, prompt):
     """
-    调用 vivo_GPT 模型，支持超时重试机制
+    启用响应缓存时先查缓存：命中返回 cached=True 的 CallResult；
+    replay 模式下未命中返回空结果（不调用模型）；其余情况返回 None，需要真正调用模型
     """
-    result = vivo_GPT(prompt, model=model, sessionId=str(uuid.uuid4()), verbose=verbose, show_prompts=show_prompts)
-    count = 0
-    while isinstance(result, str) and "timeout" in result and count < 3:
-        time.sleep(1)
-        count += 1
-        result = vivo_GPT(prompt, model=model, sessionId=str(uuid.uuid4()), verbose=verbose, show_prompts=show_prompts)
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    cached = cache.get(model, prompt)
+    if cached is not None:
+        return CallResult(content=cached, model=model, outcome=Outcome.OK, cached=True)
+    if cache.replay:
+        return CallResult(model=model, cached=True)
+    return None
+
+
+def discard_cached_response(prompt, model="o3"):
+    """响应正文无法解析时调用：从响应缓存中删除该 prompt 的结果，下一次调用会真正请求模型"""
+    cache = get_response_cache()
+    if cache is not None:
+        cache.delete(model, prompt)
+
+
+def test_result(prompt, model="o3", verbose=False, show_prompts=False, stage=None):
+    """
+    调用模型并返回 CallResult（超时、限流等重试与退避统一由 vivo_model 处理）
+    结果按 stage 计入调用统计与预算；只有 outcome 为 OK 且正文非空时写入响应缓存
+    """
+    result = _cached_result(model, prompt)
+    if result is None:
+        result = call_model(prompt, model=model, sessionId=str(uuid.uuid4()), verbose=verbose,
+                            show_prompts=show_prompts)
+        cache = get_response_cache()
+        if cache is not None and result.outcome == Outcome.OK and result.content:
+            cache.put(model, prompt, result.content)
+    get_call_stats().record(stage, result)
+    get_budget().charge(stage, result, len(prompt))
     return result
 
 
+def test(prompt, model="o3", verbose=False, show_prompts=False, stage=None):
+    """
+    调用 vivo_GPT 模型，只返回正文
+    启用响应缓存时先查缓存；replay 模式下未命中直接返回空字符串，不调用模型
+    """
+    return test_result(prompt, model=model, verbose=verbose, show_prompts=show_prompts, stage=stage).content
+
+
+def test_stream(prompt, model="o3", verbose=False, show_prompts=False, stage=None):
+    """
+    流式调用：裁判输出的 JSON 对象一闭合就返回，不必等推理模型把流发完
+    与 test 共用响应缓存；只有拿到完整 JSON 时才写入缓存
+    """
+    result = _cached_result(model, prompt)
+    if result is None:
+        result = stream_until_json(prompt, model=model, sessionId=str(uuid.uuid4()), show_prompts=show_prompts)
+        cache = get_response_cache()
+        if cache is not None and result.outcome == Outcome.OK:
+            cache.put(model, prompt, result.content)
+    get_call_stats().record(stage, result)
+    get_budget().charge(stage, result, len(prompt))
+    return result.content
+
+
+async def async_test(prompt, model="o3", verbose=False, show_prompts=False, stage=None):
+    """
+    test 的协程版本，供异步评测流程使用
+    """
+    from utils.async_model import async_call_model
+    result = _cached_result(model, prompt)
+    if result is None:
+        result = await async_call_model(prompt, model=model, sessionId=str(uuid.uuid4()),
+                                        verbose=verbose, show_prompts=show_prompts)
+        cache = get_response_cache()
+        if cache is not None and result.outcome == Outcome.OK and result.content:
+            cache.put(model, prompt, result.content)
+    get_call_stats().record(stage, result)
+    get_budget().charge(stage, result, len(prompt))
+    return result.content
+
+
 # ========= 知识问答维度特殊处理 =========
 def evaluate_knowledge_qa_with_source_check(question: str, v_answer: str, c_answer: str,
                                           v_history: str = "", c_history: str = "",
@@ -1,15 +1,30 @@
-
 import os
 import sys
+import asyncio
 import argparse
 from evaluation import load_rules, create_reflection_prompt, test
-from processor_threaded import process_data_multithread
+from processor_threaded import DECISION_MODES, ROW_PARALLEL_STAGES, process_data_multithread
+from processor_async import process_data_async
+from row_scheduler import SCHEDULE_MODES
 # from processor import process_data
 from check_consistency import compute_consistency, add_consistency_flag_columns
 from utils.tee import Tee
 from merge_outputs import merge_thread_outputs
 import pandas as pd
 from check_consistency import compute_consistency, add_consistency_flag_columns, _normalize_columns
+from utils.http_pool import init_http_pool
+from utils.response_cache import CACHE_MODES, cache_key, init_response_cache
+from utils.stage_cache import init_stage_cache, rules_fingerprint
+from utils.hedging import get_hedger
+from utils.rate_limiter import enable_adaptive
+from utils.budget import BudgetExceeded, init_budget
+from utils.vivo_model import resolve_domain
+from planner import dry_run, print_dry_run
+from sampling import run_sampling
+from work_store import DEFAULT_LEASE_TTL, WorkStore, default_worker_id, job_name, run_coordinator, run_worker
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def format_df_to_markdown(df: pd.DataFrame) -> str:
@@ -17,8 +32,19 @@ def format_df_to_markdown(df: pd.DataFrame) -> str:
     return df.to_markdown(index=False)
 
 
-if __name__ == "__main__":
-    # ===============================
+def print_run_stats(http_pool, hedger, response_cache, stage_cache):
+    """打印连接池、对冲与缓存统计，并关闭缓存"""
+    http_pool.print_stats()
+    hedger.print_stats()
+    if response_cache is not None:
+        response_cache.print_stats()
+        response_cache.close()
+    if stage_cache is not None:
+        stage_cache.print_stats()
+        stage_cache.close()
+
+
+def build_parser():
     # 命令行参数解析
     parser = argparse.ArgumentParser(description="自动化评测系统")
     parser.add_argument("--model", default="o3",
@@ -29,81 +55,213 @@ if __name__ == "__main__":
                        help="精标数据集路径")
     parser.add_argument("--threads", type=int, default=5,
                        help="并发线程数")
+    parser.add_argument("--async-mode", action="store_true",
+                       help="使用asyncio单事件循环并发评测（需要aiohttp）")
+    parser.add_argument("--concurrency", type=int, default=200,
+                       help="异步模式下同时评测的行数上限")
     parser.add_argument("--version", default="test4",
                        help="结果目录版本标记")
+    parser.add_argument("--cache", choices=CACHE_MODES, default="rw",
+                       help="LLM响应缓存模式：off不使用 / rw读写 / replay只读回放（未命中不调用模型）")
+    parser.add_argument("--stream", action="store_true",
+                       help="多线程模式下使用流式调用，裁判输出的JSON闭合即开始解析")
+    parser.add_argument("--decision", choices=DECISION_MODES, default="llm",
+                       help="最终裁决方式：llm每行调用裁判模型 / rules_first规则能判定时跳过裁判模型")
+    parser.add_argument("--schedule", choices=SCHEDULE_MODES, default="file",
+                       help="行调度顺序：file按文件顺序 / ljf按估算成本从高到低（最长作业优先，缩短整体耗时）")
+    parser.add_argument("--no-dedup", action="store_true",
+                       help="关闭评测前的去重（默认完全相同的评测单元只评测一次，结果复制给重复行）")
+    parser.add_argument("--hedge", action="store_true",
+                       help="开启对冲请求：调用耗时超过历史分位数时再发一份请求，取先返回者")
+    parser.add_argument("--adaptive", action="store_true",
+                       help="开启自适应并发：按网关的限流/超时反馈自动调整每个模型的在途请求上限（上界为 max_inflight）")
+    parser.add_argument("--max-tokens", type=int, default=None,
+                       help="本次评测的 token 硬上限，达到后不再调度新行，重新运行即可续跑")
+    parser.add_argument("--max-calls", type=int, default=None,
+                       help="本次评测的模型调用次数硬上限")
+    parser.add_argument("--max-cost", type=float, default=None,
+                       help="本次评测的费用硬上限（按 config 中模型的 price 计算）")
+    parser.add_argument("--role", choices=("local", "coordinator", "worker"), default="local",
+                       help="分片评测角色：local单进程 / coordinator建立任务并汇总 / worker从共享任务库租用行评测")
+    parser.add_argument("--work-store",
+                       help="共享任务库路径（各 worker 可访问的共享目录），默认位于结果目录下的 work_store.sqlite")
+    parser.add_argument("--worker-id", default=None,
+                       help="worker 标识，默认 主机名-进程号")
+    parser.add_argument("--lease-ttl", type=float, default=DEFAULT_LEASE_TTL,
+                       help="行租约时长（秒），worker 失联超过该时长后其租用的行会被重新评测")
+    parser.add_argument("--dry-run", action="store_true",
+                       help="干跑：不调用模型，构建全部 prompt 并报告各阶段调用次数、prompt 长度分布、缓存命中与预计耗时")
+    parser.add_argument("--call-latency", type=float, default=None,
+                       help="干跑估算耗时使用的单次调用耗时（秒），默认取上次评测的平均耗时")
+    parser.add_argument("--sample", action="store_true",
+                       help="分层抽样评测：按度量一级分类分层逐轮抽样，人机一致率的置信区间足够窄后停止（只需要一致率时使用）")
+    parser.add_argument("--ci-width", type=float, default=0.1,
+                       help="抽样评测的目标置信区间宽度（95%%置信水平），各层合格率/满意率/胜出率的区间都不超过该宽度时停止")
+    parser.add_argument("--sample-initial", type=int, default=30,
+                       help="抽样评测每层首轮抽取的行数")
+    parser.add_argument("--max-rounds", type=int, default=8,
+                       help="抽样评测的最大轮数")
+    parser.add_argument("--sample-seed", type=int, default=0,
+                       help="抽样随机种子，相同参数重新运行会复现同样的抽样并续跑")
     parser.add_argument("--verbose", action="store_true",
                        help="启用详细日志输出")
     parser.add_argument("--show-prompts", action="store_true",
                        help="显示完整的prompt内容")
-    args = parser.parse_args()
+    return parser
 
-    # ===============================
-    # 总开关，控制是否打印详细日志
-    VERBOSE_MODE = args.verbose  # 设置为 False 来关闭详细Prompt打印，需要调试时改为 True
-    SHOW_PROMPTS = args.show_prompts  # 控制是否显示完整的prompt内容
-    # ===============================
-    model_name = args.model  # 可选：gpt_4o/deepseek-r1/豆包1.5_pro/o3/gemini-2.5-pro/Doubao-1.6-agent-pro等
-    dataset = args.dataset  # 数据集文件名
-    golden_dataset_path = args.golden
-    thread_num = args.threads  # 并发线程数
-    version = args.version  # 结果目录版本标记
-    # ==============================
 
-    # 输出文件的路径规划
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(current_dir, "Datesets", dataset)
-    output_dir = os.path.join(current_dir, "Results", version,
+def resolve_paths(dataset, model_name, version):
+    """
+    输出文件的路径规划
+    返回 (数据集路径, 结果目录, 多线程子结果目录, 最终结果文件)
+    """
+    file_path = os.path.join(CURRENT_DIR, "Datesets", dataset)
+    output_dir = os.path.join(CURRENT_DIR, "Results", version,
                               os.path.basename(file_path).replace(".xlsx", f"_{model_name}"))
     output_dir_mutithread = os.path.join(output_dir, "multithread")
     final_output_file = os.path.join(output_dir,
                                      f"{os.path.basename(file_path).replace('.xlsx', '')}_{model_name}Eval.xlsx")
+    return file_path, output_dir, output_dir_mutithread, final_output_file
 
-    # 【说明】确保我们导入了正确的函数
-    # from check_consistency import compute_consistency, add_consistency_flag_columns
 
-    rules = load_rules()
+def init_runtime(model_names, pool_size, cache_mode="rw", hedge=False, adaptive=False):
+    """
+    初始化进程级共享资源：连接池（并提前建立到各评测模型网关的连接）、响应缓存、阶段缓存、对冲与自适应并发
+    返回 (http_pool, hedger, response_cache, stage_cache)
+    """
+    http_pool = init_http_pool(pool_size=pool_size)
+    http_pool.warm_up(sorted({resolve_domain(m) for m in model_names}))
+    response_cache = init_response_cache(cache_mode)
+    # 阶段缓存与响应缓存共用模式：跨数据集版本复用对话未变一侧的单模型打标结果
+    stage_cache = init_stage_cache(cache_mode)
+    hedger = get_hedger()
+    if hedge:
+        hedger.enabled = True
+    if adaptive:
+        enable_adaptive()
+    return http_pool, hedger, response_cache, stage_cache
 
-    # =================== 反思学习阶段 ===================
+
+def build_reflection_prompt(rules, golden_dataset_path):
+    """由精标数据集构建反思学习的 prompt；数据集不存在时抛出 FileNotFoundError"""
+    golden_df = pd.read_excel(os.path.join(CURRENT_DIR, golden_dataset_path))
+    key_columns = [
+        "prompt_content", "小Vcompletions_content", "竞品completions_content",
+        "标注员_小v主要问题", "标注员_竞品主要问题", "标注员_小v竞品对比",
+        "LLMs_自研主要问题", "LLMs_竞品主要问题", "LLMs_自研竞品对比"
+    ]
+    key_columns_exist = [col for col in key_columns if col in golden_df.columns]
+    golden_samples_df = golden_df[key_columns_exist].head(9)
+    golden_samples_str = format_df_to_markdown(golden_samples_df)
+    return create_reflection_prompt(golden_samples_str, rules)
+
+
+def learn_guidelines(rules, model_name, golden_dataset_path, verbose=False, show_prompts=False):
+    """
+    反思学习阶段：让裁判模型学习精标数据并生成评测指南；失败时返回 "无"
+    """
     print("--- 阶段零：LLM反思学习阶段 ---")
     try:
-        golden_df = pd.read_excel(os.path.join(current_dir, golden_dataset_path))
-        key_columns = [
-            "prompt_content", "小Vcompletions_content", "竞品completions_content",
-            "标注员_小v主要问题", "标注员_竞品主要问题", "标注员_小v竞品对比",
-            "LLMs_自研主要问题", "LLMs_竞品主要问题", "LLMs_自研竞品对比"
-        ]
-        key_columns_exist = [col for col in key_columns if col in golden_df.columns]
-        golden_samples_df = golden_df[key_columns_exist].head(9)
-        golden_samples_str = format_df_to_markdown(golden_samples_df)
-        reflection_prompt = create_reflection_prompt(golden_samples_str, rules)
+        reflection_prompt = build_reflection_prompt(rules, golden_dataset_path)
 
         print("正在请求LLM学习精标数据并生成评测指南...")
-        learned_guidelines = test(reflection_prompt, model=model_name, verbose=VERBOSE_MODE, show_prompts=SHOW_PROMPTS)
+        learned_guidelines = test(reflection_prompt, model=model_name, verbose=verbose, show_prompts=show_prompts,
+                                  stage="reflection")
         print("LLM学习完成，生成的评测指南如下：\n", learned_guidelines)
-
-        rules['learned_guidelines'] = learned_guidelines
     except FileNotFoundError:
         print(f"[警告] 未找到精标数据集: {golden_dataset_path}。将跳过学习阶段。")
-        rules['learned_guidelines'] = "无"
+        learned_guidelines = "无"
     except Exception as e:
         print(f"[错误] LLM学习阶段失败: {e}。将跳过学习阶段。")
-        rules['learned_guidelines'] = "无"
+        learned_guidelines = "无"
     print("------------------------------------\n")
+    return learned_guidelines
 
-    # =================== 评测执行与合并 ===================
-    print(f"--- 阶段一：开始对 {dataset} 进行多线程评测 ---")
-    process_data_multithread(
-        file_path,
-        output_dir_mutithread,
-        model_name=model_name,
-        rules=rules,
-        thread_num=thread_num,
-        verbose=VERBOSE_MODE,
-        show_prompts=SHOW_PROMPTS
-    )
-    print("\n--- 阶段二：合并多线程结果文件 ---")
-    merge_thread_outputs(output_dir_mutithread, model_name, final_output_file)
-    print(f"✅ 多线程结果已合并至: {final_output_file}")
+
+def plan_dry_run(file_path, output_dir_mutithread, model_name, rules, golden_dataset_path, thread_num=5,
+                 cache_mode="rw", dedup=True, call_latency=None):
+    """
+    干跑：不初始化连接池、不调用模型；缓存只读打开，反思学习的指南取自响应缓存（未命中时按 "无" 构建 prompt）
+    """
+    print("--- 干跑：构建全部 prompt，不调用模型 ---")
+    response_cache = init_response_cache("off" if cache_mode == "off" else "replay")
+    stage_cache = init_stage_cache("off" if cache_mode == "off" else "replay")
+
+    fingerprint, reflection_calls = None, 1
+    try:
+        reflection_prompt = build_reflection_prompt(rules, golden_dataset_path)
+        cached = response_cache.get_by_key(cache_key(model_name, reflection_prompt)) if response_cache else None
+        if cached is not None:
+            # 反思结果已缓存：指南与真实评测一致，可以按当前规则指纹预估阶段缓存复用
+            rules['learned_guidelines'] = cached
+            fingerprint, reflection_calls = rules_fingerprint(rules), 0
+            print("[干跑] 反思学习的指南取自响应缓存")
+        else:
+            rules['learned_guidelines'] = "无"
+            print("[干跑] 响应缓存中没有反思学习结果，按指南 \"无\" 构建 prompt（真实评测会多 1 次反思调用）")
+    except FileNotFoundError:
+        rules['learned_guidelines'] = "无"
+        reflection_calls = 0
+        print(f"[警告] 未找到精标数据集: {golden_dataset_path}。真实评测将跳过学习阶段。")
+
+    plan = dry_run(file_path, model_name, rules, threads=thread_num, call_latency=call_latency,
+                   output_dir=output_dir_mutithread, fingerprint=fingerprint, dedup=dedup,
+                   response_cache=response_cache, stage_cache=stage_cache)
+    print_dry_run(plan)
+    if reflection_calls:
+        print(f"[干跑] 另需反思学习调用 {reflection_calls} 次")
+    for cache in (response_cache, stage_cache):
+        if cache is not None:
+            cache.close()
+    return plan
+
+
+def evaluate_dataset(file_path, output_dir_mutithread, model_name, rules, thread_num=5, async_mode=False,
+                     concurrency=200, verbose=False, show_prompts=False, stream=False, decision="llm",
+                     schedule="file", dedup=True, on_progress=None, budget=None):
+    """阶段一：单进程评测（多线程或异步），子结果写入 output_dir_mutithread；budget 为本次评测的预算"""
+    dataset = os.path.basename(file_path)
+    if async_mode:
+        print(f"--- 阶段一：开始对 {dataset} 进行异步评测（并发 {concurrency}）---")
+        asyncio.run(process_data_async(
+            file_path,
+            output_dir_mutithread,
+            model_name=model_name,
+            rules=rules,
+            concurrency=concurrency,
+            verbose=verbose,
+            show_prompts=show_prompts,
+            decision=decision,
+            schedule=schedule,
+            dedup=dedup,
+            on_progress=on_progress,
+            budget=budget
+        ))
+    else:
+        print(f"--- 阶段一：开始对 {dataset} 进行多线程评测 ---")
+        process_data_multithread(
+            file_path,
+            output_dir_mutithread,
+            model_name=model_name,
+            rules=rules,
+            thread_num=thread_num,
+            verbose=verbose,
+            show_prompts=show_prompts,
+            stream=stream,
+            decision=decision,
+            schedule=schedule,
+            dedup=dedup,
+            on_progress=on_progress,
+            budget=budget
+        )
+
+
+def finalize_outputs(output_dir_mutithread, model_name, final_output_file, merge=True):
+    """阶段二至四：合并子结果、添加人机一致标记列、一致性统计；merge 为 False 时 final_output_file 已合并好"""
+    if merge:
+        print("\n--- 阶段二：合并多线程结果文件 ---")
+        merge_thread_outputs(output_dir_mutithread, model_name, final_output_file)
+        print(f"✅ 多线程结果已合并至: {final_output_file}")
 
     # =================== 后处理：添加标记列 ===================
     print("\n--- 阶段三：为最终结果文件添加'人机一致'标记列 ---")
@@ -143,4 +301,105 @@ if __name__ == "__main__":
         print(f"[严重错误] 执行最终一致性分析时失败: {e}")
         import traceback
 
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.sample and args.role != "local":
+        parser.error("--sample 只支持单进程评测（--role local）")
+
+    # ===============================
+    # 总开关，控制是否打印详细日志
+    VERBOSE_MODE = args.verbose  # 设置为 False 来关闭详细Prompt打印，需要调试时改为 True
+    SHOW_PROMPTS = args.show_prompts  # 控制是否显示完整的prompt内容
+    # ===============================
+    model_name = args.model  # 可选：gpt_4o/deepseek-r1/豆包1.5_pro/o3/gemini-2.5-pro/Doubao-1.6-agent-pro等
+    dataset = args.dataset  # 数据集文件名
+    golden_dataset_path = args.golden
+    thread_num = args.threads  # 并发线程数
+    version = args.version  # 结果目录版本标记
+    # ==============================
+
+    file_path, output_dir, output_dir_mutithread, final_output_file = resolve_paths(dataset, model_name, version)
+
+    rules = load_rules()
+
+    if args.dry_run:
+        plan_dry_run(file_path, output_dir_mutithread, model_name, rules, golden_dataset_path,
+                     thread_num=args.concurrency if args.async_mode else thread_num,
+                     cache_mode=args.cache, dedup=not args.no_dedup, call_latency=args.call_latency)
+        return
+
+    # 按并发线程数（每行最多 ROW_PARALLEL_STAGES 个阶段同时在途）初始化共享连接池
+    http_pool, hedger, response_cache, stage_cache = init_runtime(
+        [model_name], thread_num * ROW_PARALLEL_STAGES, args.cache, hedge=args.hedge, adaptive=args.adaptive
+    )
+    # 预算：配置文件中的软/硬上限，命令行给出的整体硬上限优先
+    budget = init_budget(args.max_tokens, args.max_calls, args.max_cost)
+    work_store_path = args.work_store or os.path.join(output_dir, "work_store.sqlite")
+    job = job_name(version, file_path, model_name)
+
+    # =================== 分片评测：worker 只负责评测 ===================
+    # 反思学习、合并与一致性分析由 coordinator 完成，worker 使用 coordinator 写入任务库的 rules
+    if args.role == "worker":
+        store = WorkStore(work_store_path)
+        run_worker(store, job, file_path, output_dir_mutithread, model_name, thread_num=thread_num,
+                   worker_id=args.worker_id or default_worker_id(), lease_ttl=args.lease_ttl,
+                   verbose=VERBOSE_MODE, show_prompts=SHOW_PROMPTS, stream=args.stream, decision=args.decision,
+                   budget=budget)
+        store.close()
+        print_run_stats(http_pool, hedger, response_cache, stage_cache)
+        return
+
+    # =================== 反思学习阶段 ===================
+    rules['learned_guidelines'] = learn_guidelines(rules, model_name, golden_dataset_path,
+                                                   verbose=VERBOSE_MODE, show_prompts=SHOW_PROMPTS)
+
+    # =================== 评测执行与合并 ===================
+    if args.sample:
+        print(f"--- 阶段一：对 {dataset} 进行分层抽样评测 ---")
+
+        def evaluate_round(round_file, sampling_dir):
+            evaluate_dataset(round_file, sampling_dir, model_name, rules, thread_num=thread_num,
+                             async_mode=args.async_mode, concurrency=args.concurrency, verbose=VERBOSE_MODE,
+                             show_prompts=SHOW_PROMPTS, stream=args.stream, decision=args.decision,
+                             schedule=args.schedule, dedup=not args.no_dedup, budget=budget)
+
+        try:
+            final_sample_file, _ = run_sampling(file_path, output_dir, model_name, evaluate_round,
+                                                width=args.ci_width, initial=args.sample_initial,
+                                                max_rounds=args.max_rounds, seed=args.sample_seed)
+        except BudgetExceeded as e:
+            print(f"[预算] 抽样评测已停止：{e}")
+            print_run_stats(http_pool, hedger, response_cache, stage_cache)
+            sys.exit(2)
+        finalize_outputs(None, model_name, final_sample_file, merge=False)
+        print_run_stats(http_pool, hedger, response_cache, stage_cache)
+        return
+
+    if args.role == "coordinator":
+        print(f"--- 阶段一：建立 {dataset} 的分片评测任务，等待 worker 完成 ---")
+        store = WorkStore(work_store_path)
+        run_coordinator(store, job, file_path, output_dir_mutithread, model_name, rules,
+                        schedule=args.schedule, dedup=not args.no_dedup, budget=budget)
+        store.close()
+    else:
+        try:
+            evaluate_dataset(file_path, output_dir_mutithread, model_name, rules, thread_num=thread_num,
+                             async_mode=args.async_mode, concurrency=args.concurrency, verbose=VERBOSE_MODE,
+                             show_prompts=SHOW_PROMPTS, stream=args.stream, decision=args.decision,
+                             schedule=args.schedule, dedup=not args.no_dedup, budget=budget)
+        except BudgetExceeded as e:
+            # 结果不完整，跳过合并与一致性分析
+            print(f"[预算] 评测已停止：{e}")
+            print_run_stats(http_pool, hedger, response_cache, stage_cache)
+            sys.exit(2)
+    finalize_outputs(output_dir_mutithread, model_name, final_output_file)
+
+    print_run_stats(http_pool, hedger, response_cache, stage_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@
 import os
 import pandas as pd
 
+from output_writer import result_name
+
 def merge_thread_outputs(output_dir, model_name, final_output_file):
     part_files = [
         os.path.join(output_dir, f)
@@ -9,6 +11,13 @@ def merge_thread_outputs(output_dir, model_name, final_output_file):
         if f.endswith(".xlsx") and f"{model_name}_part" in f
     ]
     part_files.sort()  # 确保顺序一致
+    # 当前的评测流程只写一份结果文件（见 result_name）；旧流程留下的 _part_N / _part_async 文件与它重复，不再合并
+    current = [f for f in part_files if f.endswith(f"_{result_name(model_name)}Eval.xlsx")]
+    if current:
+        stale = [f for f in part_files if f not in current]
+        if stale:
+            print(f"忽略 {len(stale)} 个旧的子结果文件：{', '.join(os.path.basename(f) for f in stale)}")
+        part_files = current
 
     dfs = []
     for file in part_files:
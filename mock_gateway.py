@@ -0,0 +1,356 @@
+"""
+本地模拟网关：不消耗真实额度地压测并发、重试与吞吐，也可用于离线跑通整条评测流程
+核心：
+  • 与真实网关相同的接口：POST {uri}（同步）与 POST {uri}/stream（SSE 流式），校验 gen_sign_headers 签名头
+  • 按 prompt 形态（单模打标 / SBS 对比分析 / 最终裁决 / 反思总结）返回格式正确的模拟 JSON，
+    或用 --replay 从响应缓存（Results/llm_cache.sqlite）回放录制过的真实响应，未命中时退回模拟响应
+  • 可配置的故障注入：对数正态延迟 + 长尾、429（带 Retry-After）、超时（挂起后断开连接）、5xx、
+    超出上下文长度、正文 JSON 截断；--capacity 模拟网关容量，在途请求超过上限时直接 429
+  • 退出（Ctrl+C）时打印按形态 / 故障类型的请求统计
+
+用法：
+  python mock_gateway.py --port 18080 --latency 0.8 --jitter 0.5 --rate-429 0.05 --rate-malformed 0.02
+  然后把 config/model.yaml 中 application.domain（或模型的 domain）改为 127.0.0.1:18080 运行 main.py
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from config.config import APP_ID, APP_KEY, URI
+from utils.auth_util import verify_sign_headers
+from utils.response_cache import ResponseCache, request_key
+
+# prompt 形态判定用的标志文本（与 evaluation.py 中各 prompt 模板的输出格式对应，按顺序匹配：
+# 最终裁决的 prompt 内嵌了 SBS 分析结果，必须先于 SBS 分析判断）
+SHAPE_MARKERS = [
+    ("final_judgment", "大模型A竞品对比"),
+    ("sbs_analysis", "大模型A_命中的失败触发器"),
+    ("single", "优质弱智主要问题"),
+    ("reflection", "评测元分析师"),
+]
+
+# 模拟标签及权重：大部分回答无问题，少量命中各类问题
+ISSUE_LABELS = [
+    ("13无问题", 6),
+    ("4冗长_1. 篇幅过长", 1),
+    ("5简略_2. 拓展过少", 1),
+    ("2内容质量差_1.内容错误", 1),
+    ("1未提供需要信息_1.回答不相关", 1),
+    ("6语言表达不佳_1.AI感强", 1),
+]
+VERDICTS = [("胜", 3), ("平", 4), ("负", 3)]
+
+REFLECTION_TEXT = ("我是一名经验丰富的互联网标注员，在快速评估大量数据时，我会遵循以下务实、高效的评判原则：\n"
+                   "1.  优先关注核心任务完成度。\n2.  两个回答大差不差时判定为平。")
+
+
+def classify_prompt(prompt: str) -> str:
+    for shape, marker in SHAPE_MARKERS:
+        if marker in prompt:
+            return shape
+    return "other"
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+
+class MockGateway:
+    """模拟网关服务；start() 在后台线程运行（便于在压测脚本中内嵌），serve_forever() 前台运行"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 18080, uri: str = URI,
+                 app_id: str = APP_ID, app_key: str = APP_KEY, verify_sign: bool = True,
+                 latency: float = 0.5, jitter: float = 0.0, tail_rate: float = 0.0, tail_latency: float = 30.0,
+                 rate_429: float = 0.0, retry_after: float = 1.0, rate_timeout: float = 0.0,
+                 timeout_seconds: float = 30.0, rate_5xx: float = 0.0, rate_context: float = 0.0,
+                 rate_malformed: float = 0.0, capacity: int = 0, stream_chunk: int = 8,
+                 stream_interval: float = 0.02, replay: Optional[str] = None, seed: Optional[int] = None):
+        self.uri = uri
+        self.app_id = app_id
+        self.app_key = app_key
+        self.verify_sign = verify_sign
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rate_timeout = rate_timeout
+        self.timeout_seconds = timeout_seconds
+        self.rate_5xx = rate_5xx
+        self.rate_context = rate_context
+        self.rate_malformed = rate_malformed
+        self.capacity = capacity
+        self.stream_chunk = max(1, stream_chunk)
+        self.stream_interval = stream_interval
+        self.recorded = ResponseCache(replay, mode="replay") if replay else None
+
+        self.stats = Counter()
+        self.inflight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    # ------------------------- 随机量 -------------------------
+    def _random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _choice(self, weighted) -> str:
+        with self._lock:
+            return self._rng.choices([v for v, _ in weighted], weights=[w for _, w in weighted])[0]
+
+    def sample_latency(self) -> float:
+        """对数正态延迟（中位数 latency，形状 jitter），按 tail_rate 概率额外出现长尾"""
+        with self._lock:
+            value = self.latency * math.exp(self._rng.gauss(0, self.jitter)) if self.jitter else self.latency
+            if self.tail_rate and self._rng.random() < self.tail_rate:
+                value += self.tail_latency
+        return max(0.0, value)
+
+    def pick_fault(self) -> Optional[str]:
+        roll = self._random()
+        for fault, rate in (("rate_limit", self.rate_429), ("timeout", self.rate_timeout),
+                            ("server_error", self.rate_5xx), ("context_length", self.rate_context),
+                            ("malformed", self.rate_malformed)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def count(self, *keys: str):
+        with self._lock:
+            self.stats.update(keys)
+
+    # ------------------------- 响应正文 -------------------------
+    def canned_content(self, shape: str) -> str:
+        if shape == "single":
+            issue = self._choice(ISSUE_LABELS)
+            return json.dumps({"主要问题": issue, "优质弱智主要问题": "",
+                               "标注理由": f"模拟网关：{issue}"}, ensure_ascii=False)
+        if shape == "sbs_analysis":
+            return json.dumps({
+                "大模型A_SBS主要问题": self._choice(ISSUE_LABELS),
+                "大模型B_SBS主要问题": self._choice(ISSUE_LABELS),
+                "大模型A_命中的失败触发器": [],
+                "大模型B_命中的失败触发器": [],
+                "大模型A_符合的胜利模式": [],
+                "大模型B_符合的胜利模式": [],
+            }, ensure_ascii=False)
+        if shape == "final_judgment":
+            verdict = self._choice(VERDICTS)
+            return json.dumps({"大模型A竞品对比": verdict, "裁判说明": f"模拟网关裁决：{verdict}"},
+                              ensure_ascii=False)
+        if shape == "reflection":
+            return REFLECTION_TEXT
+        return "模拟网关已收到请求"
+
+    def content_for(self, data: dict, shape: str) -> str:
+        if self.recorded is not None:
+            key = request_key(data.get("model"), data.get("provider"), data.get("extra"), data.get("prompt", ""))
+            content = self.recorded.get_by_key(key)
+            if content is not None:
+                self.count("replay_hit")
+                return content
+            self.count("replay_miss")
+        return self.canned_content(shape)
+
+    # ------------------------- HTTP -------------------------
+    def _handler_class(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                # http_pool.warm_up 只需建立连接
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                gateway.handle(self)
+
+        return Handler
+
+    def _send_json(self, handler, status: int, body: dict, headers: Optional[dict] = None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            handler.send_header(k, v)
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def handle(self, handler):
+        parts = urlsplit(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw = handler.rfile.read(length) if length else b""
+        if parts.path not in (self.uri, self.uri + "/stream"):
+            self.count("not_found")
+            self._send_json(handler, 404, {"code": 404, "msg": f"unknown path {parts.path}"})
+            return
+        stream = parts.path.endswith("/stream")
+
+        if self.verify_sign:
+            query = dict(parse_qsl(parts.query, keep_blank_values=True))
+            ok, reason = verify_sign_headers(self.app_id, self.app_key, "POST", parts.path, query, handler.headers)
+            if not ok:
+                self.count("auth_failed")
+                self._send_json(handler, 401, {"code": 1001, "msg": f"签名校验失败: {reason}"})
+                return
+        try:
+            data = json.loads(raw.decode("utf-8"))
+            prompt = data["prompt"]
+        except (ValueError, KeyError, TypeError):
+            self.count("bad_request")
+            self._send_json(handler, 400, {"code": 400, "msg": "请求体不是合法 JSON 或缺少 prompt"})
+            return
+
+        with self._lock:
+            self.inflight += 1
+            self.stats["max_inflight"] = max(self.stats["max_inflight"], self.inflight)
+            over_capacity = self.capacity and self.inflight > self.capacity
+        try:
+            shape = classify_prompt(prompt)
+            self.count("requests", f"shape:{shape}", "stream" if stream else "sync")
+            fault = "rate_limit" if over_capacity else self.pick_fault()
+            if fault:
+                self.count(f"fault:{fault}")
+            self._respond(handler, data, shape, fault, stream)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def _respond(self, handler, data: dict, shape: str, fault: Optional[str], stream: bool):
+        if fault == "rate_limit":
+            self._send_json(handler, 429, {"code": 429, "msg": "429 Too Many Requests: hit model rate limit"},
+                            {"Retry-After": f"{self.retry_after:g}"})
+            return
+        time.sleep(self.sample_latency())
+        if fault == "timeout":
+            # 挂起后不返回任何响应直接断开，客户端表现为读超时 / 连接中断
+            time.sleep(self.timeout_seconds)
+            handler.close_connection = True
+            return
+        if fault == "server_error":
+            self._send_json(handler, 502, {"code": 502, "msg": "InternalServerError: upstream unavailable"})
+            return
+        if fault == "context_length":
+            self._send_json(handler, 200, {"code": 400, "msg": "context_length_exceeded", "data": None})
+            return
+
+        content = self.content_for(data, shape)
+        if fault == "malformed":
+            content = content[:max(1, len(content) // 2)]
+        usage = {"promptTokens": _estimate_tokens(data["prompt"]), "completionTokens": _estimate_tokens(content)}
+        usage["totalTokens"] = usage["promptTokens"] + usage["completionTokens"]
+        if stream:
+            self._stream(handler, content, usage)
+        else:
+            self._send_json(handler, 200, {"code": 0, "msg": "success", "data": {"content": content, "usage": usage}})
+
+    def _stream(self, handler, content: str, usage: dict):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+        try:
+            for i in range(0, len(content), self.stream_chunk):
+                event = {"code": 0, "data": {"content": content[i:i + self.stream_chunk]}}
+                handler.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                handler.wfile.flush()
+                if self.stream_interval:
+                    time.sleep(self.stream_interval)
+            final = {"code": 0, "data": {"content": "", "usage": usage}}
+            handler.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端拿到完整 JSON 后提前关闭了流（stream_until_json）
+            self.count("stream_cancelled")
+
+    # ------------------------- 运行 -------------------------
+    @property
+    def address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> "MockGateway":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="mock-gateway")
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.recorded is not None:
+            self.recorded.close()
+
+    def print_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        print(f"[模拟网关] 请求 {stats.pop('requests', 0)} 次，最大在途 {stats.pop('max_inflight', 0)}")
+        for key in sorted(stats):
+            print(f"  {key}: {stats[key]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟模型网关（压测 / 离线运行）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--no-verify-sign", action="store_true", help="不校验签名头")
+    parser.add_argument("--latency", type=float, default=0.5, help="延迟中位数（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="对数正态延迟的形状参数 sigma，0 为固定延迟")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="长尾请求比例")
+    parser.add_argument("--tail-latency", type=float, default=30.0, help="长尾请求额外延迟（秒）")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应中的 Retry-After（秒）")
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="挂起后断开连接的比例")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0, help="超时故障的挂起时长（秒）")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="返回 502 的比例")
+    parser.add_argument("--rate-context", type=float, default=0.0, help="返回超出上下文长度错误的比例")
+    parser.add_argument("--rate-malformed", type=float, default=0.0, help="正文 JSON 被截断的比例")
+    parser.add_argument("--capacity", type=int, default=0, help="在途请求上限，超过即 429；0 为不限")
+    parser.add_argument("--stream-chunk", type=int, default=8, help="流式响应每个事件的字符数")
+    parser.add_argument("--stream-interval", type=float, default=0.02, help="流式事件间隔（秒）")
+    parser.add_argument("--replay", default=None, help="从该响应缓存文件回放录制的真实响应")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    gateway = MockGateway(
+        host=args.host, port=args.port, verify_sign=not args.no_verify_sign,
+        latency=args.latency, jitter=args.jitter, tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+        rate_429=args.rate_429, retry_after=args.retry_after, rate_timeout=args.rate_timeout,
+        timeout_seconds=args.timeout_seconds, rate_5xx=args.rate_5xx, rate_context=args.rate_context,
+        rate_malformed=args.rate_malformed, capacity=args.capacity, stream_chunk=args.stream_chunk,
+        stream_interval=args.stream_interval, replay=args.replay, seed=args.seed,
+    )
+    print(f"[模拟网关] 监听 http://{gateway.address}{gateway.uri}（流式 {gateway.uri}/stream）")
+    try:
+        gateway.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.stop()
+        gateway.print_stats()
+
+
+if __name__ == "__main__":
+    main()
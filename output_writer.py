@@ -4,6 +4,14 @@ import pandas as pd
     输出写入逻辑（Excel / 中间文件）
 """
 
+def result_name(model_name):
+    """
+    单机评测（多线程 / 异步）与分片评测共用的结果文件标记：同一数据集只写这一份结果文件与结果日志，
+    切换评测流程也能续跑，merge_thread_outputs 只合并这一份
+    """
+    return f"{model_name}_part_all"
+
+
 def initialize_output(file_path, output_dir, model_name, df):
     """
     初始化输出 DataFrame 和相关路径
@@ -32,6 +40,8 @@ def initialize_output(file_path, output_dir, model_name, df):
 
     if os.path.exists(output_file_path):
         out_df = pd.read_excel(output_file_path)
+        # 续跑时结果列可能被读成数值列，日志中的结果以字符串写回
+        out_df = out_df.astype({col: object for col in out_df.columns if str(col).startswith("LLMs_")})
     else:
         out_df = df.copy()
         for col in [
@@ -55,7 +65,8 @@ def initialize_output(file_path, output_dir, model_name, df):
             "LLMs_B_失败触发器",
             "LLMs_A_胜利模式",
             "LLMs_B_胜利模式",
-            "LLMs_裁判分析报告"
+            "LLMs_裁判分析报告",
+            "LLMs_裁决路径"
         ]:
             if col not in out_df.columns:
                 out_df[col] = ""
@@ -110,6 +121,7 @@ def write_output_row(out_df, idx, result_json):
     out_df.at[idx, "LLMs_A_胜利模式"] = str(result_json.get("大模型A_符合的胜利模式", ""))
     out_df.at[idx, "LLMs_B_胜利模式"] = str(result_json.get("大模型B_符合的胜利模式", ""))
     out_df.at[idx, "LLMs_裁判分析报告"] = result_json.get("裁判分析报告", "").strip()
+    out_df.at[idx, "LLMs_裁决路径"] = result_json.get("LLMs_裁决路径", "").strip()
 
     # 理由补充
     out_df.at[idx, "LLMs_标注理由"] = result_json.get("LLMs_标注理由", "").strip()
@@ -0,0 +1,208 @@
+import os
+import json
+import math
+import argparse
+import pandas as pd
+
+from config.config import config
+from dedup import group_duplicates
+from evaluation import create_final_judgment_prompt, create_sbs_analysis_prompt, create_single_model_prompt
+from output_writer import result_name
+from processor_threaded import _parse_row
+from result_journal import dataset_fingerprint, journal_path_for, pending_rows, read_journal
+from utils.budget import CHARS_PER_TOKEN
+from utils.rate_limiter import _limit_config
+from utils.stage_cache import SINGLE_STAGES, init_stage_cache, single_stage_key
+
+"""
+评测计划：不调用模型，预估一份数据集实际需要的模型调用次数
+依次扣除：续跑日志中已完成的行 → 无法评测（会被剔除）的行 → 重复的评测单元（见 dedup）
+       → 阶段缓存中对话未变、可直接复用的单模型打标（见 utils/stage_cache）
+规则指纹默认取该裁判模型最近一次评测记录的指纹（含反思阶段生成的指南），也可用 --fingerprint 指定。
+rules_first 裁决模式下部分行不调用最终裁判，final_judgment 给出的是上限。
+
+dry_run（main.py --dry-run）在此基础上构建每一行的全部 prompt（最终裁决使用占位的分析结果），
+统计各维度、各阶段的 prompt 长度分布、响应缓存命中预估，并按并发数与限流估算整体耗时。
+
+用法：python planner.py --dataset Datesets/test4.xlsx --model o3 [--output-dir Results/test4/test4_o3/multithread]
+"""
+
+# 每行的模型调用阶段
+ROW_STAGES = ("single_a", "single_b", "sbs_analysis", "final_judgment")
+
+# 干跑时最终裁决使用的占位分析结果（真实分析结果长度与之相近）
+PLACEHOLDER_ANALYSIS = {
+    "大模型A_SBS主要问题": "13无问题",
+    "大模型B_SBS主要问题": "13无问题",
+    "大模型A_命中的失败触发器": [],
+    "大模型B_命中的失败触发器": [],
+    "大模型A_符合的胜利模式": [],
+    "大模型B_符合的胜利模式": [],
+}
+
+# 没有历史调用统计时假设的单次调用耗时（秒）
+DEFAULT_CALL_LATENCY = 20.0
+
+
+def _plan(file_path, model_name, output_dir=None, name=None, fingerprint=None, dedup=True, stage_cache=None):
+    """返回 (计划字典, 需要评测的行 {行号: _parse_row 的解析结果}, 各行可复用的单模型阶段 {行号: set})"""
+    df = pd.read_excel(file_path)
+    if "id" not in df.columns:
+        df.insert(0, "id", range(len(df)))
+    plan = {"dataset": file_path, "model": model_name, "rows": len(df)}
+
+    # 续跑：与 processor_threaded 的输出文件命名一致
+    todo_df, plan["resumed"] = df, 0
+    if output_dir:
+        name = name or result_name(model_name)
+        output_file_path = os.path.join(output_dir, os.path.basename(file_path).replace(".xlsx", f"_{name}Eval.xlsx"))
+        journal = read_journal(journal_path_for(output_file_path), dataset_fingerprint(df))
+        todo_df, plan["resumed"] = pending_rows(df, journal)
+
+    parsed_rows = {}
+    for idx, row in todo_df.iterrows():
+        parsed, _ = _parse_row(row)
+        if parsed is not None:
+            parsed_rows[idx] = parsed
+    plan["dropped"] = len(todo_df) - len(parsed_rows)
+    todo_df = todo_df.loc[list(parsed_rows)]
+
+    plan["duplicates"] = 0
+    if dedup:
+        todo_df, duplicates = group_duplicates(todo_df)
+        plan["duplicates"] = sum(len(dups) for dups in duplicates.values())
+    units = {idx: parsed_rows[idx] for idx in todo_df.index}
+    plan["evaluate"] = len(units)
+
+    plan["fingerprint"] = fingerprint or (stage_cache.latest_fingerprint(model_name) if stage_cache else None)
+    reused = dict.fromkeys(SINGLE_STAGES, 0)
+    reusable = {}
+    if stage_cache is not None and plan["fingerprint"]:
+        for idx, (dimension, run_time, v_history, c_history, v_resp, c_resp) in units.items():
+            for stage, history, resp in (("single_a", v_history, v_resp), ("single_b", c_history, c_resp)):
+                key = single_stage_key(model_name, plan["fingerprint"], dimension, run_time, history, resp)
+                if stage_cache.contains(key):
+                    reused[stage] += 1
+                    reusable.setdefault(idx, set()).add(stage)
+    plan["reused"] = reused
+    plan["calls"] = {stage: plan["evaluate"] - reused.get(stage, 0) for stage in ROW_STAGES}
+    plan["total_calls"] = sum(plan["calls"].values())
+    plan["naive_calls"] = len(ROW_STAGES) * plan["rows"]
+    return plan, units, reusable
+
+
+def plan_dataset(file_path, model_name, output_dir=None, name=None, fingerprint=None, dedup=True, stage_cache=None):
+    """返回计划字典：各环节扣除的行数与各阶段需要的调用次数"""
+    return _plan(file_path, model_name, output_dir, name, fingerprint, dedup, stage_cache)[0]
+
+
+def print_plan(plan):
+    print(f"[计划] {plan['dataset']}（裁判模型 {plan['model']}）：共 {plan['rows']} 行")
+    print(f"[计划] 续跑已完成 {plan['resumed']} 行，无法评测 {plan['dropped']} 行，"
+          f"重复评测单元 {plan['duplicates']} 行，实际评测 {plan['evaluate']} 行")
+    if plan["fingerprint"]:
+        print(f"[计划] 规则指纹 {plan['fingerprint']}：可复用单模型打标 自研 {plan['reused']['single_a']} 行、"
+              f"竞品 {plan['reused']['single_b']} 行")
+    else:
+        print("[计划] 阶段缓存中没有该裁判模型的规则指纹，不计算复用")
+    calls = "，".join(f"{stage} {n}" for stage, n in plan["calls"].items())
+    print(f"[计划] 需要的模型调用：{calls}（final_judgment 为上限）")
+    saved = 1 - plan["total_calls"] / plan["naive_calls"] if plan["naive_calls"] else 0.0
+    print(f"[计划] 合计 {plan['total_calls']} 次，逐行全量评测需 {plan['naive_calls']} 次，节省 {saved:.1%}")
+
+
+# ========= 干跑：构建全部 prompt =========
+def _previous_latency(output_dir):
+    """上次评测（call_stats.json）的平均调用耗时，没有则返回 None"""
+    path = os.path.join(output_dir or "", "call_stats.json")
+    if not output_dir or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        stats = json.load(f)
+    live = sum(st["calls"] - st["cached"] for st in stats.values())
+    return sum(st["latency"] for st in stats.values()) / live if live else None
+
+
+def dry_run(file_path, model_name, rules, threads=5, call_latency=None, output_dir=None, name=None, fingerprint=None,
+            dedup=True, response_cache=None, stage_cache=None):
+    """
+    不调用模型：构建每一行的全部 prompt，返回计划字典（在 plan_dataset 的基础上增加
+    prompt 长度分布、响应缓存命中预估与耗时估算）
+    """
+    plan, units, reusable = _plan(file_path, model_name, output_dir, name, fingerprint, dedup, stage_cache)
+    judgment_prompt = create_final_judgment_prompt(json.dumps(PLACEHOLDER_ANALYSIS, ensure_ascii=False, indent=2),
+                                                   "13无问题", "13无问题", rules)
+
+    sizes, cache_hits = [], dict.fromkeys(ROW_STAGES, 0)
+    for idx, (dimension, run_time, v_history, c_history, v_resp, c_resp) in units.items():
+        prompts = {
+            "single_a": create_single_model_prompt(run_time, v_history, v_resp, dimension, rules),
+            "single_b": create_single_model_prompt(run_time, c_history, c_resp, dimension, rules),
+            "sbs_analysis": create_sbs_analysis_prompt(dimension, v_history, c_history, v_resp, c_resp, rules),
+            "final_judgment": judgment_prompt,
+        }
+        for stage, prompt in prompts.items():
+            if stage in reusable.get(idx, ()):
+                continue
+            sizes.append((dimension, stage, len(prompt)))
+            # 最终裁决的真实 prompt 取决于前三步的输出，无法预估缓存命中
+            if response_cache is not None and stage != "final_judgment" and response_cache.contains(model_name,
+                                                                                                   prompt):
+                cache_hits[stage] += 1
+
+    size_df = pd.DataFrame(sizes, columns=["dimension", "stage", "chars"])
+    plan["prompt_chars"] = int(size_df["chars"].sum()) if not size_df.empty else 0
+    plan["prompt_tokens"] = int(plan["prompt_chars"] / CHARS_PER_TOKEN)
+    plan["size_table"] = size_df
+    plan["cache_hits"] = cache_hits
+    live_calls = plan["total_calls"] - sum(cache_hits.values())
+    plan["live_calls"] = live_calls
+
+    # 耗时：每行关键路径为 (单模型打标 / SBS 分析并发) + 最终裁决 两次调用，按线程数分轮；
+    # 同时不能快于限流 qps 允许的速度
+    latency = call_latency or _previous_latency(output_dir) or DEFAULT_CALL_LATENCY
+    qps = _limit_config(model_name).get("qps")
+    live_share = live_calls / plan["total_calls"] if plan["total_calls"] else 0.0
+    by_threads = math.ceil(plan["evaluate"] / max(1, threads)) * 2 * latency * live_share
+    by_qps = live_calls / qps if qps else 0.0
+    plan["latency"] = latency
+    plan["threads"] = threads
+    plan["wall_clock"] = max(by_threads, by_qps)
+    plan["bound"] = "qps" if by_qps > by_threads else "threads"
+    return plan
+
+
+def print_dry_run(plan):
+    print_plan(plan)
+    print(f"[干跑] 构建 prompt 共 {plan['prompt_chars']} 字符，约 {plan['prompt_tokens']} 个输入 token")
+    hits = "，".join(f"{stage} {n}" for stage, n in plan["cache_hits"].items() if stage != "final_judgment")
+    print(f"[干跑] 响应缓存预计命中：{hits}；需要真实调用约 {plan['live_calls']} 次（final_judgment 为上限）")
+    size_df = plan["size_table"]
+    if not size_df.empty:
+        table = size_df.groupby(["dimension", "stage"])["chars"].describe(percentiles=[0.5, 0.95])
+        table = table[["count", "mean", "50%", "95%", "max"]].round(0).astype(int)
+        table.columns = ["调用数", "平均字符", "p50", "p95", "最长"]
+        print("[干跑] 各维度、各阶段 prompt 长度：")
+        print(table.to_string())
+    hours = plan["wall_clock"] / 3600
+    print(f"[干跑] 按 {plan['threads']} 线程、单次调用 {plan['latency']:.1f}s 估算，整体耗时约 "
+          f"{plan['wall_clock'] / 60:.1f} 分钟（{hours:.2f} 小时，受{'限流 qps' if plan['bound'] == 'qps' else '线程数'}约束）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预估数据集实际需要的模型调用次数（不调用模型）")
+    parser.add_argument("--dataset", required=True, help="评测输入的 Excel 文件")
+    parser.add_argument("--model", default="o3", help="裁判模型")
+    parser.add_argument("--output-dir", help="评测输出目录（用于扣除续跑日志中已完成的行）")
+    parser.add_argument("--name", help="输出文件中的模型标记，默认 <model>_part_all")
+    parser.add_argument("--fingerprint", help="规则指纹，默认取该模型最近一次评测使用的指纹")
+    parser.add_argument("--stage-cache", help="阶段缓存路径，默认同评测流程")
+    parser.add_argument("--no-dedup", action="store_true", help="不扣除重复的评测单元")
+    args = parser.parse_args()
+
+    if args.model not in config["model"]:
+        parser.error(f"未知的裁判模型: {args.model}")
+    stage_cache = init_stage_cache("replay", path=args.stage_cache)
+    print_plan(plan_dataset(args.dataset, args.model, output_dir=args.output_dir, name=args.name,
+                            fingerprint=args.fingerprint, dedup=not args.no_dedup, stage_cache=stage_cache))
+    stage_cache.close()
@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+import pandas as pd
+from tqdm import tqdm
+
+from evaluation import async_test, discard_cached_response
+from output_writer import initialize_output, result_name
+from result_journal import (STATUS_DROPPED, STATUS_ERROR, STATUS_OK, ResultWriter, apply_journal, journal_path_for,
+                            dataset_fingerprint, make_record, pending_rows, read_journal)
+from result_parser import parse_result_json
+from dedup import fan_out, group_duplicates, print_dedup_summary, write_duplicate_map
+from row_scheduler import RowCostTracker, estimate_costs, order_rows
+from processor_threaded import (ROW_PARALLEL_STAGES, _build_result_json, _parse_row, _remember_rules,
+                                _stage_error_lines, build_row_graph, print_decision_summary)
+from utils.async_model import DEFAULT_CONCURRENCY, close_async_session, get_async_session
+from utils.telemetry import get_call_stats
+from utils.budget import BudgetExceeded, get_budget, use_budget
+from utils.rate_limiter import describe_limits
+
+"""
+异步评测流程：所有行在同一个事件循环上并发，由信号量控制在途行数。
+输出与 processor_threaded 完全一致（同样的列、剔除原因、错误日志与逐行结果日志）。
+"""
+
+
+async def _call_and_parse_async(prompt, model_name, retry=3, verbose=False, show_prompts=False, stage=None):
+    for attempt in range(retry):
+        raw = await async_test(prompt, model=model_name, verbose=verbose, show_prompts=show_prompts, stage=stage)
+        try:
+            return parse_result_json(raw)
+        except Exception:
+            # 与 processor_threaded._call_and_parse 相同：坏响应从缓存中删除后再重试
+            discard_cached_response(prompt, model=model_name)
+            if attempt == retry - 1:
+                raise
+    return {}
+
+
+async def evaluate_row_async(row, idx, model_name, rules, verbose=False, show_prompts=False, decision="llm"):
+    """
+    processor_threaded.evaluate_row 的协程版本，返回 (record, log_lines)
+    """
+    id_val = row.get("id", idx)
+    try:
+        parsed, drop_reason = _parse_row(row)
+        if parsed is None:
+            return make_record(idx, id_val, STATUS_DROPPED, reason=drop_reason), []
+
+        # 单模型打标（A、B）与 SBS 对比分析并发，最终裁决等三者都返回后再执行
+        call = lambda prompt, stage: _call_and_parse_async(prompt, model_name, verbose=verbose,
+                                                           show_prompts=show_prompts, stage=stage)
+        stages, errors = await build_row_graph(parsed, rules, call, decision=decision,
+                                                model_name=model_name).run_async()
+
+        result_json = _build_result_json(stages["single_a"], stages["single_b"], stages["sbs_analysis"],
+                                         stages["final_judgment"], rules)
+        return make_record(idx, id_val, STATUS_OK, result=result_json), _stage_error_lines(id_val, errors)
+    except Exception as e:
+        return (make_record(idx, id_val, STATUS_ERROR, reason=f"未知严重错误: {e}"),
+                [f"CRITICAL Error at row {id_val}: {e}\n"])
+
+
+async def process_data_async(file_path, output_dir, model_name, rules, concurrency=DEFAULT_CONCURRENCY,
+                             verbose=False, show_prompts=False, decision="llm", schedule="file",
+                             dedup=True, on_progress=None, budget=None):
+    """budget 为本次评测的预算，省略时使用全局预算；各行协程继承绑定了该预算的上下文"""
+    df = pd.read_excel(file_path)
+    os.makedirs(output_dir, exist_ok=True)
+    # 与多线程流程写同一份结果文件与结果日志，两种流程之间可以互相续跑
+    out_df, output_file_path, log_file_path, _, _ = initialize_output(
+        file_path, output_dir, result_name(model_name), df
+    )
+    journal_path = journal_path_for(output_file_path)
+    dataset_fp = dataset_fingerprint(df)
+    records = read_journal(journal_path, dataset_fp)
+    apply_journal(out_df, records)
+    todo_df, skipped = pending_rows(df, records)
+    if skipped:
+        print(f"[续跑] 结果日志中已完成 {skipped} 行，本次评测剩余 {len(todo_df)} 行")
+    _remember_rules(model_name, rules)
+    duplicates = {}
+    if dedup:
+        total = len(todo_df)
+        todo_df, duplicates = group_duplicates(todo_df)
+        print_dedup_summary(total, duplicates)
+        write_duplicate_map(output_dir, df, duplicates)
+    # 协程按创建顺序排队等待信号量，ljf 时估算成本高的行先拿到并发名额
+    costs = estimate_costs(todo_df)
+    todo_df = order_rows(todo_df, costs, schedule)
+    cost_tracker = RowCostTracker(todo_df, costs)
+    budget = budget or get_budget()
+    budget.start(len(todo_df))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    # 每行最多 ROW_PARALLEL_STAGES 个阶段同时在途，实际发出速率仍由全局限流器控制
+    get_async_session(limit=concurrency * ROW_PARALLEL_STAGES)
+    pbar = tqdm(total=len(todo_df), desc="评测进度", unit="条")
+    # 结果与错误日志交给单写线程批量落盘，事件循环中不做磁盘 I/O
+    writer = ResultWriter(journal_path, out_df, log_file_path, fingerprint=dataset_fp)
+
+    async def run_row(idx, row):
+        async with semaphore:
+            # 预算硬上限已触发时不再评测，该行留待续跑
+            if budget.exhausted:
+                pbar.update(1)
+                return
+            start = time.time()
+            record, log_lines = await evaluate_row_async(row, idx, model_name, rules, verbose=verbose,
+                                                         show_prompts=show_prompts, decision=decision)
+            cost_tracker.record(idx, time.time() - start)
+        writer.submit(record, log_lines)
+        for dup_record in fan_out(record, duplicates.get(idx, ())):
+            writer.submit(dup_record)
+        budget.row_done()
+        limits = describe_limits()
+        if limits:
+            pbar.set_postfix_str(f"在途上限 {limits}", refresh=False)
+        pbar.update(1)
+        if on_progress is not None:
+            on_progress(pbar.n, pbar.total)
+
+    try:
+        with use_budget(budget):
+            await asyncio.gather(*(run_row(idx, row) for idx, row in todo_df.iterrows()))
+    finally:
+        writer.close()
+        await close_async_session()
+        pbar.close()
+        # 即使中途出错，也把已完成的行写出到 Excel
+        out_df.to_excel(output_file_path, index=False)
+    print("所有异步任务已完成！")
+    print(f"结果已写入: {output_file_path}（写线程共落盘 {writer.flushes} 次）")
+
+    print_decision_summary(out_df)
+    cost_tracker.print_report()
+    cost_tracker.dump(output_dir)
+    call_stats = get_call_stats()
+    call_stats.print_summary()
+    call_stats.dump(output_dir)
+    budget.print_summary()
+    budget.dump(output_dir)
+    if budget.exhausted:
+        raise BudgetExceeded(f"{budget.exceeded}；已完成的行已写入结果日志，重新运行即可续跑")
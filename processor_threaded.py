@@ -1,10 +1,10 @@
 import os
 import sys
+import time
 import json
+import inspect
 import pandas as pd
-import numpy as np
 from concurrent.futures import ThreadPoolExecutor
-import threading
 from tqdm import tqdm
 
 from evaluation import (
@@ -14,13 +14,24 @@ from evaluation import (
     create_sbs_analysis_prompt,
     create_final_judgment_prompt,
     test,
+    test_stream,
+    discard_cached_response,
 )
-from output_writer import initialize_output, write_output_row, mark_row_as_dropped
+from output_writer import initialize_output, result_name
+from result_journal import (STATUS_DROPPED, STATUS_ERROR, STATUS_OK, ResultWriter, apply_journal, journal_path_for,
+                            dataset_fingerprint, make_record, pending_rows, read_journal)
+from dedup import fan_out, group_duplicates, print_dedup_summary, write_duplicate_map
+from row_scheduler import RowCostTracker, estimate_costs, order_rows
 from utils.tee import Tee
 from result_parser import parse_result_json
-from auto_rules import map_main_issues_to_satisfaction
+from auto_rules import decide_winloss_by_rules, map_main_issues_to_satisfaction
+from utils.stage_graph import StageGraph
+from utils.telemetry import CallResult, get_call_stats
+from utils.budget import BudgetExceeded, get_budget, use_budget
+from utils.retry_policy import Outcome
+from utils.stage_cache import get_stage_cache, rules_fingerprint, single_stage_key
+from utils.rate_limiter import describe_limits
 
-lock = threading.Lock()
 
 def _format_histories(small_v_history, competitor_history):
     last_small_v = small_v_history[-1]
@@ -38,209 +49,383 @@ def _format_histories(small_v_history, competitor_history):
     c_resp = f"问题：{last_competitor.get('human', '')}\n大模型B的回答内容：{last_competitor.get('AI', '')}"
     return v_history, c_history, v_resp, c_resp
 
-def _call_and_parse(prompt, model_name, retry=3, verbose=False, show_prompts=False):
+def _call_and_parse(prompt, model_name, retry=3, verbose=False, show_prompts=False, stream=False, stage=None):
+    # stream=True 时使用流式调用，JSON 一闭合即返回解析
+    call = test_stream if stream else test
     for attempt in range(retry):
         # [修改] 将 verbose 和 show_prompts 参数传递给 test 函数
-        raw = test(prompt, model=model_name, verbose=verbose, show_prompts=show_prompts)
+        raw = call(prompt, model=model_name, verbose=verbose, show_prompts=show_prompts, stage=stage)
         try:
             return parse_result_json(raw)
         except Exception:
+            # 截断或格式错误的响应不留在缓存里，否则重试与续跑都会回放同一结果
+            discard_cached_response(prompt, model=model_name)
             if attempt == retry - 1:
                 raise
     return {}
 
-def process_single_row(row, idx, out_df, output_file_path, last_id_path, log_file_path, model_name, rules, pbar,
-                       verbose=False, show_prompts=False):
+def _parse_row(row):
     """
-    【完整版】处理单行数据的核心函数，已集成新的两步式CoT评测流程。
+    解析并检查单行数据
+    返回 (parsed, drop_reason)：parsed 为 (dimension, run_time, v_history, c_history, v_resp, c_resp)，
+    数据无法评测时 parsed 为 None、drop_reason 为剔除原因
     """
-    id_val = row.get("id", idx)
+    dimension = row.get("度量一级分类", "其他").strip()
+    run_time_val = row.get("prompt_time")
+    run_time = run_time_val.strip() if run_time_val else ""
+
+    # 解析历史记录，并处理各种异常情况
     try:
-        # =======================================================
-        # 1. 数据解析与预处理 (保持不变)
-        # =======================================================
-        dimension = row.get("度量一级分类", "其他").strip()
-        run_time_val = row.get("prompt_time")
-        run_time = run_time_val.strip() if run_time_val else ""
+        small_v_history = json.loads(row["小Vcompletions_content"])
+    except Exception:
+        return None, "自研内容解析失败"
+    try:
+        competitor_history = json.loads(row["竞品completions_content"])
+    except Exception:
+        return None, "竞品内容解析失败"
 
-        # 解析历史记录，并处理各种异常情况
-        try:
-            small_v_history = json.loads(row["小Vcompletions_content"])
-        except Exception as e:
-            with lock:
-                mark_row_as_dropped(out_df, idx, "自研内容解析失败")
-            return
-        try:
-            competitor_history = json.loads(row["竞品completions_content"])
-        except Exception as e:
-            with lock:
-                mark_row_as_dropped(out_df, idx, "竞品内容解析失败")
-            return
+    # 空内容检查
+    if not small_v_history or row['小Vcompletions_content'] == "[]":
+        return None, "自研内容为空"
+    if not competitor_history or row['竞品completions_content'] == "[]":
+        return None, "竞品内容为空"
 
-        # 空内容检查
-        if not small_v_history or row['小Vcompletions_content'] == "[]":
-            with lock:
-                mark_row_as_dropped(out_df, idx, "自研内容为空")
-            return
-        if not competitor_history or row['竞品completions_content'] == "[]":
-            with lock:
-                mark_row_as_dropped(out_df, idx, "竞品内容为空")
-            return
+    # 格式化历史
+    v_history, c_history, v_resp, c_resp = _format_histories(small_v_history, competitor_history)
+    return (dimension, run_time, v_history, c_history, v_resp, c_resp), None
 
-        # 格式化历史
-        v_history, c_history, v_resp, c_resp = _format_histories(small_v_history, competitor_history)
 
-        # =======================================================
-        # 2. 第一阶段：单模型独立打标 (保持不变)
-        # =======================================================
-        prompt_a = create_single_model_prompt(run_time, v_history, v_resp, dimension, rules)
-        single_a = _call_and_parse(prompt_a, model_name, verbose=verbose, show_prompts=show_prompts)
+def _con_issues(single_issues, sbs_issues):
+    """合并单模型与SBS两路的问题标签"""
+    sbs_issues_set = set(s.strip() for s in (sbs_issues or "").split('，') if s.strip())
+    single_issues_set = set(s.strip() for s in (single_issues or "").split('，') if s.strip())
+    all_issues = single_issues_set.union(sbs_issues_set)
+    if "13无问题" in all_issues and len(all_issues) > 1:
+        all_issues.remove("13无问题")  # 如果有其他问题，就移除“无问题”标签
+    if not all_issues:
+        return "13无问题"
+    return "，".join(sorted(list(all_issues)))
+
+
+def _build_result_json(single_a, single_b, analysis_res, judgment_res, rules):
+    """
+    汇总四步链式流程的结果，构建最终要写入的JSON对象
+    """
+    a_single_main_issues = (single_a.get("主要问题") or "").strip()
+    b_single_main_issues = (single_b.get("主要问题") or "").strip()
+    a_qzrz = (single_a.get("优质弱智主要问题") or "").strip()
+    b_qzrz = (single_b.get("优质弱智主要问题") or "").strip()
+
+    # 程序化满意度映射
+    a_satisfaction, reason_a = map_main_issues_to_satisfaction(a_single_main_issues, rules)
+    b_satisfaction, reason_b = map_main_issues_to_satisfaction(b_single_main_issues, rules)
+
+    # 从分析结果中提取信息
+    a_sbs_issues = (analysis_res.get("大模型A_SBS主要问题") or "").strip()
+    b_sbs_issues = (analysis_res.get("大模型B_SBS主要问题") or "").strip()
+
+    # 从裁决结果中提取最终判断
+    sv_compare = (judgment_res.get("大模型A竞品对比") or "").strip()
+    tiebreak_reason = (judgment_res.get("裁判说明") or "").strip()
 
-        prompt_b = create_single_model_prompt(run_time, c_history, c_resp, dimension, rules)
-        single_b = _call_and_parse(prompt_b, model_name, verbose=verbose, show_prompts=show_prompts)
+    # 合并所有问题标签
+    a_main_issues = _con_issues(a_single_main_issues, a_sbs_issues)
+    b_main_issues = _con_issues(b_single_main_issues, b_sbs_issues)
 
-        a_single_main_issues = (single_a.get("主要问题") or "").strip()
-        b_single_main_issues = (single_b.get("主要问题") or "").strip()
-        a_qzrz = (single_a.get("优质弱智主要问题") or "").strip()
-        b_qzrz = (single_b.get("优质弱智主要问题") or "").strip()
+    # 汇总所有标注理由
+    reason_parts = [
+        f"大模型A主要问题选择理由：{single_a.get('标注理由', '')}",
+        f"大模型B主要问题选择理由：{single_b.get('标注理由', '')}",
+        f"裁判说明：{tiebreak_reason}",
+    ]
+    reason_str = " | ".join([p for p in reason_parts if p and not p.endswith('：')])
+
+    return {
+        "大模型A二级满意度": a_satisfaction,
+        "大模型A优质弱智主要问题": a_qzrz,
+        "大模型B二级满意度": b_satisfaction,
+        "大模型B优质弱智主要问题": b_qzrz,
+        "大模型A竞品对比": sv_compare,
+        "大模型A主要问题": a_main_issues,
+        "大模型B主要问题": b_main_issues,
+        "LLMs_标注理由": reason_str,
+        # --- 新增的详细分析字段 ---
+        "LLMs_自研本身主要问题": a_single_main_issues,
+        "LLMs_竞品本身主要问题": b_single_main_issues,
+        "LLMs_自研SBS主要问题": a_sbs_issues,
+        "LLMs_竞品SBS主要问题": b_sbs_issues,
+        "LLMs_A_失败触发器": str(analysis_res.get("大模型A_命中的失败触发器", [])),
+        "LLMs_B_失败触发器": str(analysis_res.get("大模型B_命中的失败触发器", [])),
+        "LLMs_A_胜利模式": str(analysis_res.get("大模型A_符合的胜利模式", [])),
+        "LLMs_B_胜利模式": str(analysis_res.get("大模型B_符合的胜利模式", [])),
+        "LLMs_裁判分析报告": tiebreak_reason,  # 复用裁判说明
+        "LLMs_裁决路径": (judgment_res.get("裁决路径") or "").strip(),
+    }
+
+
+# 单行中可同时在途的阶段数（single_a / single_b / sbs_analysis），用于确定连接池大小
+ROW_PARALLEL_STAGES = 3
+
+# 最终裁决的决策方式：llm 每行都调用裁判模型；rules_first 规则能判定时跳过裁判模型
+DECISION_MODES = ("llm", "rules_first")
+
+# 写入 LLMs_裁决路径 列的取值
+PATH_RULES = "规则"
+PATH_LLM = "裁判模型"
+PATH_LLM_TIE = "裁判模型（规则无法区分）"
+PATH_LLM_TRIGGER = "裁判模型（命中失败触发器）"
+PATH_LLM_NO_ANALYSIS = "裁判模型（SBS分析缺失）"
+
+# 允许失败的阶段：失败时以空字典继续，保证流程不中断，并写入错误日志
+STAGE_ERROR_LABELS = {
+    "sbs_analysis": "SBS分析步骤(CoT-Step1)失败",
+    "final_judgment": "最终裁决步骤(CoT-Step2)失败",
+}
+
+
+def build_row_graph(parsed, rules, call, decision="llm", model_name=None):
+    """
+    单行评测的阶段依赖图：single_a、single_b、sbs_analysis 并发，final_judgment 依赖前三者
+    call(prompt, stage) 返回解析后的 JSON（异步流程中返回协程）
+    decision="rules_first" 时最终裁决先走 auto_rules，规则能分出胜负且未命中失败触发器时不再调用裁判模型
+    传入 model_name 且启用了阶段缓存时，对话未变的一侧直接复用以往的单模型打标结果
+    """
+    dimension, run_time, v_history, c_history, v_resp, c_resp = parsed
+    single = _reusable_single(call, model_name, rules, dimension, run_time)
+
+    # 第一阶段：单模型独立打标
+    prompt_a = create_single_model_prompt(run_time, v_history, v_resp, dimension, rules)
+    prompt_b = create_single_model_prompt(run_time, c_history, c_resp, dimension, rules)
+    # 第二阶段：两步式CoT —— 对比分析 (事实收集)
+    analysis_prompt = create_sbs_analysis_prompt(dimension, v_history, c_history, v_resp, c_resp, rules)
+
+    # 第二阶段：两步式CoT —— 最终裁决 (基于事实判断)
+    def final_judgment(single_a, single_b, sbs_analysis):
+        path = PATH_LLM
+        if decision == "rules_first":
+            verdict, path = _decide_by_rules(single_a, single_b, sbs_analysis, rules)
+            if verdict is not None:
+                return verdict
+        analysis_json_str = json.dumps(sbs_analysis, ensure_ascii=False, indent=2)
+        judgment_prompt = create_final_judgment_prompt(analysis_json_str, (single_a.get("主要问题") or "").strip(),
+                                                       (single_b.get("主要问题") or "").strip(), rules)
+        return _then(call(judgment_prompt, "final_judgment"), lambda res: dict(res, 裁决路径=path))
+
+    graph = StageGraph()
+    graph.add("single_a", lambda: single("single_a", prompt_a, v_history, v_resp))
+    graph.add("single_b", lambda: single("single_b", prompt_b, c_history, c_resp))
+    graph.add("sbs_analysis", lambda: call(analysis_prompt, "sbs_analysis"), fallback={})
+    graph.add("final_judgment", final_judgment, deps=("single_a", "single_b", "sbs_analysis"), fallback={})
+    return graph
+
+
+def _remember_rules(model_name, rules):
+    """记录本次评测的规则指纹，planner.py 预估下一份数据集的调用量时使用"""
+    stage_cache = get_stage_cache()
+    if stage_cache is not None:
+        stage_cache.remember_fingerprint(model_name, rules_fingerprint(rules))
+
+
+def _reusable_single(call, model_name, rules, dimension, run_time):
+    """
+    单模型打标先查阶段缓存（见 utils/stage_cache），命中时不调用模型；
+    未命中时调用模型并写入缓存。返回 single(stage, prompt, history, resp)
+    """
+    cache = get_stage_cache() if model_name else None
+    if cache is None:
+        return lambda stage, prompt, history, resp: call(prompt, stage)
+    fingerprint = rules_fingerprint(rules)
 
+    def single(stage, prompt, history, resp):
+        key = single_stage_key(model_name, fingerprint, dimension, run_time, history, resp)
+        reused = cache.get(key)
+        if reused is not None:
+            get_call_stats().record(stage, CallResult(model=model_name, outcome=Outcome.OK, cached=True))
+            return reused
+
+        def store(res):
+            cache.put(key, model_name, stage, res)
+            return res
+        return _then(call(prompt, stage), store)
+    return single
+
+
+def _decide_by_rules(single_a, single_b, sbs_analysis, rules):
+    """
+    规则优先裁决：合并单模型与 SBS 两路问题标签后交给 decide_winloss_by_rules
+    返回 (裁决结果, 裁决路径)；需要升级到裁判模型时裁决结果为 None
+    """
+    if not sbs_analysis:
+        return None, PATH_LLM_NO_ANALYSIS
+    if sbs_analysis.get("大模型A_命中的失败触发器") or sbs_analysis.get("大模型B_命中的失败触发器"):
+        return None, PATH_LLM_TRIGGER
+    a_main_issues = _con_issues(single_a.get("主要问题"), sbs_analysis.get("大模型A_SBS主要问题"))
+    b_main_issues = _con_issues(single_b.get("主要问题"), sbs_analysis.get("大模型B_SBS主要问题"))
+    result, need_tiebreak, reason = decide_winloss_by_rules(a_main_issues, b_main_issues, rules)
+    if need_tiebreak:
+        return None, PATH_LLM_TIE
+    return {"大模型A竞品对比": result, "裁判说明": f"规则判定：{reason}", "裁决路径": PATH_RULES}, PATH_RULES
+
+
+def _then(value, fn):
+    """对 call 的返回值做后处理，兼容同步结果与协程"""
+    if inspect.isawaitable(value):
+        async def chain():
+            return fn(await value)
+        return chain()
+    return fn(value)
+
+
+def _stage_error_lines(id_val, errors):
+    return [f"Error at row {id_val}: {STAGE_ERROR_LABELS.get(name, name)}: {e}\n" for name, e in errors.items()]
+
+
+def print_decision_summary(out_df):
+    """打印各裁决路径的行数（剔除行不计）"""
+    if "LLMs_裁决路径" not in out_df.columns:
+        return
+    paths = out_df["LLMs_裁决路径"].fillna("").astype(str)
+    counts = paths[(paths != "") & (paths != "剔除")].value_counts()
+    if len(counts):
+        print("[裁决路径] " + "，".join(f"{path} {n} 行" for path, n in counts.items()))
+
+
+def evaluate_row(row, idx, model_name, rules, verbose=False, show_prompts=False, stream=False, decision="llm"):
+    """
+    【完整版】评测单行数据（两步式CoT评测流程），不写任何文件。
+    返回 (record, log_lines)：record 为 result_journal 的一条记录，log_lines 为需要写入错误日志的内容
+    """
+    id_val = row.get("id", idx)
+    try:
         # =======================================================
-        # 3. 第二阶段：程序化满意度映射 (保持不变)
+        # 1. 数据解析与预处理
         # =======================================================
-        a_satisfaction, reason_a = map_main_issues_to_satisfaction(a_single_main_issues, rules)
-        b_satisfaction, reason_b = map_main_issues_to_satisfaction(b_single_main_issues, rules)
+        parsed, drop_reason = _parse_row(row)
+        if parsed is None:
+            return make_record(idx, id_val, STATUS_DROPPED, reason=drop_reason), []
 
         # =======================================================
-        # 4. 第三阶段：【核心改造】两步式CoT对比与裁决
+        # 2. 单模型打标（A、B）与 SBS 对比分析互不依赖，并发执行；最终裁决等三者都返回后再执行
         # =======================================================
-
-        # --- CoT Step 1: 对比分析 (事实收集) ---
-        analysis_prompt = create_sbs_analysis_prompt(dimension, v_history, c_history, v_resp, c_resp, rules)
-        try:
-            analysis_res = _call_and_parse(analysis_prompt, model_name, verbose=verbose, show_prompts=show_prompts)
-        except Exception as e:
-            analysis_res = {}  # 即使此步失败，也用空字典继续，保证流程不中断
-            with lock:
-                with open(log_file_path, "a", encoding="utf-8") as f:
-                    f.write(f"Error at row {id_val}: SBS分析步骤(CoT-Step1)失败: {e}\n")
-
-        # 从分析结果中提取信息
-        a_sbs_issues = (analysis_res.get("大模型A_SBS主要问题") or "").strip()
-        b_sbs_issues = (analysis_res.get("大模型B_SBS主要问题") or "").strip()
-
-        # --- CoT Step 2: 最终裁决 (基于事实判断) ---
-        analysis_json_str = json.dumps(analysis_res, ensure_ascii=False, indent=2)
-        judgment_prompt = create_final_judgment_prompt(analysis_json_str, a_single_main_issues, b_single_main_issues,
-                                                       rules)
-        try:
-            judgment_res = _call_and_parse(judgment_prompt, model_name, verbose=verbose, show_prompts=show_prompts)
-        except Exception as e:
-            judgment_res = {}  # 裁决失败也用空字典继续
-            with lock:
-                with open(log_file_path, "a", encoding="utf-8") as f:
-                    f.write(f"Error at row {id_val}: 最终裁决步骤(CoT-Step2)失败: {e}\n")
-
-        # 从裁决结果中提取最终判断
-        sv_compare = (judgment_res.get("大模型A竞品对比") or "").strip()
-        tiebreak_reason = (judgment_res.get("裁判说明") or "").strip()
+        call = lambda prompt, stage: _call_and_parse(prompt, model_name, verbose=verbose, show_prompts=show_prompts,
+                                                     stream=stream, stage=stage)
+        stages, errors = build_row_graph(parsed, rules, call, decision=decision, model_name=model_name).run()
 
         # =======================================================
-        # 5. 第四阶段：结果汇总与写入 (保持不变)
+        # 3. 第三阶段：结果汇总
         # =======================================================
-
-        # 合并所有问题标签
-        def con_issues(single_issues, sbs_issues):
-            sbs_issues_set = set(s.strip() for s in (sbs_issues or "").split('，') if s.strip())
-            single_issues_set = set(s.strip() for s in (single_issues or "").split('，') if s.strip())
-            all_issues = single_issues_set.union(sbs_issues_set)
-            if "13无问题" in all_issues and len(all_issues) > 1:
-                all_issues.remove("13无问题")  # 如果有其他问题，就移除“无问题”标签
-            if not all_issues:
-                return "13无问题"
-            return "，".join(sorted(list(all_issues)))
-
-        a_main_issues = con_issues(a_single_main_issues, a_sbs_issues)
-        b_main_issues = con_issues(b_single_main_issues, b_sbs_issues)
-
-        # 汇总所有标注理由
-        reason_parts = [
-            f"大模型A主要问题选择理由：{single_a.get('标注理由', '')}",
-            f"大模型B主要问题选择理由：{single_b.get('标注理由', '')}",
-            f"裁判说明：{tiebreak_reason}",
-        ]
-        reason_str = " | ".join([p for p in reason_parts if p and not p.endswith('：')])
-
-        # 构建最终要写入的JSON对象
-        result_json = {
-            "大模型A二级满意度": a_satisfaction,
-            "大模型A优质弱智主要问题": a_qzrz,
-            "大模型B二级满意度": b_satisfaction,
-            "大模型B优质弱智主要问题": b_qzrz,
-            "大模型A竞品对比": sv_compare,
-            "大模型A主要问题": a_main_issues,
-            "大模型B主要问题": b_main_issues,
-            "LLMs_标注理由": reason_str,
-            # --- 新增的详细分析字段 ---
-            "LLMs_自研本身主要问题": a_single_main_issues,
-            "LLMs_竞品本身主要问题": b_single_main_issues,
-            "LLMs_自研SBS主要问题": a_sbs_issues,
-            "LLMs_竞品SBS主要问题": b_sbs_issues,
-            "LLMs_A_失败触发器": str(analysis_res.get("大模型A_命中的失败触发器", [])),
-            "LLMs_B_失败触发器": str(analysis_res.get("大模型B_命中的失败触发器", [])),
-            "LLMs_A_胜利模式": str(analysis_res.get("大模型A_符合的胜利模式", [])),
-            "LLMs_B_胜利模式": str(analysis_res.get("大模型B_符合的胜利模式", [])),
-            "LLMs_裁判分析报告": tiebreak_reason  # 复用裁判说明
-        }
-    # 线程安全地写入结果
-        with lock:
-            write_output_row(out_df, idx, result_json)
-            out_df.to_excel(output_file_path, index=False)
-            with open(last_id_path, "w", encoding="utf-8") as f:
-                f.write(str(id_val))
+        result_json = _build_result_json(stages["single_a"], stages["single_b"], stages["sbs_analysis"],
+                                         stages["final_judgment"], rules)
+        return make_record(idx, id_val, STATUS_OK, result=result_json), _stage_error_lines(id_val, errors)
 
     except Exception as e:
-        # 主循环的兜底异常处理
-        with lock:
-            # 标记为剔除，以防万一
-            mark_row_as_dropped(out_df, idx, f"未知严重错误: {e}")
-            out_df.to_excel(output_file_path, index=False)
-            with open(log_file_path, "a", encoding="utf-8") as f:
-                f.write(f"CRITICAL Error at row {id_val}: {e}\n")
+        # 兜底异常处理：标记为剔除，以防万一
+        return (make_record(idx, id_val, STATUS_ERROR, reason=f"未知严重错误: {e}"),
+                [f"CRITICAL Error at row {id_val}: {e}\n"])
+
+
+def process_single_row(row, idx, writer, model_name, rules, pbar,
+                       verbose=False, show_prompts=False, stream=False, decision="llm", cost_tracker=None,
+                       duplicates=(), on_progress=None, budget=None):
+    """
+    评测单行并把结果交给写线程（工作线程不做任何磁盘 I/O）；duplicates 中的重复行直接复用本行结果
+    本行的调用记入 budget（本次评测的预算），硬上限已触发时不再评测，该行留待续跑
+    """
+    budget = budget or get_budget()
+    try:
+        if budget.exhausted:
+            return
+        start = time.time()
+        with use_budget(budget):
+            record, log_lines = evaluate_row(row, idx, model_name, rules, verbose=verbose,
+                                             show_prompts=show_prompts, stream=stream, decision=decision)
+        if cost_tracker is not None:
+            cost_tracker.record(idx, time.time() - start)
+        writer.submit(record, log_lines)
+        for dup_record in fan_out(record, duplicates):
+            writer.submit(dup_record)
+        budget.row_done()
     finally:
-        # 确保进度条总是更新
+        # 确保进度条总是更新；开启自适应并发时在进度条后缀显示各模型当前的在途上限
+        limits = describe_limits()
+        if limits:
+            pbar.set_postfix_str(f"在途上限 {limits}", refresh=False)
         pbar.update(1)
+        if on_progress is not None:
+            on_progress(pbar.n, pbar.total)
 
-def process_data_multithread(file_path, output_dir, model_name, rules, thread_num=2, verbose=False, show_prompts=False):
+
+def process_data_multithread(file_path, output_dir, model_name, rules, thread_num=2, verbose=False, show_prompts=False,
+                             stream=False, decision="llm", schedule="file", dedup=True,
+                             on_progress=None, budget=None):
+    """
+    行级动态分发：每一行都是线程池共享队列中的一个任务，空闲线程随时领取下一行，
+    不再预先把数据切成 thread_num 块（某一块恰好集中了长对话时，其余线程只能空等）。
+    schedule="ljf" 时按估算成本从高到低入队（见 row_scheduler），长对话先跑；
+    dedup=True 时完全相同的评测单元只评测一次（见 dedup）；
+    on_progress(已完成行数, 本次待评测行数) 在每行完成后调用（server.py 用它汇报任务进度）。
+    budget 为本次评测的预算（server.py 每个任务一份），省略时使用全局预算。
+    每行结果经单写线程（ResultWriter）批量追加到逐行日志，全部完成后一次性写出 Excel
+    （文件名见 output_writer.result_name，与异步、分片流程相同）。
+    """
     df = pd.read_excel(file_path)
-    df_split = [df_part for df_part in np.array_split(df, thread_num)]
     os.makedirs(output_dir, exist_ok=True)
+    out_df, output_file_path, log_file_path, terminal_file_path, _ = initialize_output(
+        file_path, output_dir, result_name(model_name), df
+    )
+    journal_path = journal_path_for(output_file_path)
+    # 续跑：上次已完成的行先写回 out_df，只调度日志中尚未完成（或上次严重错误）的行
+    dataset_fp = dataset_fingerprint(df)
+    records = read_journal(journal_path, dataset_fp)
+    apply_journal(out_df, records)
+    todo_df, skipped = pending_rows(df, records)
+    if skipped:
+        print(f"[续跑] 结果日志中已完成 {skipped} 行，本次评测剩余 {len(todo_df)} 行")
+    _remember_rules(model_name, rules)
+    duplicates = {}
+    if dedup:
+        total = len(todo_df)
+        todo_df, duplicates = group_duplicates(todo_df)
+        print_dedup_summary(total, duplicates)
+        write_duplicate_map(output_dir, df, duplicates)
+    costs = estimate_costs(todo_df)
+    todo_df = order_rows(todo_df, costs, schedule)
+    cost_tracker = RowCostTracker(todo_df, costs)
+    budget = budget or get_budget()
+    budget.start(len(todo_df))
 
     # 在启动线程池前初始化tqdm进度条
-    total_rows = len(df)
+    total_rows = len(todo_df)
     pbar = tqdm(total=total_rows, desc="评测进度", unit="条")
 
-    # run_thread 函数签名增加 pbar 参数
-    def run_thread(thread_id, sub_df, pbar, verbose, show_prompts):
-        thread_model_name = f"{model_name}_part_{thread_id}"
-        out_df, output_file_path, log_file_path, terminal_file_path, last_id_path = initialize_output(
-            file_path, output_dir, thread_model_name, sub_df
-        )
-        # 注意：此处为简化，不再为每个线程重定向stdout，进度条将统一在主控制台显示
-        # terminal_fp = open(terminal_file_path, "a", encoding="utf-8")
-        # sys.stdout = Tee(sys.__stdout__, terminal_fp)
-
-        # [修改] 在循环中传递pbar
-        for idx, row in sub_df.iterrows():
-            process_single_row(row, idx, out_df, output_file_path, last_id_path, log_file_path, model_name, rules, pbar, verbose=verbose, show_prompts=show_prompts)
-
-        # sys.stdout = sys.__stdout__
-        # terminal_fp.close()
-
-    with ThreadPoolExecutor(max_workers=thread_num) as executor:
-        # [修改] 提交任务时传递pbar
-        for i, sub_df in enumerate(df_split):
-            executor.submit(run_thread, i, sub_df, pbar, verbose, show_prompts)
+    with ResultWriter(journal_path, out_df, log_file_path, fingerprint=dataset_fp) as writer, \
+            ThreadPoolExecutor(max_workers=thread_num) as executor:
+        futures = [
+            executor.submit(process_single_row, row, idx, writer, model_name, rules, pbar,
+                            verbose=verbose, show_prompts=show_prompts, stream=stream, decision=decision,
+                            cost_tracker=cost_tracker, duplicates=duplicates.get(idx, ()),
+                            on_progress=on_progress, budget=budget)
+            for idx, row in todo_df.iterrows()
+        ]
+        for future in futures:
+            # evaluate_row 内部已兜底，这里只为暴露意料之外的异常
+            future.result()
 
     # 任务完成后关闭进度条
     pbar.close()
-    print("所有线程任务已完成！")
\ No newline at end of file
+    print("所有线程任务已完成！")
+
+    out_df.to_excel(output_file_path, index=False)
+    print(f"结果已写入: {output_file_path}（写线程共落盘 {writer.flushes} 次）")
+
+    print_decision_summary(out_df)
+    cost_tracker.print_report()
+    cost_tracker.dump(output_dir)
+    # 按阶段汇总调用次数、token 与耗时
+    call_stats = get_call_stats()
+    call_stats.print_summary()
+    call_stats.dump(output_dir)
+    budget.print_summary()
+    budget.dump(output_dir)
+    if budget.exhausted:
+        raise BudgetExceeded(f"{budget.exceeded}；已完成的行已写入结果日志，重新运行即可续跑")
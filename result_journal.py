@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import hashlib
+import queue
+import argparse
+import threading
+import pandas as pd
+
+from output_writer import initialize_output, write_output_row, mark_row_as_dropped
+
+"""
+逐行结果日志（append-only JSONL）
+每完成一行追加一条记录，评测过程中不再反复整表重写 Excel；
+评测流程中由 ResultWriter 单线程批量写入（工作线程只往队列里放结果，不碰磁盘）；
+Excel 只在评测结束时（或用本文件的命令行按需）由日志物化生成，同一行有多条记录时以最后一条为准。
+记录按行号（idx）对应数据行，并带有数据集指纹（dataset_fingerprint）：数据 id 可能重复或为空，不能作为续跑的键；
+数据集内容变化（增删行、改顺序、改内容）后指纹不同，旧记录不再套用，对应的行重新评测。
+续跑时只调度日志中没有完成记录的行（含上次严重错误的行）。
+
+记录格式：{"idx": 行号, "id": 数据id, "status": "ok"/"dropped"/"error", "result": 结果JSON, "reason": 剔除原因,
+          "ts": 时间戳, "dataset": 数据集指纹}
+"""
+
+STATUS_OK = "ok"
+STATUS_DROPPED = "dropped"
+STATUS_ERROR = "error"
+
+
+def journal_path_for(output_file_path):
+    return output_file_path[:-len(".xlsx")] + ".jsonl" if output_file_path.endswith(".xlsx") \
+        else output_file_path + ".jsonl"
+
+
+def dataset_fingerprint(df):
+    """数据集内容（含列名与行号）的指纹；df 为补上 id 列后的输入数据"""
+    digest = hashlib.sha1("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def make_record(idx, id_val, status, result=None, reason=""):
+    return {"idx": idx, "id": id_val, "status": status, "result": result, "reason": reason, "ts": time.time()}
+
+
+def _to_plain(value):
+    # numpy 标量（行号、id）转成 Python 原生类型
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class ResultJournal:
+    """线程安全的追加写日志；每条记录一行 JSON，写入后立即 flush；给出 fingerprint 时每条记录带上数据集指纹"""
+
+    def __init__(self, path, fingerprint=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fp = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        # 上次进程中断时最后一行可能没写完，先换行，避免新记录接在半行后面
+        if self._fp.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._fp.write("\n")
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        """一批记录一次写入、一次 flush"""
+        if self.fingerprint:
+            records = [dict(r, dataset=self.fingerprint) for r in records]
+        lines = "".join(json.dumps(r, ensure_ascii=False, default=_to_plain) + "\n" for r in records)
+        with self._lock:
+            self._fp.write(lines)
+            self._fp.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._fp.closed:
+                self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultWriter:
+    """
+    单写线程：工作线程通过 submit 把 (记录, 错误日志) 放入队列后立即返回；
+    写线程攒够 batch_size 条或距上次落盘超过 flush_interval 秒时，一次性追加到结果日志和错误日志，
+    同时把结果写入内存中的 out_df（同一批内同一行号只保留最后一条）。close 时写完剩余内容。
+    """
+
+    _STOP = object()
+
+    def __init__(self, journal_path, out_df=None, log_file_path=None, batch_size=50, flush_interval=2.0,
+                 fingerprint=None):
+        self.journal = ResultJournal(journal_path, fingerprint)
+        self.out_df = out_df
+        self.log_file_path = log_file_path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.flushes = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record, log_lines=()):
+        self._queue.put((record, list(log_lines)))
+
+    def _run(self):
+        records, log_lines = {}, []
+        last_flush = time.monotonic()
+        stop = False
+        while not stop:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is self._STOP:
+                    stop = True
+                else:
+                    record, lines = item
+                    records[int(record["idx"])] = record
+                    log_lines.extend(lines)
+            except queue.Empty:
+                pass
+            if records or log_lines:
+                if stop or len(records) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush(list(records.values()), log_lines)
+                    records, log_lines = {}, []
+                    last_flush = time.monotonic()
+            else:
+                last_flush = time.monotonic()
+
+    def _flush(self, records, log_lines):
+        if records:
+            self.journal.append_many(records)
+            if self.out_df is not None:
+                apply_journal(self.out_df, records)
+        if log_lines and self.log_file_path:
+            with open(self.log_file_path, "a", encoding="utf-8") as f:
+                f.writelines(log_lines)
+        self.written += len(records)
+        self.flushes += 1
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self.journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_journal(path, fingerprint=None):
+    """
+    按写入顺序读出全部记录；进程中断时最后一行可能不完整，直接跳过
+    给出 fingerprint 时只返回该数据集的记录（数据集已变化或旧版日志中没有指纹的记录不再套用）
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    if fingerprint:
+        matched = [record for record in records if record.get("dataset") == fingerprint]
+        if len(matched) < len(records):
+            print(f"[续跑] 结果日志中 {len(records) - len(matched)} 条记录来自内容不同的数据集（或旧版日志），"
+                  f"不再套用，对应的行重新评测")
+        records = matched
+    return records
+
+
+def latest_records(records):
+    """按行号取每行的最后一条记录"""
+    latest = {}
+    for record in records:
+        latest[int(record["idx"])] = record
+    return latest
+
+
+def completed_rows(records):
+    """已完成的行号集合（成功或数据本身应剔除）；严重错误的行不算完成，续跑时会重新调度"""
+    return {idx for idx, record in latest_records(records).items() if record["status"] != STATUS_ERROR}
+
+
+def pending_rows(df, records):
+    """
+    续跑：按日志中已完成的行号过滤出还需要评测的行，与上次的线程数、完成顺序无关
+    records 应为同一数据集的记录（read_journal 按指纹过滤），返回 (待评测的 DataFrame, 跳过的行数)
+    """
+    done = completed_rows(records)
+    if not done:
+        return df, 0
+    mask = df.index.isin(list(done))
+    return df[~mask], int(mask.sum())
+
+
+def apply_journal(out_df, records):
+    """把日志记录按行号写入 out_df（同一行以最后一条记录为准），返回写入的行数"""
+    applied = 0
+    for idx, record in latest_records(records).items():
+        if idx not in out_df.index:
+            continue
+        if record["status"] == STATUS_OK:
+            write_output_row(out_df, idx, record["result"])
+        else:
+            mark_row_as_dropped(out_df, idx, record.get("reason", ""))
+        applied += 1
+    return applied
+
+
+def materialize(out_df, journal_path, output_file_path, fingerprint=None):
+    """由日志物化 Excel 结果文件"""
+    applied = apply_journal(out_df, read_journal(journal_path, fingerprint))
+    out_df.to_excel(output_file_path, index=False)
+    return applied
+
+
+if __name__ == "__main__":
+    # 按需物化：评测进行中或中断后，也可以随时由日志生成当前的 Excel 结果
+    parser = argparse.ArgumentParser(description="由逐行结果日志生成 Excel 结果文件")
+    parser.add_argument("--dataset", required=True, help="评测输入的 Excel 文件")
+    parser.add_argument("--output-dir", required=True, help="评测输出目录")
+    parser.add_argument("--name", required=True, help="输出文件中的模型标记，如 o3_part_all")
+    args = parser.parse_args()
+
+    df = pd.read_excel(args.dataset)
+    out_df, output_file_path, _, _, _ = initialize_output(args.dataset, args.output_dir, args.name, df)
+    n = materialize(out_df, journal_path_for(output_file_path), output_file_path, dataset_fingerprint(df))
+    print(f"已由日志写入 {n} 行结果：{output_file_path}")
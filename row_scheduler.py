@@ -0,0 +1,107 @@
+import os
+import json
+import threading
+import pandas as pd
+
+"""
+行调度：评测前估算每行的成本，按成本从高到低发出（最长作业优先，LJF）
+worker 数固定时，先跑长对话、短对话留到最后填空档，可以缩短整体完成时间（makespan）；
+按文件顺序调度时，排在末尾的长对话会让其余线程空等它一个。
+
+成本估算（单位：提示词字符数，只看输入，不调用模型）：
+  • 单模型打标各读一侧对话，SBS 分析读两侧，最终裁决读分析结果，约为 2 × (自研 + 竞品对话长度)
+  • 每轮对话额外计 TURN_COST 个字符（历史拼接、模型逐轮阅读的开销）
+  • 知识问答维度的评分标准更长、裁判输出更长，乘以 KNOWLEDGE_QA_WEIGHT
+
+评测结束后 RowCostTracker 输出估算成本与实际耗时的相关系数（Pearson / Spearman），
+并写入输出目录的 row_cost.json，用来判断估算是否可信。
+"""
+
+SCHEDULE_MODES = ("file", "ljf")
+
+TURN_COST = 200
+KNOWLEDGE_QA_WEIGHT = 1.3
+
+
+def _turns(content):
+    try:
+        history = json.loads(content)
+        return len(history) if isinstance(history, list) else 1
+    except Exception:
+        return 1
+
+
+def estimate_row_cost(row):
+    """估算单行评测的成本（提示词字符数）"""
+    v_content = str(row.get("小Vcompletions_content") or "")
+    c_content = str(row.get("竞品completions_content") or "")
+    cost = 2 * (len(v_content) + len(c_content))
+    cost += TURN_COST * (_turns(v_content) + _turns(c_content))
+    if str(row.get("度量一级分类") or "").strip() == "知识问答":
+        cost *= KNOWLEDGE_QA_WEIGHT
+    return float(cost)
+
+
+def estimate_costs(df):
+    """按行号返回每行的估算成本"""
+    if df.empty:
+        return pd.Series(dtype=float)
+    return df.apply(estimate_row_cost, axis=1).astype(float)
+
+
+def order_rows(df, costs, schedule="file"):
+    """
+    按调度方式排列待评测的行；ljf 按估算成本从高到低（成本相同保持文件顺序）
+    """
+    if schedule not in SCHEDULE_MODES:
+        raise ValueError(f"未知的调度方式: {schedule}，可选 {SCHEDULE_MODES}")
+    if schedule == "file" or df.empty:
+        return df
+    ordered = costs.sort_values(ascending=False, kind="stable").index
+    print(f"[调度] 最长作业优先：共 {len(df)} 行，估算成本最高 {costs.max():.0f}、"
+          f"中位 {costs.median():.0f}、最低 {costs.min():.0f}（提示词字符数）")
+    return df.loc[ordered]
+
+
+class RowCostTracker:
+    """线程安全地记录每行的估算成本与实际耗时（秒，含排队等待限流的时间）"""
+
+    def __init__(self, df, costs):
+        self._estimates = costs.to_dict()
+        self._ids = df["id"].to_dict() if "id" in df.columns else {}
+        self._actual = {}
+        self._lock = threading.Lock()
+
+    def record(self, idx, seconds):
+        with self._lock:
+            self._actual[idx] = seconds
+
+    def correlation(self):
+        """返回 (行数, Pearson, Spearman)；样本不足 3 行或成本全相同时相关系数为 None"""
+        with self._lock:
+            actual = dict(self._actual)
+        pairs = pd.DataFrame({"estimated": pd.Series({k: self._estimates[k] for k in actual}, dtype=float),
+                              "actual": pd.Series(actual, dtype=float)})
+        if len(pairs) < 3 or pairs["estimated"].nunique() < 2 or pairs["actual"].nunique() < 2:
+            return len(pairs), None, None
+        pearson = pairs["estimated"].corr(pairs["actual"])
+        spearman = pairs["estimated"].rank().corr(pairs["actual"].rank())
+        return len(pairs), round(float(pearson), 3), round(float(spearman), 3)
+
+    def print_report(self):
+        n, pearson, spearman = self.correlation()
+        if pearson is None:
+            print(f"[调度] 已完成 {n} 行，样本不足，无法计算估算成本与实际耗时的相关系数")
+        else:
+            print(f"[调度] 估算成本与实际耗时的相关系数（{n} 行）：Pearson {pearson}，Spearman {spearman}")
+
+    def dump(self, output_dir, filename="row_cost.json"):
+        n, pearson, spearman = self.correlation()
+        with self._lock:
+            rows = [{"idx": idx, "id": self._ids.get(idx, idx), "estimated": round(self._estimates.get(idx, 0.0), 1),
+                     "actual_seconds": round(seconds, 3)} for idx, seconds in self._actual.items()]
+        path = os.path.join(output_dir, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"rows": n, "pearson": pearson, "spearman": spearman, "detail": rows},
+                      f, ensure_ascii=False, indent=2, default=lambda v: v.item() if hasattr(v, "item") else str(v))
+        return path
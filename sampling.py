@@ -0,0 +1,215 @@
+import os
+import json
+import math
+import pandas as pd
+
+from check_consistency import _normalize_columns, row_agreement
+
+"""
+分层抽样评测：只需要人机一致率（check_consistency 表1 的合格率/满意率/胜出率）时，不必评测全部数据
+核心：
+  • 按 度量一级分类 分层，每层打乱后逐轮抽取；人工标注为“剔除”的行不参与抽样
+  • 每轮评测完成后按逐行一致得分（row_agreement）计算各层各指标的 Wilson 置信区间；
+    某层三个指标的区间宽度都不超过目标宽度时该层停止抽样，否则按 宽度 ∝ 1/√n 预估还需要的样本量继续抽取
+  • 自研、竞品两侧的一致结果高度相关，区间按行数而非 2×行数计算，偏保守
+  • 整体一致率按各层行数加权（分层估计，含有限总体校正），与逐行全量评测的口径一致
+  • 每轮的抽样写成独立的输入文件，评测结果与续跑日志按抽样参数放在 sampling/<参数>/ 目录下；
+    抽样使用固定随机种子，中断后以相同参数重新运行会复现同样的抽样并续跑；参数不同的抽样互不影响
+  • 各轮的样本量与区间记录在 sampling/<参数>/sampling.json，已用轮次的结果合并至 <数据集>_<model>_sampleEval.xlsx
+
+用法：python main.py --dataset test4.xlsx --sample [--ci-width 0.1 --sample-initial 30 --max-rounds 8 --sample-seed 0]
+"""
+
+METRICS = ("合格率", "满意率", "胜出率")
+STRATUM_COL = "度量一级分类"
+
+# 95% 置信水平
+Z_95 = 1.96
+
+
+def wilson_interval(successes, n, z=Z_95):
+    """二项比例的 Wilson 置信区间；successes 可以是小数（逐行得分之和）"""
+    if n <= 0:
+        return 0.0, 1.0
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def merge_rounds(round_outputs, final_output_file):
+    """合并已用轮次的评测结果（同一目录下可能还有上次运行更多轮次的结果，不计入）"""
+    df = pd.concat([pd.read_excel(path) for path in round_outputs], ignore_index=True)
+    df.to_excel(final_output_file, index=False)
+    return df
+
+
+def load_scores(merged_df):
+    """由合并后的抽样结果计算逐行一致得分（含 度量一级分类）；剔除行与未成功评测的行不计入"""
+    df = _normalize_columns(merged_df)
+    df = df[~df['标注员_小v满意度'].astype(str).isin(['剔除'])
+            & ~df['LLMs_自研满意度'].astype(str).isin(['剔除'])
+            & df['LLMs_自研满意度'].notna()]
+    scores = row_agreement(df)
+    scores.insert(0, STRATUM_COL, df[STRATUM_COL].astype(str).str.strip())
+    return scores
+
+
+class StratifiedSampler:
+    """各层的抽样状态：打乱后的候选行、已抽取的行数与停止原因"""
+
+    def __init__(self, df, width=0.1, initial=30, seed=0, z=Z_95):
+        self.width = width
+        self.initial = initial
+        self.z = z
+        self.pools = {}
+        for dim, group in df.groupby(df[STRATUM_COL].astype(str).str.strip()):
+            self.pools[dim] = list(group.sample(frac=1, random_state=seed).index)
+        self.drawn = dict.fromkeys(self.pools, 0)
+        self.stopped = {}
+
+    @property
+    def population(self):
+        return sum(len(pool) for pool in self.pools.values())
+
+    def stratum_stats(self, scores):
+        """各层当前的样本数、各指标一致率与置信区间"""
+        stats = {}
+        for dim, pool in self.pools.items():
+            group = scores[scores[STRATUM_COL] == dim] if scores is not None else None
+            n = 0 if group is None else len(group)
+            st = {"population": len(pool), "drawn": self.drawn[dim], "n": n, "status": self.stopped.get(dim, "抽样中")}
+            for metric in METRICS:
+                successes = float(group[metric].sum()) if n else 0.0
+                low, high = wilson_interval(successes, n, self.z)
+                st[metric] = {"rate": successes / n if n else None, "low": low, "high": high, "width": high - low}
+            st["width"] = max(st[metric]["width"] for metric in METRICS)
+            stats[dim] = st
+        return stats
+
+    def update(self, scores):
+        """按本轮结果更新各层的停止状态，返回 stratum_stats"""
+        stats = self.stratum_stats(scores)
+        for dim, pool in self.pools.items():
+            if dim in self.stopped or self.drawn[dim] == 0:
+                continue
+            if stats[dim]["n"] and stats[dim]["width"] <= self.width:
+                self.stopped[dim] = "已收敛"
+            elif self.drawn[dim] >= len(pool):
+                self.stopped[dim] = "已抽完"
+        for dim, reason in self.stopped.items():
+            stats[dim]["status"] = reason
+        return stats
+
+    def next_batch(self, scores=None):
+        """决定下一轮每层抽取的行（返回原数据集的行号列表）；所有层都停止时返回空列表"""
+        stats = self.update(scores)
+        batch = []
+        for dim, pool in self.pools.items():
+            if dim in self.stopped:
+                continue
+            st = stats[dim]
+            if st["n"] == 0:
+                size = self.initial
+            else:
+                # 区间宽度约与 1/√n 成正比：按当前最宽的指标预估达到目标所需的样本量
+                need = math.ceil(st["n"] * (st["width"] / self.width) ** 2)
+                size = max(need - st["n"], math.ceil(self.initial / 2))
+            size = min(size, len(pool) - self.drawn[dim])
+            batch.extend(pool[self.drawn[dim]:self.drawn[dim] + size])
+            self.drawn[dim] += size
+        return batch
+
+    def stop_all(self, reason):
+        for dim in self.pools:
+            self.stopped.setdefault(dim, reason)
+
+    def overall(self, stats):
+        """按各层行数加权的整体一致率与正态近似区间（含有限总体校正）"""
+        total = sum(st["population"] for st in stats.values() if st["n"])
+        out = {}
+        for metric in METRICS:
+            rate, var = 0.0, 0.0
+            for st in stats.values():
+                if not st["n"]:
+                    continue
+                weight, p = st["population"] / total, st[metric]["rate"]
+                fpc = 1 - st["n"] / st["population"] if st["population"] else 0.0
+                rate += weight * p
+                var += weight * weight * p * (1 - p) / st["n"] * max(fpc, 0.0)
+            half = self.z * math.sqrt(var)
+            out[metric] = {"rate": rate, "low": max(0.0, rate - half), "high": min(1.0, rate + half)}
+        return out
+
+
+def print_round(round_no, stats, overall, evaluated, population):
+    print(f"[抽样] 第 {round_no} 轮后：已评测 {evaluated}/{population} 行（{evaluated / population:.1%}）")
+    for dim, st in stats.items():
+        rates = "，".join(
+            f"{metric} {st[metric]['rate']:.1%} [{st[metric]['low']:.1%}, {st[metric]['high']:.1%}]"
+            for metric in METRICS if st[metric]["rate"] is not None
+        )
+        print(f"[抽样]   {dim}：{st['n']}/{st['population']} 行，{rates or '暂无有效结果'}（{st['status']}）")
+    if overall:
+        rates = "，".join(f"{metric} {v['rate']:.1%} ±{(v['high'] - v['low']) / 2:.1%}" for metric, v in overall.items())
+        print(f"[抽样]   整体（按层加权）：{rates}")
+
+
+def run_sampling(file_path, output_dir, model_name, evaluate, width=0.1, initial=30, max_rounds=8, seed=0):
+    """
+    分层抽样评测。evaluate(round_file_path, sampling_dir) 负责评测一轮的输入文件（见 main.evaluate_dataset），
+    结果文件须写入 sampling_dir；返回 (合并后的结果文件, 抽样汇总)
+    """
+    df = pd.read_excel(file_path)
+    if "id" not in df.columns:
+        df.insert(0, "id", range(len(df)))
+    labels = _normalize_columns(df.copy())
+    missing = [col for col in (STRATUM_COL, '标注员_小v满意度') if col not in labels.columns]
+    if missing:
+        raise ValueError(f"数据集缺少抽样所需的列: {missing}")
+    eligible = labels[~labels['标注员_小v满意度'].astype(str).isin(['剔除']) & labels['标注员_小v满意度'].notna()]
+    sampler = StratifiedSampler(eligible, width=width, initial=initial, seed=seed)
+    if not sampler.population:
+        raise ValueError("没有可抽样的行（人工标注均为剔除）")
+
+    base = os.path.basename(file_path).replace(".xlsx", "")
+    sampling_dir = os.path.join(output_dir, "sampling", f"seed{seed}_w{width:g}_n{initial}")
+    inputs_dir = os.path.join(sampling_dir, "inputs")
+    os.makedirs(inputs_dir, exist_ok=True)
+    final_sample_file = os.path.join(output_dir, f"{base}_{model_name}_sampleEval.xlsx")
+    print(f"[抽样] {base}：可抽样 {sampler.population}/{len(df)} 行，{len(sampler.pools)} 个分层，"
+          f"目标区间宽度 {width:.1%}，每层首轮 {initial} 行")
+
+    scores, history, stats, overall, round_outputs = None, [], {}, {}, []
+    for round_no in range(1, max_rounds + 1):
+        batch = sampler.next_batch(scores)
+        if not batch:
+            break
+        round_file = os.path.join(inputs_dir, f"{base}_r{round_no}.xlsx")
+        df.loc[batch].to_excel(round_file, index=False)
+        print(f"\n[抽样] 第 {round_no} 轮：抽取 {len(batch)} 行")
+        evaluate(round_file, sampling_dir)
+
+        round_outputs += [os.path.join(sampling_dir, f) for f in sorted(os.listdir(sampling_dir))
+                          if f.startswith(f"{base}_r{round_no}_") and f.endswith(".xlsx")]
+        scores = load_scores(merge_rounds(round_outputs, final_sample_file))
+        stats = sampler.update(scores)
+        overall = sampler.overall(stats)
+        print_round(round_no, stats, overall, len(scores), sampler.population)
+        history.append({"round": round_no, "drawn": len(batch), "strata": stats, "overall": overall})
+    # 仍未收敛的层记为达到轮数上限
+    sampler.stop_all("达到轮数上限")
+    stats = sampler.update(scores)
+
+    summary = {
+        "dataset": file_path, "model": model_name, "width": width, "initial": initial, "seed": seed,
+        "population": sampler.population, "evaluated": 0 if scores is None else len(scores),
+        "strata": stats, "overall": overall, "rounds": history,
+    }
+    with open(os.path.join(sampling_dir, "sampling.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+    statuses = pd.Series([st["status"] for st in stats.values()]).value_counts()
+    print(f"\n[抽样] 抽样结束：共 {len(history)} 轮，评测 {summary['evaluated']}/{sampler.population} 行，"
+          f"{'，'.join(f'{status} {n} 层' for status, n in statuses.items())}（明细见 sampling.json）")
+    return final_sample_file, summary
@@ -0,0 +1,332 @@
+import os
+import copy
+import json
+import time
+import uuid
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config.config import config
+from evaluation import load_rules
+from main import evaluate_dataset, finalize_outputs, init_runtime, learn_guidelines, print_run_stats, resolve_paths
+from processor_threaded import DECISION_MODES, ROW_PARALLEL_STAGES
+from row_scheduler import SCHEDULE_MODES
+from utils.budget import new_budget, use_budget
+from utils.rate_limiter import describe_limits
+from utils.response_cache import CACHE_MODES
+from utils.vivo_model import resolve_domain
+
+"""
+常驻评测服务：规则、反思学习得到的评测指南、连接池与缓存在进程内常驻，提交任务不再有冷启动开销
+核心：
+  • 本地 HTTP（--host/--port）或 Unix socket（--socket）接收任务，任务在线程池中并发执行（--max-jobs）
+  • 所有任务共享每个模型的全局限流器（rate_limiter），多个任务同时跑也不会超出网关限额
+  • 每个任务有独立的预算（配置文件中的上限，可用 max_tokens / max_calls / max_cost 覆盖整体硬上限），
+    一个任务用尽预算不影响同时或之后的其他任务
+  • 评测指南按 (裁判模型, 精标数据集) 只学习一次，POST /reload 重新加载规则并清空已学习的指南
+  • 任务只使用多线程流程；调用统计（call_stats.json）、缓存命中等为整个服务进程的累计值
+
+接口（JSON）：
+  POST /jobs         {"dataset": "test4.xlsx", "model": "o3", "version": "test4", "threads": 5,
+                      "decision": "llm", "schedule": "file", "dedup": true, "stream": false,
+                      "max_tokens": null, "max_calls": null, "max_cost": null}  -> 任务信息
+  GET  /jobs         所有任务
+  GET  /jobs/<id>    单个任务的状态与进度（queued / running / done / failed）
+  GET  /health       服务状态、各模型当前在途上限、缓存统计
+  POST /reload       重新加载 scoring_rules4.yaml
+
+用法：
+  python server.py --port 8765 --max-jobs 4
+  curl -X POST localhost:8765/jobs -d '{"dataset": "test4.xlsx", "model": "o3", "version": "adhoc"}'
+"""
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class Job:
+    def __init__(self, dataset, model, version, threads=5, decision="llm", schedule="file", dedup=True,
+                 stream=False, budget=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.dataset = dataset
+        self.model = model
+        self.version = version
+        self.threads = threads
+        self.decision = decision
+        self.schedule = schedule
+        self.dedup = dedup
+        self.stream = stream
+        self.budget = budget or new_budget()
+        self.status = JOB_QUEUED
+        self.done = 0
+        self.total = None
+        self.error = None
+        self.output = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in (JOB_QUEUED, JOB_RUNNING)
+
+    def update_progress(self, done, total):
+        self.done, self.total = done, total
+
+    def to_dict(self):
+        return {
+            "id": self.id, "dataset": self.dataset, "model": self.model, "version": self.version,
+            "threads": self.threads, "decision": self.decision, "schedule": self.schedule, "dedup": self.dedup,
+            "stream": self.stream, "status": self.status, "done": self.done, "total": self.total,
+            "error": self.error, "output": self.output, "budget": self.budget.snapshot(),
+            "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+        }
+
+
+def _int_param(params, key, default):
+    """整数参数（至少为 1）；null、非数字字符串等返回 400"""
+    value = params.get(key, default)
+    if isinstance(value, bool):
+        raise ValueError(f"{key} 必须是正整数：{value!r}")
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} 必须是正整数：{value!r}")
+
+
+def _limit_param(params, key):
+    """预算上限参数：省略或 null 表示使用配置文件中的上限，否则必须是正数"""
+    value = params.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{key} 必须是正数：{value!r}")
+    return value
+
+
+class EvalServer:
+    """任务调度与常驻状态；HTTP 层只做参数解析与序列化"""
+
+    def __init__(self, max_jobs=4, pool_size=64, cache_mode="rw", golden="config/golden_dataset.xlsx",
+                 hedge=False, adaptive=False, verbose=False, show_prompts=False):
+        self.golden = golden
+        self.verbose = verbose
+        self.show_prompts = show_prompts
+        self.rules = load_rules()
+        self.http_pool, self.hedger, self.response_cache, self.stage_cache = init_runtime(
+            [], pool_size, cache_mode, hedge=hedge, adaptive=adaptive
+        )
+        self.jobs = {}
+        self._guidelines = {}
+        self._warmed = set()
+        self._lock = threading.Lock()
+        # 反思学习串行执行，同一模型的并发任务只学习一次
+        self._learn_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job")
+        self.started_at = time.time()
+
+    # ---------- 常驻状态 ----------
+    def reload_rules(self):
+        rules = load_rules()
+        with self._learn_lock:
+            self.rules = rules
+            self._guidelines.clear()
+
+    def _learned_guidelines(self, model):
+        with self._learn_lock:
+            key = (model, self.golden)
+            if key not in self._guidelines:
+                self._guidelines[key] = learn_guidelines(self.rules, model, self.golden, verbose=self.verbose,
+                                                         show_prompts=self.show_prompts)
+            return self.rules, self._guidelines[key]
+
+    def _warm_up(self, model, threads):
+        domain = resolve_domain(model)
+        with self._lock:
+            if domain in self._warmed:
+                return
+            self._warmed.add(domain)
+        self.http_pool.warm_up([domain], connections=threads * ROW_PARALLEL_STAGES)
+
+    # ---------- 任务 ----------
+    def submit(self, params):
+        """校验参数并提交任务；参数错误抛出 ValueError"""
+        if not isinstance(params, dict):
+            raise ValueError("请求体必须是 JSON 对象")
+        dataset = params.get("dataset")
+        model = params.get("model", "o3")
+        version = params.get("version", "adhoc")
+        if not dataset:
+            raise ValueError("缺少 dataset")
+        threads = _int_param(params, "threads", 5)
+        limits = [_limit_param(params, key) for key in ("max_tokens", "max_calls", "max_cost")]
+        file_path, _, _, _ = resolve_paths(dataset, model, version)
+        if not os.path.exists(file_path):
+            raise ValueError(f"数据集不存在: {file_path}")
+        if model not in config["model"]:
+            raise ValueError(f"未知的裁判模型: {model}")
+        decision = params.get("decision", "llm")
+        schedule = params.get("schedule", "file")
+        if decision not in DECISION_MODES:
+            raise ValueError(f"未知的裁决方式: {decision}，可选 {DECISION_MODES}")
+        if schedule not in SCHEDULE_MODES:
+            raise ValueError(f"未知的调度方式: {schedule}，可选 {SCHEDULE_MODES}")
+        job = Job(dataset, model, version, threads=threads, decision=decision, schedule=schedule,
+                  dedup=bool(params.get("dedup", True)), stream=bool(params.get("stream", False)),
+                  budget=new_budget(*limits))
+        with self._lock:
+            # 同一 (数据集, 模型, 版本) 共用输出目录，不能同时跑两个
+            for other in self.jobs.values():
+                if other.active and (other.dataset, other.model, other.version) == (dataset, model, version):
+                    raise ValueError(f"任务 {other.id} 正在评测同一数据集、模型与版本")
+            self.jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        print(f"[服务] 已提交任务 {job.id}：{dataset}（{model}，版本 {version}，{job.threads} 线程）")
+        return job
+
+    def _run(self, job):
+        job.status, job.started_at = JOB_RUNNING, time.time()
+        # 任务的全部调用（含反思学习）都记入该任务的预算
+        with use_budget(job.budget):
+            try:
+                file_path, _, output_dir_mutithread, final_output_file = resolve_paths(job.dataset, job.model,
+                                                                                      job.version)
+                self._warm_up(job.model, job.threads)
+                base_rules, guidelines = self._learned_guidelines(job.model)
+                rules = copy.deepcopy(base_rules)
+                rules["learned_guidelines"] = guidelines
+                evaluate_dataset(file_path, output_dir_mutithread, job.model, rules, thread_num=job.threads,
+                                 verbose=self.verbose, show_prompts=self.show_prompts, stream=job.stream,
+                                 decision=job.decision, schedule=job.schedule, dedup=job.dedup,
+                                 on_progress=job.update_progress, budget=job.budget)
+                finalize_outputs(output_dir_mutithread, job.model, final_output_file)
+                job.output = final_output_file
+                job.status = JOB_DONE
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = JOB_FAILED
+                print(f"[服务] 任务 {job.id} 失败：{job.error}")
+            finally:
+                job.finished_at = time.time()
+        print(f"[服务] 任务 {job.id} 结束（{job.status}），耗时 {job.finished_at - job.started_at:.1f}s")
+
+    def list_jobs(self):
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def health(self):
+        with self._lock:
+            running = sum(1 for job in self.jobs.values() if job.status == JOB_RUNNING)
+            queued = sum(1 for job in self.jobs.values() if job.status == JOB_QUEUED)
+        return {
+            "uptime": round(time.time() - self.started_at, 1),
+            "running": running,
+            "queued": queued,
+            "limits": describe_limits(),
+            "response_cache": self.response_cache.stats() if self.response_cache else None,
+            "learned_models": sorted(model for model, _ in self._guidelines),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        print_run_stats(self.http_pool, self.hedger, self.response_cache, self.stage_cache)
+
+
+def make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        def address_string(self):
+            # Unix socket 连接没有客户端地址
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, fmt, *args):
+            if server.verbose:
+                super().log_message(fmt, *args)
+
+        def _reply(self, code, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if path == "/jobs":
+                self._reply(200, server.list_jobs())
+            elif path.startswith("/jobs/"):
+                job = server.get_job(path[len("/jobs/"):])
+                self._reply(200 if job else 404, job or {"error": "任务不存在"})
+            elif path == "/health":
+                self._reply(200, server.health())
+            else:
+                self._reply(404, {"error": "未知接口"})
+
+        def do_POST(self):
+            path = self.path.rstrip("/")
+            if path == "/jobs":
+                try:
+                    self._reply(202, server.submit(self._read_json()).to_dict())
+                except (ValueError, json.JSONDecodeError) as e:
+                    self._reply(400, {"error": str(e)})
+            elif path == "/reload":
+                server.reload_rules()
+                self._reply(200, {"reloaded": True})
+            else:
+                self._reply(404, {"error": "未知接口"})
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常驻评测服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--socket", help="改为监听 Unix socket 路径")
+    parser.add_argument("--max-jobs", type=int, default=4, help="同时执行的任务数上限")
+    parser.add_argument("--pool-size", type=int, default=64, help="每个网关的连接池大小")
+    parser.add_argument("--cache", choices=CACHE_MODES, default="rw", help="LLM响应缓存模式")
+    parser.add_argument("--golden", default="config/golden_dataset.xlsx", help="精标数据集路径")
+    parser.add_argument("--hedge", action="store_true", help="开启对冲请求")
+    parser.add_argument("--adaptive", action="store_true", help="开启自适应并发")
+    parser.add_argument("--verbose", action="store_true", help="启用详细日志输出")
+    parser.add_argument("--show-prompts", action="store_true", help="显示完整的prompt内容")
+    args = parser.parse_args()
+
+    eval_server = EvalServer(max_jobs=args.max_jobs, pool_size=args.pool_size, cache_mode=args.cache,
+                             golden=args.golden, hedge=args.hedge, adaptive=args.adaptive, verbose=args.verbose,
+                             show_prompts=args.show_prompts)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        httpd = UnixHTTPServer(args.socket, make_handler(eval_server))
+        print(f"[服务] 监听 unix:{args.socket}")
+    else:
+        httpd = ThreadingHTTPServer((args.host, args.port), make_handler(eval_server))
+        httpd.daemon_threads = True
+        print(f"[服务] 监听 http://{args.host}:{args.port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        eval_server.shutdown()
@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+
+import pandas as pd
+import pytest
+
+"""
+测试公共设置：仓库根目录加入 sys.path，模型配置使用 tests/model.yaml（不依赖部署环境的 config/model.yaml）
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["MODEL_CONFIG"] = os.path.join(ROOT, "tests", "model.yaml")
+
+# 最小评测规则：提示词里的标签、示例等均可缺省
+RULES = {"learned_guidelines": "无"}
+
+
+def make_row(question="q0", answer_a="a", answer_b="b", dimension="闲聊", label=1):
+    """一行可评测的数据（自研 / 竞品各一轮对话）"""
+    return {
+        "度量一级分类": dimension,
+        "prompt_time": "2025年1月",
+        "小Vcompletions_content": json.dumps([{"human": question, "AI": answer_a}], ensure_ascii=False),
+        "竞品completions_content": json.dumps([{"human": question, "AI": answer_b}], ensure_ascii=False),
+        "标注员_小v满意度": label,
+    }
+
+
+@pytest.fixture
+def write_dataset(tmp_path):
+    """把行写成评测输入的 Excel 文件，返回文件路径"""
+    def write(rows, name="data.xlsx"):
+        path = tmp_path / name
+        pd.DataFrame(rows).to_excel(path, index=False)
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """启动本地模拟网关（mock_gateway.MockGateway，默认无延迟），并把所有模型的 domain 指向它"""
+    from config.config import config
+    from mock_gateway import MockGateway
+
+    gateways = []
+
+    def start(**kwargs):
+        kwargs.setdefault("latency", 0)
+        gw = MockGateway(port=0, **kwargs).start()
+        gateways.append(gw)
+        for model_cfg in config["model"].values():
+            monkeypatch.setitem(model_cfg, "domain", gw.address)
+        return gw
+
+    yield start
+    for gw in gateways:
+        gw.stop()
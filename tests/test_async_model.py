@@ -0,0 +1,46 @@
+import asyncio
+import os
+
+import pandas as pd
+
+from conftest import RULES, make_row
+from processor_async import process_data_async
+from utils.async_model import async_call_model, close_async_session
+from utils.budget import new_budget
+from utils.retry_policy import Outcome
+
+
+def _call(prompt):
+    async def run():
+        try:
+            return await async_call_model(prompt, "o3", "s")
+        finally:
+            await close_async_session()
+    return asyncio.run(run())
+
+
+def test_async_call_model_returns_content_and_usage(gateway):
+    gateway()
+    result = _call("你好")
+    assert result.outcome == Outcome.OK and result.content
+    assert result.attempts == 1 and result.total_tokens > 0
+
+
+def test_async_call_model_retries_with_the_shared_policy(gateway):
+    gw = gateway(rate_5xx=1.0)
+    result = _call("你好")
+    assert result.outcome == Outcome.TRANSIENT and result.attempts == 3
+    assert gw.stats["requests"] == 3
+
+
+def test_process_data_async_evaluates_every_row(gateway, write_dataset, tmp_path):
+    gw = gateway()
+    file_path = write_dataset([make_row(f"q{i}") for i in range(4)])
+    output_dir = str(tmp_path / "out")
+
+    asyncio.run(process_data_async(file_path, output_dir, "o3", RULES, concurrency=4, budget=new_budget()))
+
+    out_df = pd.read_excel(os.path.join(output_dir, "data_o3_part_allEval.xlsx"))
+    assert out_df["LLMs_裁决路径"].tolist() == ["裁判模型"] * 4
+    # 每行：A、B 单模型打标 + SBS 对比分析 + 最终裁决
+    assert gw.stats["requests"] == 16
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import pytest
+
+from conftest import RULES, make_row
+from processor_async import process_data_async
+from processor_threaded import process_data_multithread
+from utils.budget import Budget, BudgetExceeded, get_budget, new_budget, use_budget
+from utils.retry_policy import Outcome
+from utils.telemetry import CallResult
+
+
+def _result(tokens=100, **kwargs):
+    return CallResult(model="o3", outcome=Outcome.OK, total_tokens=tokens, attempts=1, **kwargs)
+
+
+def test_row_done_without_start_does_not_project(capsys):
+    budget = new_budget()
+    budget.row_done()
+    assert "[预算]" not in capsys.readouterr().out
+
+
+def test_charges_by_run_and_stage_and_skips_cache_hits():
+    budget = Budget()
+    budget.charge("single_a", _result())
+    budget.charge("single_a", _result(cached=True))
+    budget.charge(None, CallResult(model="o3", outcome=Outcome.CIRCUIT_OPEN))
+    # 拿不到 usage 时按字符数估算
+    budget.charge("final_judgment", _result(tokens=0, content="x" * 30), prompt_chars=120)
+    usage = budget.snapshot()["usage"]
+    assert usage["run"] == {"tokens": 200, "calls": 2, "cost": 0}
+    assert usage["single_a"]["calls"] == 1 and usage["final_judgment"]["tokens"] == 100
+
+
+def test_soft_limit_warns_once_and_hard_limit_exhausts(capsys):
+    budget = Budget({"soft_tokens": 150, "max_calls": 3}, {"final_judgment": {"max_tokens": 1000}})
+    for _ in range(2):
+        budget.charge("single_a", _result())
+    assert not budget.exhausted
+    budget.charge("single_a", _result())
+    assert budget.exhausted and "calls" in budget.exceeded
+    assert capsys.readouterr().out.count("超过软上限") == 1
+
+
+def test_stage_limit_exhausts_the_run():
+    budget = Budget({}, {"final_judgment": {"max_calls": 1}})
+    budget.charge("single_a", _result())
+    assert not budget.exhausted
+    budget.charge("final_judgment", _result())
+    assert "阶段 final_judgment" in budget.exceeded
+
+
+def test_projection_after_enough_rows(capsys):
+    budget = Budget({"max_tokens": 500}, project_after=2)
+    budget.start(10)
+    for _ in range(2):
+        budget.charge("single_a", _result())
+        budget.row_done()
+    out = capsys.readouterr().out
+    assert "已完成 2/10 行，预计本次共 1000 tokens" in out and "约完成 5 行后停止" in out
+
+
+def test_use_budget_is_isolated_per_context():
+    outer = get_budget()
+    a, b = new_budget(), new_budget()
+    seen = {}
+
+    def job(name, budget):
+        with use_budget(budget):
+            get_budget().charge("run_a", _result())
+            seen[name] = get_budget()
+
+    threads = [threading.Thread(target=job, args=("a", a)), threading.Thread(target=job, args=("b", b))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seen == {"a": a, "b": b} and get_budget() is outer
+    assert a.snapshot()["usage"]["run"]["calls"] == 1 and b.snapshot()["usage"]["run"]["calls"] == 1
+
+
+def test_hard_limit_stops_scheduling_and_leaves_rows_for_resume(gateway, write_dataset, tmp_path):
+    gw = gateway()
+    file_path = write_dataset([make_row(f"q{i}") for i in range(6)])
+    output_dir = str(tmp_path / "out")
+    with pytest.raises(BudgetExceeded):
+        process_data_multithread(file_path, output_dir, "o3", RULES, thread_num=1, budget=new_budget(max_calls=4))
+    # 单线程：第一行的 4 次调用触发硬上限，其余各行不再调度
+    assert gw.stats["requests"] == 4
+
+    # 续跑时只评测剩余的行
+    asyncio.run(process_data_async(file_path, output_dir, "o3", RULES, concurrency=2, budget=new_budget()))
+    assert gw.stats["requests"] == 4 * 6
@@ -0,0 +1,62 @@
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, get_breaker
+from utils.retry_policy import Outcome
+from utils.vivo_model import call_model
+
+
+def _trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record(Outcome.TRANSIENT)
+    assert breaker.state == OPEN
+
+
+def test_opens_after_threshold_and_recovers_after_probe():
+    breaker = CircuitBreaker("o3", failure_threshold=2, open_seconds=0, half_open_probes=1)
+    breaker.record(Outcome.TRANSIENT)
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record(Outcome.RATE_LIMIT)
+    assert breaker.state == OPEN
+    # open_seconds 过后进入半开，只放行一个探测请求
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(Outcome.OK)
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("o3", failure_threshold=1, open_seconds=0)
+    breaker.record(Outcome.TRANSIENT)
+    assert breaker.allow()
+    breaker.record(Outcome.TRANSIENT)
+    assert breaker.state == OPEN
+
+
+def test_open_breaker_rejects_until_open_seconds_elapse():
+    breaker = CircuitBreaker("o3", failure_threshold=1, open_seconds=60)
+    _trip(breaker)
+    assert not breaker.allow()
+
+
+def test_context_length_and_old_failures_do_not_trip():
+    breaker = CircuitBreaker("o3", failure_threshold=2, window=0)
+    breaker.record(Outcome.CONTEXT_LENGTH)
+    breaker.record(Outcome.TRANSIENT)
+    breaker.record(Outcome.TRANSIENT)
+    # window 为 0：上一次失败已滑出窗口
+    assert breaker.state == CLOSED
+
+
+def test_open_model_routes_to_fallback(gateway):
+    gw = gateway()
+    _trip(get_breaker("o3", gw.address))
+    result = call_model("你好", "o3", "s")
+    assert result.outcome == Outcome.FALLBACK and result.model == "backup" and result.content
+    assert gw.stats["requests"] == 1
+
+
+def test_fails_fast_without_available_fallback(gateway):
+    gw = gateway()
+    _trip(get_breaker("o3", gw.address))
+    _trip(get_breaker("backup", gw.address))
+    result = call_model("你好", "o3", "s")
+    assert result.outcome == Outcome.CIRCUIT_OPEN and result.attempts == 0
+    assert gw.stats["requests"] == 0
@@ -0,0 +1,56 @@
+import pytest
+
+from auto_rules import decide_winloss_by_rules
+from conftest import RULES, make_row
+from processor_threaded import (PATH_LLM, PATH_LLM_NO_ANALYSIS, PATH_LLM_TIE, PATH_LLM_TRIGGER, PATH_RULES,
+                                _parse_row, build_row_graph)
+
+SEVERITY_RULES = dict(RULES, severity_order=["12弱智", "1未提供需要信息", "2内容质量差", "4冗长", "13无问题", "14优质"])
+
+
+def _run(single_a, single_b, sbs_analysis, decision="rules_first"):
+    responses = {
+        "single_a": {"主要问题": single_a},
+        "single_b": {"主要问题": single_b},
+        "sbs_analysis": sbs_analysis,
+        "final_judgment": {"大模型A竞品对比": "平", "裁判说明": "裁判模型"},
+    }
+    calls = []
+
+    def call(prompt, stage):
+        calls.append(stage)
+        if isinstance(responses[stage], Exception):
+            raise responses[stage]
+        return responses[stage]
+
+    parsed, _ = _parse_row(make_row())
+    stages, _ = build_row_graph(parsed, SEVERITY_RULES, call, decision=decision).run()
+    return stages["final_judgment"], calls
+
+
+def test_decisive_rules_skip_the_judge_call():
+    verdict, calls = _run("12弱智", "13无问题", {"大模型A_SBS主要问题": ""})
+    assert verdict["大模型A竞品对比"] == "负" and verdict["裁决路径"] == PATH_RULES
+    assert "final_judgment" not in calls
+
+
+@pytest.mark.parametrize("single_a, single_b, sbs_analysis, path", [
+    ("4冗长", "4冗长", {"大模型A_SBS主要问题": ""}, PATH_LLM_TIE),
+    ("12弱智", "13无问题", {"大模型A_命中的失败触发器": ["答非所问"]}, PATH_LLM_TRIGGER),
+    ("12弱智", "13无问题", RuntimeError("bad json"), PATH_LLM_NO_ANALYSIS),
+])
+def test_undecided_rows_escalate_to_the_judge(single_a, single_b, sbs_analysis, path):
+    verdict, calls = _run(single_a, single_b, sbs_analysis)
+    assert verdict == {"大模型A竞品对比": "平", "裁判说明": "裁判模型", "裁决路径": path}
+    assert calls.count("final_judgment") == 1
+
+
+def test_llm_mode_always_calls_the_judge():
+    verdict, calls = _run("12弱智", "13无问题", {"大模型A_SBS主要问题": ""}, decision="llm")
+    assert verdict["裁决路径"] == PATH_LLM and calls.count("final_judgment") == 1
+
+
+def test_rules_compare_severity_then_counts():
+    assert decide_winloss_by_rules("4冗长", "2内容质量差", SEVERITY_RULES)[0] == "胜"
+    assert decide_winloss_by_rules("4冗长，4冗长", "4冗长", SEVERITY_RULES)[0] == "负"
+    assert decide_winloss_by_rules("4冗长", "4冗长", SEVERITY_RULES)[1] is True
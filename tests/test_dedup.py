@@ -0,0 +1,46 @@
+import json
+import os
+
+import pandas as pd
+
+from conftest import RULES, make_row
+from dedup import fan_out, group_duplicates, unit_key, write_duplicate_map
+from processor_threaded import process_data_multithread
+from result_journal import STATUS_OK, make_record
+from utils.budget import new_budget
+
+
+def test_unit_key_ignores_json_whitespace_and_key_order():
+    row = make_row("q")
+    spaced = dict(row, 小Vcompletions_content=json.dumps([{"AI": "a", "human": "q"}], indent=2))
+    assert unit_key(spaced) == unit_key(row)
+    assert unit_key(dict(row, prompt_time="2025年2月")) != unit_key(row)
+    # 标注结果不属于评测单元
+    assert unit_key(dict(row, 标注员_小v满意度=0)) == unit_key(row)
+
+
+def test_group_duplicates_keeps_first_and_fans_out(tmp_path):
+    df = pd.DataFrame([make_row("q0"), make_row("q1"), make_row("q0"), make_row("q0")])
+    df.insert(0, "id", ["a", "b", "c", "d"])
+    unique, duplicates = group_duplicates(df)
+    assert unique.index.tolist() == [0, 1]
+    assert duplicates == {0: [(2, "c"), (3, "d")]}
+
+    record = make_record(0, "a", STATUS_OK, result={"大模型A竞品对比": "胜"})
+    copies = fan_out(record, duplicates[0])
+    assert [(r["idx"], r["id"], r["result"]) for r in copies] == [(2, "c", record["result"]), (3, "d", record["result"])]
+
+    with open(write_duplicate_map(str(tmp_path), df, duplicates), encoding="utf-8") as f:
+        assert json.load(f) == {"a": ["c", "d"]}
+
+
+def test_duplicate_rows_are_evaluated_once(gateway, write_dataset, tmp_path):
+    gw = gateway()
+    file_path = write_dataset([make_row("q0"), make_row("q1"), make_row("q0")])
+    output_dir = str(tmp_path / "out")
+    process_data_multithread(file_path, output_dir, "o3", RULES, thread_num=2, budget=new_budget())
+
+    assert gw.stats["requests"] == 8
+    out_df = pd.read_excel(os.path.join(output_dir, "data_o3_part_allEval.xlsx"))
+    assert out_df.loc[2, "LLMs_标注理由"] == out_df.loc[0, "LLMs_标注理由"]
+    assert out_df.loc[2, "LLMs_裁决路径"] == "裁判模型"
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+from utils.budget import new_budget, use_budget
+from utils.hedging import DISCARDED_STAGE, Hedger, LatencyTracker
+from utils.retry_policy import Outcome
+from utils.telemetry import CallResult
+
+
+def _hedger(**kwargs):
+    hedger = Hedger(enabled=True, percentile=95, min_samples=1, min_delay=0.05, max_extra_ratio=1.0, **kwargs)
+    hedger.tracker.record("o3", 0.01)
+    return hedger
+
+
+def _slow_then_fast():
+    """第一份请求 0.3s 后返回，之后的请求立即返回"""
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            calls.append(len(calls))
+            first = len(calls) == 1
+        if first:
+            time.sleep(0.3)
+        return CallResult(content="slow" if first else "fast", model="o3", outcome=Outcome.OK,
+                          total_tokens=50, attempts=1)
+    return fn, calls
+
+
+def test_latency_percentile_needs_min_samples():
+    tracker = LatencyTracker()
+    for latency in range(1, 101):
+        tracker.record("o3", latency)
+    assert tracker.percentile("o3", 95) == 95
+    assert tracker.percentile("backup", 95) is None
+    assert tracker.percentile("o3", 95, min_samples=200) is None
+
+
+def test_disabled_hedger_calls_once():
+    fn, calls = _slow_then_fast()
+    assert Hedger(enabled=False).run("o3", fn).content == "slow"
+    assert calls == [0]
+
+
+def test_hedge_wins_and_loser_is_charged_as_discarded():
+    hedger = _hedger()
+    fn, calls = _slow_then_fast()
+    budget = new_budget()
+    with use_budget(budget):
+        result = hedger.run("o3", fn)
+    assert result.content == "fast" and len(calls) == 2
+    assert hedger.hedged == 1 and hedger.hedge_wins == 1
+    # 落后的请求完成后用量计入 hedge_discarded
+    deadline = time.time() + 2
+    while hedger.discarded_tokens == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert hedger.discarded_tokens == 50
+    assert budget.snapshot()["usage"][DISCARDED_STAGE]["tokens"] == 50
+
+
+def test_extra_requests_respect_max_extra_ratio():
+    hedger = _hedger()
+    hedger.max_extra_ratio = 0.0
+    fn, calls = _slow_then_fast()
+    assert hedger.run("o3", fn).content == "slow"
+    assert calls == [0] and hedger.hedged == 0
+
+
+def test_async_hedge_cancels_the_loser():
+    hedger = _hedger()
+    started, cancelled = [], []
+
+    async def call():
+        first = not started
+        started.append(1)
+        try:
+            if first:
+                await asyncio.sleep(1)
+            return CallResult(content="slow" if first else "fast", model="o3", outcome=Outcome.OK)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def run():
+        result = await hedger.run_async("o3", call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()).content == "fast"
+    assert len(started) == 2 and cancelled == [1]
@@ -0,0 +1,39 @@
+import pytest
+import requests
+
+from utils.http_pool import HttpClientPool, init_http_pool, get_http_pool
+
+
+def test_requests_reuse_pooled_connections(gateway):
+    gw = gateway(verify_sign=False)
+    pool = HttpClientPool(pool_size=4)
+    for _ in range(10):
+        response = pool.post(f"http://{gw.address}{gw.uri}", json={"prompt": "hi"})
+        assert response.status_code == 200
+    stats = pool.stats()[gw.address]
+    assert stats["requests"] == 10 and stats["errors"] == 0
+    # 顺序请求始终复用同一条 keep-alive 连接
+    assert stats["connections"] == 1
+    pool.close()
+
+
+def test_warm_up_opens_requested_connections(gateway, capsys):
+    gw = gateway(verify_sign=False)
+    pool = HttpClientPool(pool_size=3)
+    pool.warm_up([gw.address, gw.address])
+    assert "3/3" in capsys.readouterr().out
+    assert pool.stats()[gw.address]["requests"] == 3
+    pool.close()
+
+
+def test_connection_errors_are_counted():
+    pool = HttpClientPool(pool_size=1)
+    with pytest.raises(requests.ConnectionError):
+        pool.post("http://127.0.0.1:9/", timeout=1)
+    assert pool.stats()["127.0.0.1:9"]["errors"] == 1
+    pool.close()
+
+
+def test_init_http_pool_replaces_the_shared_pool():
+    pool = init_http_pool(pool_size=7)
+    assert get_http_pool() is pool and pool.pool_size == 7
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+import requests
+
+from mock_gateway import classify_prompt
+from result_parser import parse_result_json
+from utils.response_cache import ResponseCache
+from utils.retry_policy import Outcome
+from utils.vivo_model import call_model
+
+
+def test_unsigned_request_is_rejected(gateway):
+    gw = gateway()
+    response = requests.post(f"http://{gw.address}{gw.uri}", json={"prompt": "你好"})
+    assert response.status_code == 401
+    assert gw.stats["auth_failed"] == 1 and gw.stats["requests"] == 0
+
+
+def test_signed_client_request_is_accepted(gateway):
+    gw = gateway()
+    assert call_model("你好", "o3", "s").outcome == Outcome.OK
+    assert gw.stats["auth_failed"] == 0 and gw.stats["shape:other"] == 1
+
+
+def test_unknown_path_and_bad_body(gateway):
+    gw = gateway(verify_sign=False)
+    assert requests.post(f"http://{gw.address}/other", json={}).status_code == 404
+    assert requests.post(f"http://{gw.address}{gw.uri}", data=b"not json").status_code == 400
+
+
+def test_prompt_shapes():
+    assert classify_prompt("...输出 {\"大模型A竞品对比\": ...}") == "final_judgment"
+    assert classify_prompt("\"大模型A_命中的失败触发器\": []") == "sbs_analysis"
+    assert classify_prompt("\"优质弱智主要问题\": \"\"") == "single"
+    assert classify_prompt("你好") == "other"
+
+
+def test_judge_shaped_responses_parse(gateway):
+    gateway()
+    content = call_model("请输出 大模型A竞品对比", "o3", "s").content
+    assert parse_result_json(content)["大模型A竞品对比"] in ("胜", "平", "负")
+
+
+def test_malformed_fault_truncates_the_body(gateway):
+    gateway(rate_malformed=1.0)
+    content = call_model("请输出 大模型A竞品对比", "o3", "s").content
+    with pytest.raises(Exception):
+        parse_result_json(content)
+
+
+def test_timeout_fault_drops_the_connection(gateway):
+    gw = gateway(rate_timeout=1.0, timeout_seconds=0)
+    result = call_model("你好", "o3", "s")
+    assert result.outcome == Outcome.TRANSIENT and result.attempts == 3
+    assert gw.stats["fault:timeout"] == 3
+
+
+def test_over_capacity_requests_get_429(gateway):
+    gw = gateway(verify_sign=False, capacity=1, latency=0.3)
+    statuses = []
+
+    def post():
+        statuses.append(requests.post(f"http://{gw.address}{gw.uri}", json={"prompt": "你好"}).status_code)
+
+    threads = [threading.Thread(target=post) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(statuses) == [200, 429]
+
+
+def test_replay_serves_recorded_responses(gateway, tmp_path):
+    path = str(tmp_path / "recorded.sqlite")
+    ResponseCache(path).put("o3", "你好", "录制的真实回答")
+    gw = gateway(replay=path)
+    assert call_model("你好", "o3", "s").content == "录制的真实回答"
+    assert call_model("没录过", "o3", "s").content == "模拟网关已收到请求"
+    assert gw.stats["replay_hit"] == 1 and gw.stats["replay_miss"] == 1
@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+
+from conftest import RULES, make_row
+from output_writer import result_name
+from planner import dry_run, plan_dataset
+from processor_threaded import process_data_multithread
+from result_journal import STATUS_OK, ResultJournal, dataset_fingerprint, make_record
+from utils.budget import new_budget
+
+
+def _rows():
+    return [make_row("q0"), make_row("q1"), make_row("q0"), dict(make_row("q3"), 竞品completions_content="[]"),
+            make_row("q4")]
+
+
+def test_plan_deducts_dropped_and_duplicate_rows(write_dataset):
+    plan = plan_dataset(write_dataset(_rows()), "o3")
+    assert (plan["rows"], plan["dropped"], plan["duplicates"], plan["evaluate"]) == (5, 1, 1, 3)
+    assert plan["total_calls"] == 12 and plan["naive_calls"] == 20
+
+
+def test_plan_deducts_rows_finished_in_the_journal(write_dataset, tmp_path):
+    file_path = write_dataset(_rows())
+    output_dir = str(tmp_path / "out")
+    df = pd.read_excel(file_path)
+    df.insert(0, "id", range(len(df)))
+    journal = os.path.join(output_dir, f"data_{result_name('o3')}Eval.jsonl")
+    with ResultJournal(journal, fingerprint=dataset_fingerprint(df)) as j:
+        j.append(make_record(4, 4, STATUS_OK, result={}))
+    plan = plan_dataset(file_path, "o3", output_dir=output_dir)
+    assert plan["resumed"] == 1 and plan["evaluate"] == 2
+
+
+def test_dry_run_builds_prompts_without_calling_the_model(write_dataset):
+    # tests/model.yaml 的 domain 指向不可达地址：干跑若发出请求会失败
+    plan = dry_run(write_dataset(_rows()), "o3", RULES, threads=2, call_latency=10)
+    assert len(plan["size_table"]) == 12 and plan["prompt_chars"] > 0
+    assert plan["live_calls"] == 12
+    # 3 行、2 线程：两轮，每轮关键路径两次调用
+    assert plan["wall_clock"] == 2 * 2 * 10 and plan["bound"] == "threads"
+
+
+def test_planned_calls_match_the_real_run(gateway, write_dataset, tmp_path):
+    gw = gateway()
+    file_path = write_dataset(_rows())
+    plan = plan_dataset(file_path, "o3")
+    process_data_multithread(file_path, str(tmp_path / "out"), "o3", RULES, thread_num=2, budget=new_budget())
+    assert gw.stats["requests"] == plan["total_calls"]
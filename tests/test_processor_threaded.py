@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from conftest import RULES, make_row
+from merge_outputs import merge_thread_outputs
+from output_writer import result_name
+from processor_threaded import process_data_multithread
+from result_journal import STATUS_OK, make_record
+from utils.budget import new_budget
+
+
+def test_rows_are_pulled_from_a_shared_queue(write_dataset, tmp_path, monkeypatch):
+    # 第 0 行很慢：另一个线程应当把其余各行全部领走，而不是等预先切好的那一半
+    file_path = write_dataset([make_row(f"q{i}") for i in range(6)])
+    workers = {}
+
+    def evaluate_row(row, idx, *args, **kwargs):
+        workers[idx] = threading.get_ident()
+        if idx == 0:
+            time.sleep(0.3)
+        return make_record(idx, idx, STATUS_OK, result={"LLMs_裁决路径": "裁判模型"}), []
+
+    monkeypatch.setattr("processor_threaded.evaluate_row", evaluate_row)
+    process_data_multithread(file_path, str(tmp_path / "out"), "o3", RULES, thread_num=2, dedup=False,
+                             budget=new_budget())
+
+    assert sorted(workers) == list(range(6))
+    assert all(workers[idx] != workers[0] for idx in range(1, 6))
+
+
+def test_multithread_run_writes_the_canonical_result_file(gateway, write_dataset, tmp_path):
+    gateway()
+    file_path = write_dataset([make_row(f"q{i}") for i in range(3)])
+    output_dir = str(tmp_path / "out")
+    process_data_multithread(file_path, output_dir, "o3", RULES, thread_num=3, budget=new_budget())
+
+    assert result_name("o3") == "o3_part_all"
+    out_df = pd.read_excel(os.path.join(output_dir, "data_o3_part_allEval.xlsx"))
+    assert out_df["LLMs_裁决路径"].tolist() == ["裁判模型"] * 3
+    assert not [f for f in os.listdir(output_dir) if "_part_0" in f or "_part_async" in f]
+
+
+def test_merge_ignores_stale_part_files(tmp_path, capsys):
+    output_dir = str(tmp_path)
+    pd.DataFrame({"id": [0, 1]}).to_excel(os.path.join(output_dir, "data_o3_part_allEval.xlsx"), index=False)
+    pd.DataFrame({"id": [0]}).to_excel(os.path.join(output_dir, "data_o3_part_0Eval.xlsx"), index=False)
+    pd.DataFrame({"id": [1]}).to_excel(os.path.join(output_dir, "data_o3_part_asyncEval.xlsx"), index=False)
+    final = os.path.join(output_dir, "final.xlsx")
+
+    merge_thread_outputs(output_dir, "o3", final)
+
+    assert pd.read_excel(final)["id"].tolist() == [0, 1]
+    assert "忽略 2 个旧的子结果文件" in capsys.readouterr().out
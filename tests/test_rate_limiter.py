@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from utils.rate_limiter import ModelLimiter, TokenBucket, get_limiter
+from utils.retry_policy import Outcome
+from utils.vivo_model import call_model
+
+
+def test_token_bucket_allows_burst_then_queues_at_qps():
+    bucket = TokenBucket(qps=10, burst=3)
+    waits = [bucket.reserve() for _ in range(5)]
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    # 余额为负时按到达顺序排队：第 4、5 个请求分别等 1/qps、2/qps
+    assert waits[3] == pytest.approx(0.1, abs=0.01)
+    assert waits[4] == pytest.approx(0.2, abs=0.01)
+
+
+def test_limiter_without_qps_never_waits():
+    limiter = ModelLimiter()
+    assert limiter.reserve() == 0.0
+    assert limiter.try_enter() and limiter.describe() == "∞"
+
+
+def test_try_enter_respects_max_inflight():
+    limiter = ModelLimiter(max_inflight=2)
+    assert limiter.try_enter() and limiter.try_enter()
+    assert not limiter.try_enter()
+    limiter.leave()
+    assert limiter.try_enter()
+
+
+def test_acquire_caps_concurrent_holders():
+    limiter = ModelLimiter(max_inflight=2)
+    lock = threading.Lock()
+    peak = [0, 0]
+
+    def work():
+        with limiter.acquire():
+            with lock:
+                peak[0] += 1
+                peak[1] = max(peak[1], peak[0])
+            time.sleep(0.02)
+            with lock:
+                peak[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[1] == 2 and limiter.inflight == 0
+
+
+def test_get_limiter_is_shared_per_model_and_domain():
+    # tests/model.yaml 的全局 rate_limit：qps 1000，burst 100，max_inflight 8
+    limiter = get_limiter("o3", "limiter-test:1")
+    assert get_limiter("o3", "limiter-test:1") is limiter
+    assert get_limiter("o3", "limiter-test:2") is not limiter
+    assert limiter.max_inflight == 8 and limiter.bucket.qps == 1000
+
+
+def _adaptive(**kwargs):
+    kwargs = dict(dict(max_inflight=8, adaptive=True, initial_inflight=2, cooldown=0), **kwargs)
+    return ModelLimiter(**kwargs)
+
+
+def test_adaptive_limit_grows_after_a_window_of_healthy_successes():
+    limiter = _adaptive()
+    limiter.record(Outcome.OK, 0.1)
+    assert limiter.limit == 2
+    limiter.record(Outcome.OK, 0.1)
+    assert limiter.limit == 3 and limiter.describe() == "3/8"
+    for _ in range(100):
+        limiter.record(Outcome.OK, 0.1)
+    assert limiter.limit == 8
+
+
+def test_slow_successes_do_not_grow_the_limit():
+    limiter = _adaptive(latency_target=1)
+    for _ in range(10):
+        limiter.record(Outcome.OK, 5)
+    assert limiter.limit == 2
+
+
+def test_congestion_halves_the_limit_down_to_the_minimum():
+    limiter = _adaptive(initial_inflight=8)
+    limiter.record(Outcome.RATE_LIMIT, 0.1)
+    assert limiter.limit == 4
+    limiter.record(Outcome.TRANSIENT, 0.1)
+    assert limiter.limit == 2
+    for _ in range(5):
+        limiter.record(Outcome.RATE_LIMIT, 0.1)
+    assert limiter.limit == 1
+    # 与服务拥塞无关的错误不降并发
+    limiter.record(Outcome.CONTEXT_LENGTH, 0.1)
+    assert limiter.limit == 1
+
+
+def test_cooldown_absorbs_a_burst_of_429s():
+    limiter = _adaptive(initial_inflight=8, cooldown=60)
+    for _ in range(5):
+        limiter.record(Outcome.RATE_LIMIT, 0.1)
+    assert limiter.limit == 4
+
+
+def test_non_adaptive_limiter_ignores_feedback():
+    limiter = ModelLimiter(max_inflight=4)
+    limiter.record(Outcome.RATE_LIMIT, 0.1)
+    assert limiter.limit == 4
+
+
+def test_adaptive_limit_backs_off_under_gateway_capacity(gateway, monkeypatch):
+    # 网关容量 2，客户端从 8 起步：超出容量的请求收到 429，在途上限应当降下来
+    gw = gateway(capacity=2, latency=0.05, retry_after=0)
+    monkeypatch.setattr("utils.rate_limiter._adaptive_override", True)
+    limiter = get_limiter("o3", gw.address)
+    limiter.limit, limiter.cooldown = 8, 0
+    threads = [threading.Thread(target=call_model, args=("你好", "o3", "s")) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert gw.stats["fault:rate_limit"] > 0
+    assert limiter.limit < 8
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+import evaluation
+from processor_async import _call_and_parse_async
+from processor_threaded import _call_and_parse
+from utils.response_cache import ResponseCache, cache_key, init_response_cache
+from utils.retry_policy import Outcome
+from utils.telemetry import CallResult
+
+GOOD = '{"大模型A竞品对比": "胜"}'
+TRUNCATED = '{"大模型A竞品对比": "'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = init_response_cache("rw", path=str(tmp_path / "llm_cache.sqlite"))
+    yield cache
+    init_response_cache("off")
+
+
+def _model(responses, calls):
+    def call_model(prompt, model="o3", **kwargs):
+        calls.append(prompt)
+        return CallResult(content=responses[min(len(calls), len(responses)) - 1], model=model, outcome=Outcome.OK)
+    return call_model
+
+
+def test_key_depends_on_model_params_and_prompt():
+    assert cache_key("o3", "p") == cache_key("o3", "p")
+    assert cache_key("o3", "p") != cache_key("o3", "q")
+    assert cache_key("o3", "p") != cache_key("backup", "p")
+
+
+def test_replay_mode_does_not_write(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    ResponseCache(path).put("o3", "p", "x")
+    replay = ResponseCache(path, mode="replay")
+    replay.put("o3", "q", "y")
+    replay.delete("o3", "p")
+    assert replay.get("o3", "p") == "x" and replay.get("o3", "q") is None
+
+
+def test_unparseable_response_is_not_replayed_on_retry(cache, monkeypatch):
+    calls = []
+    monkeypatch.setattr("evaluation.call_model", _model([TRUNCATED, GOOD], calls))
+    assert _call_and_parse("prompt", "o3") == {"大模型A竞品对比": "胜"}
+    assert len(calls) == 2
+    assert cache.get("o3", "prompt") == GOOD
+
+
+def test_cached_bad_response_is_evicted_on_resume(cache, monkeypatch):
+    # 上次运行缓存了截断的响应：续跑时第一次命中缓存，解析失败后删除，第二次真正调用模型
+    cache.put("o3", "prompt", TRUNCATED)
+    calls = []
+    monkeypatch.setattr("evaluation.call_model", _model([GOOD], calls))
+    assert _call_and_parse("prompt", "o3") == {"大模型A竞品对比": "胜"}
+    assert len(calls) == 1
+
+
+def test_persistently_bad_response_leaves_no_cache_entry(cache, monkeypatch):
+    calls = []
+    monkeypatch.setattr("evaluation.call_model", _model([TRUNCATED], calls))
+    with pytest.raises(Exception):
+        _call_and_parse("prompt", "o3")
+    assert len(calls) == 3
+    assert cache.get("o3", "prompt") is None
+
+
+def test_async_retry_evicts_bad_response(cache, monkeypatch):
+    cache.put("o3", "prompt", TRUNCATED)
+    calls = []
+    sync_model = _model([GOOD], calls)
+
+    async def async_call_model(prompt, model="o3", **kwargs):
+        return sync_model(prompt, model=model)
+
+    monkeypatch.setattr("utils.async_model.async_call_model", async_call_model)
+    assert asyncio.run(_call_and_parse_async("prompt", "o3")) == {"大模型A竞品对比": "胜"}
+    assert len(calls) == 1
+
+
+def test_second_call_is_served_from_cache(cache, gateway):
+    gw = gateway()
+    first = evaluation.test_result("你好", "o3")
+    second = evaluation.test_result("你好", "o3")
+    assert not first.cached and second.cached
+    assert second.content == first.content
+    assert gw.stats["requests"] == 1 and cache.stats()["writes"] == 1
+
+
+@pytest.mark.parametrize("result", [
+    CallResult(content="", model="o3", outcome=Outcome.EMPTY),
+    CallResult(content="503", model="o3", outcome=Outcome.TRANSIENT),
+    CallResult(content="答案", model="backup", outcome=Outcome.FALLBACK),
+])
+def test_only_successful_responses_are_cached(cache, monkeypatch, result):
+    monkeypatch.setattr("evaluation.call_model", lambda prompt, model="o3", **kwargs: result)
+    evaluation.test("prompt", "o3")
+    assert cache.get("o3", "prompt") is None
+
+
+def test_replay_miss_does_not_call_the_model(tmp_path, monkeypatch):
+    init_response_cache("replay", path=str(tmp_path / "c.sqlite"))
+    calls = []
+    monkeypatch.setattr("evaluation.call_model", _model([GOOD], calls))
+    try:
+        assert evaluation.test("prompt", "o3") == ""
+    finally:
+        init_response_cache("off")
+    assert calls == []
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), ttl_seconds=-1)
+    cache.put("o3", "p", "x")
+    assert cache.get("o3", "p") is None and not cache.contains("o3", "p")
+
+
+def test_max_entries_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), max_entries=2)
+    for prompt in ("p1", "p2", "p3"):
+        cache.put("o3", prompt, prompt)
+    cache.get("o3", "p1")
+    cache.close()
+    cache = ResponseCache(str(tmp_path / "c.sqlite"))
+    assert [cache.contains("o3", p) for p in ("p1", "p2", "p3")] == [True, False, True]
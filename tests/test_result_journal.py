@@ -0,0 +1,127 @@
+import time
+
+import pandas as pd
+
+from conftest import RULES, make_row
+from output_writer import initialize_output
+from processor_threaded import process_data_multithread
+from result_journal import (STATUS_DROPPED, STATUS_ERROR, STATUS_OK, ResultJournal, ResultWriter,
+                            dataset_fingerprint, journal_path_for, make_record, materialize, pending_rows,
+                            read_journal)
+from utils.budget import new_budget
+
+
+def _ok(idx, verdict="胜"):
+    return make_record(idx, idx, STATUS_OK, result={"大模型A竞品对比": verdict, "LLMs_裁决路径": "裁判模型"})
+
+
+def test_journal_path_sits_next_to_the_excel():
+    assert journal_path_for("out/data_o3_part_allEval.xlsx") == "out/data_o3_part_allEval.jsonl"
+
+
+def test_truncated_last_line_is_skipped_and_not_glued_to_new_records(tmp_path):
+    path = str(tmp_path / "r.jsonl")
+    with ResultJournal(path) as journal:
+        journal.append(_ok(0))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"idx": 1, "status": "o')
+    assert [r["idx"] for r in read_journal(path)] == [0]
+
+    # 进程中断后重新打开：新记录另起一行
+    with ResultJournal(path) as journal:
+        journal.append(_ok(2))
+    assert [r["idx"] for r in read_journal(path)] == [0, 2]
+
+
+def test_error_rows_stay_pending_and_the_last_record_wins(tmp_path):
+    df = pd.DataFrame([make_row(f"q{i}") for i in range(4)])
+    records = [_ok(0), make_record(1, 1, STATUS_DROPPED, reason="自研内容为空"),
+               make_record(2, 2, STATUS_ERROR, reason="未知严重错误"), make_record(3, 3, STATUS_ERROR), _ok(3)]
+    todo, skipped = pending_rows(df, records)
+    assert todo.index.tolist() == [2] and skipped == 3
+
+
+def test_materialize_writes_the_excel_from_the_journal(tmp_path, write_dataset):
+    file_path = write_dataset([make_row(f"q{i}") for i in range(3)])
+    df = pd.read_excel(file_path)
+    out_df, output_file_path, _, _, _ = initialize_output(file_path, str(tmp_path / "out"), "o3_part_all", df)
+    journal_path = journal_path_for(output_file_path)
+    with ResultJournal(journal_path) as journal:
+        journal.append_many([_ok(0, "负"), _ok(0, "胜"), make_record(2, 2, STATUS_DROPPED, reason="竞品内容为空")])
+
+    assert materialize(out_df, journal_path, output_file_path) == 2
+    result = pd.read_excel(output_file_path)
+    assert result.loc[0, "LLMs_自研竞品对比"] == "胜"
+    assert pd.isna(result.loc[1, "LLMs_自研竞品对比"])
+    assert result.loc[2, "LLMs_自研竞品对比"] == "剔除" and result.loc[2, "LLMs_标注理由"] == "竞品内容为空"
+
+
+def test_fingerprint_follows_dataset_content():
+    df = pd.DataFrame([make_row(f"q{i}") for i in range(3)])
+    assert dataset_fingerprint(df) == dataset_fingerprint(df.copy())
+    changed = df.copy()
+    changed.loc[1, "度量一级分类"] = "知识问答"
+    assert dataset_fingerprint(changed) != dataset_fingerprint(df)
+    assert dataset_fingerprint(df.iloc[::-1].reset_index(drop=True)) != dataset_fingerprint(df)
+
+
+def test_records_from_another_dataset_are_not_applied(tmp_path, capsys):
+    path = str(tmp_path / "r.jsonl")
+    with ResultJournal(path, fingerprint="old") as journal:
+        journal.append(_ok(0))
+    with ResultJournal(path, fingerprint="new") as journal:
+        journal.append(_ok(1))
+    assert [r["idx"] for r in read_journal(path, "new")] == [1]
+    assert "1 条记录来自内容不同的数据集" in capsys.readouterr().out
+
+
+def test_resume_by_row_index_with_duplicate_and_blank_ids(tmp_path, write_dataset, monkeypatch):
+    rows = [dict(make_row(f"q{i}"), id=row_id) for i, row_id in enumerate([7, 7, None, None])]
+    file_path = write_dataset(rows)
+    output_dir = str(tmp_path / "out")
+    seen = []
+
+    def evaluate_row(row, idx, *args, **kwargs):
+        seen.append(idx)
+        status = STATUS_ERROR if idx == 3 and len(seen) <= 4 else STATUS_OK
+        return make_record(idx, row.get("id"), status, result={"LLMs_裁决路径": "裁判模型"}), []
+
+    monkeypatch.setattr("processor_threaded.evaluate_row", evaluate_row)
+    for _ in range(2):
+        process_data_multithread(file_path, output_dir, "o3", RULES, thread_num=2, dedup=False, budget=new_budget())
+
+    # 第二次只重跑上次严重错误的第 3 行，id 重复或为空不影响
+    assert sorted(seen[:4]) == [0, 1, 2, 3] and seen[4:] == [3]
+    out_df = pd.read_excel(f"{output_dir}/data_o3_part_allEval.xlsx")
+    assert out_df["LLMs_裁决路径"].tolist() == ["裁判模型"] * 4
+
+
+def test_writer_batches_and_coalesces_by_row(tmp_path):
+    path = str(tmp_path / "r.jsonl")
+    log_path = str(tmp_path / "error.txt")
+    writer = ResultWriter(path, log_file_path=log_path, batch_size=3, flush_interval=60)
+    writer.submit(_ok(0, "负"))
+    writer.submit(_ok(0, "胜"), ["Error at row 0: SBS分析步骤(CoT-Step1)失败\n"])
+    writer.submit(_ok(1))
+    writer.submit(_ok(2))
+    writer.submit(_ok(3))
+    writer.close()
+
+    records = read_journal(path)
+    # 同一批内第 0 行只保留最后一条；凑满 3 行落盘一次，剩余一行在 close 时落盘
+    assert [(r["idx"], r["result"]["大模型A竞品对比"]) for r in records] == [(0, "胜"), (1, "胜"), (2, "胜"), (3, "胜")]
+    assert writer.flushes == 2 and writer.written == 4
+    with open(log_path, encoding="utf-8") as f:
+        assert f.read() == "Error at row 0: SBS分析步骤(CoT-Step1)失败\n"
+
+
+def test_writer_flushes_on_interval_without_close(tmp_path):
+    path = str(tmp_path / "r.jsonl")
+    out_df = pd.DataFrame({"LLMs_自研竞品对比": ["", ""]}, dtype=object)
+    with ResultWriter(path, out_df, batch_size=100, flush_interval=0.05, fingerprint="fp") as writer:
+        writer.submit(_ok(1))
+        deadline = time.time() + 2
+        while not writer.flushes and time.time() < deadline:
+            time.sleep(0.01)
+        assert read_journal(path, "fp")[0]["idx"] == 1
+        assert out_df.loc[1, "LLMs_自研竞品对比"] == "胜"
@@ -0,0 +1,69 @@
+import requests
+
+from utils.retry_policy import RetryPolicy, Outcome, classify_exception, classify_response, parse_retry_after
+from utils.vivo_model import call_model
+
+OK_BODY = {"code": 0, "msg": "success", "data": {"content": "答案"}}
+
+
+def test_classify_response():
+    assert classify_response(200, OK_BODY) == (Outcome.OK, None)
+    assert classify_response(429, "Too Many Requests", {"Retry-After": "3"}) == (Outcome.RATE_LIMIT, 3.0)
+    assert classify_response(200, {"code": 400, "msg": "context_length_exceeded", "data": None})[0] == \
+        Outcome.CONTEXT_LENGTH
+    assert classify_response(502, "<html>An error occurred.</html>")[0] == Outcome.TRANSIENT
+    assert classify_response(401, {"code": 1001, "msg": "签名校验失败"})[0] == Outcome.FATAL
+    # 200 但没有正文：msg 不能当作模型回答
+    assert classify_response(200, {"code": 0, "msg": "success", "data": {"content": ""}})[0] == Outcome.EMPTY
+
+
+def test_answer_text_does_not_trigger_retry():
+    body = {"code": 0, "data": {"content": "遇到 rate limit 或 timeout 时应当重试"}}
+    assert classify_response(200, body)[0] == Outcome.OK
+
+
+def test_classify_exception():
+    assert classify_exception(requests.Timeout()) == Outcome.TRANSIENT
+    assert classify_exception(requests.ConnectionError()) == Outcome.TRANSIENT
+    assert classify_exception(ValueError("not json")) == Outcome.TRANSIENT
+    assert classify_exception(KeyError("data")) == Outcome.FATAL
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after": "1.5"}) == 1.5
+    assert parse_retry_after(None, {"retryAfter": 2}) == 2.0
+    assert parse_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert parse_retry_after({}) is None
+
+
+def test_retry_policy_bounds():
+    policy = RetryPolicy(max_attempts=3, base_delay=1, max_delay=4)
+    assert policy.should_retry(Outcome.TRANSIENT, 2)
+    assert not policy.should_retry(Outcome.TRANSIENT, 3)
+    assert not policy.should_retry(Outcome.CONTEXT_LENGTH, 1)
+    assert all(0 <= policy.backoff(Outcome.TRANSIENT, 5) <= 4 for _ in range(50))
+    # 有 Retry-After 时至少等到提示时间
+    assert all(3 <= policy.backoff(Outcome.RATE_LIMIT, 1, retry_after=3) <= 4 for _ in range(50))
+
+
+def test_call_model_retries_transient_errors_up_to_max_attempts(gateway):
+    gw = gateway(rate_5xx=1.0)
+    result = call_model("你好", "o3", "s")
+    assert result.outcome == Outcome.TRANSIENT and result.attempts == 3
+    assert gw.stats["requests"] == 3
+
+
+def test_call_model_does_not_retry_context_length(gateway):
+    gw = gateway(rate_context=1.0)
+    result = call_model("你好", "o3", "s")
+    assert result.outcome == Outcome.CONTEXT_LENGTH and result.attempts == 1
+    assert gw.stats["requests"] == 1
+
+
+def test_call_model_honours_retry_after_then_succeeds(gateway):
+    gw = gateway(retry_after=0)
+    faults = iter(["rate_limit"])
+    gw.pick_fault = lambda: next(faults, None)
+    result = call_model("你好", "o3", "s")
+    assert result.outcome == Outcome.OK and result.content
+    assert result.attempts == 2 and gw.stats["fault:rate_limit"] == 1
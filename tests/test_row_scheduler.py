@@ -0,0 +1,46 @@
+import json
+
+import pandas as pd
+import pytest
+
+from conftest import make_row
+from row_scheduler import RowCostTracker, estimate_costs, estimate_row_cost, order_rows
+
+
+def _df():
+    return pd.DataFrame([make_row("短"), make_row("很长的问题" * 50), make_row("中等长度" * 10),
+                         make_row("短")])
+
+
+def test_cost_grows_with_dialogue_length_and_knowledge_qa():
+    short, long = make_row("短"), make_row("很长的问题" * 50)
+    assert estimate_row_cost(long) > estimate_row_cost(short)
+    assert estimate_row_cost(dict(short, 度量一级分类="知识问答")) == pytest.approx(1.3 * estimate_row_cost(short))
+
+
+def test_ljf_orders_by_cost_and_keeps_file_order_for_ties(capsys):
+    df = _df()
+    costs = estimate_costs(df)
+    assert order_rows(df, costs, "ljf").index.tolist() == [1, 2, 0, 3]
+    assert "最长作业优先" in capsys.readouterr().out
+    assert order_rows(df, costs, "file").index.tolist() == [0, 1, 2, 3]
+    with pytest.raises(ValueError):
+        order_rows(df, costs, "sjf")
+
+
+def test_tracker_reports_correlation(tmp_path):
+    df = _df()
+    tracker = RowCostTracker(df, estimate_costs(df))
+    for idx, seconds in {0: 1.0, 1: 9.0, 2: 4.0}.items():
+        tracker.record(idx, seconds)
+    n, pearson, spearman = tracker.correlation()
+    assert n == 3 and spearman == 1.0 and pearson > 0.9
+    with open(tracker.dump(str(tmp_path)), encoding="utf-8") as f:
+        assert json.load(f)["rows"] == 3
+
+
+def test_tracker_needs_enough_samples():
+    df = _df()
+    tracker = RowCostTracker(df, estimate_costs(df))
+    tracker.record(0, 1.0)
+    assert tracker.correlation() == (1, None, None)
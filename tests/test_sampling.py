@@ -0,0 +1,83 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import make_row
+from sampling import METRICS, STRATUM_COL, StratifiedSampler, run_sampling, wilson_interval
+
+LABELS = {"标注员_竞品满意度": 1, "标注员_小v优质弱智": "合格", "标注员_竞品优质弱智": "合格",
+          "标注员_小v竞品对比": "平", "标注员_竞品竞品对比": "平"}
+
+
+def _df(sizes):
+    rows = [dict(make_row(f"{dim}{i}", dimension=dim), **LABELS) for dim, n in sizes.items() for i in range(n)]
+    return pd.DataFrame(rows)
+
+
+def _scores(df, idxs, value=1.0):
+    scores = pd.DataFrame({metric: value for metric in METRICS}, index=idxs)
+    scores.insert(0, STRATUM_COL, df.loc[idxs, STRATUM_COL])
+    return scores
+
+
+def test_wilson_interval():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    low, high = wilson_interval(50, 100)
+    assert low == pytest.approx(0.4038, abs=1e-3) and high == pytest.approx(0.5962, abs=1e-3)
+    assert wilson_interval(0, 10)[0] == 0.0 and wilson_interval(10, 10)[1] == 1.0
+    wide, narrow = wilson_interval(8, 10), wilson_interval(80, 100)
+    assert narrow[1] - narrow[0] < wide[1] - wide[0]
+
+
+def test_first_batch_draws_initial_rows_per_stratum_reproducibly():
+    df = _df({"闲聊": 50, "知识问答": 20})
+    batch = StratifiedSampler(df, initial=10, seed=1).next_batch()
+    assert len(batch) == 20 and len(set(batch)) == 20
+    assert df.loc[batch, STRATUM_COL].value_counts().to_dict() == {"闲聊": 10, "知识问答": 10}
+    assert StratifiedSampler(df, initial=10, seed=1).next_batch() == batch
+
+
+def test_strata_stop_when_converged_or_exhausted():
+    df = _df({"闲聊": 200, "知识问答": 12})
+    sampler = StratifiedSampler(df, width=0.2, initial=10, seed=0)
+    first = sampler.next_batch()
+    # 闲聊 10 行全部一致：区间仍宽于目标，按 1/√n 预估继续抽样；知识问答只剩 2 行
+    second = sampler.next_batch(_scores(df, first))
+    assert sampler.stopped == {}
+    assert df.loc[second, STRATUM_COL].value_counts()["知识问答"] == 2
+    assert df.loc[second, STRATUM_COL].value_counts()["闲聊"] > 5
+
+    assert sampler.next_batch(_scores(df, first + second)) == []
+    assert sampler.stopped == {"闲聊": "已收敛", "知识问答": "已抽完"}
+
+
+def test_overall_rate_is_weighted_by_stratum_size():
+    df = _df({"闲聊": 60, "知识问答": 20})
+    sampler = StratifiedSampler(df, initial=10)
+    batch = sampler.next_batch()
+    scores = _scores(df, batch)
+    scores.loc[df.loc[batch, STRATUM_COL] == "知识问答", list(METRICS)] = 0.0
+    overall = sampler.overall(sampler.update(scores))
+    assert overall["胜出率"]["rate"] == pytest.approx(0.75)
+
+
+def test_run_sampling_stops_early_when_rates_converge(write_dataset, tmp_path):
+    file_path = write_dataset(_df({"闲聊": 300}).to_dict("records"))
+    evaluated = []
+
+    def evaluate(round_file, sampling_dir):
+        # 模拟评测：模型结果与人工标注完全一致
+        df = pd.read_excel(round_file)
+        evaluated.append(len(df))
+        df["LLMs_自研满意度"], df["LLMs_竞品满意度"] = df["标注员_小v满意度"], df["标注员_竞品满意度"]
+        df["LLMs_自研优质弱智"], df["LLMs_竞品优质弱智"] = df["标注员_小v优质弱智"], df["标注员_竞品优质弱智"]
+        df["LLMs_自研竞品对比"], df["LLMs_竞品竞品对比"] = df["标注员_小v竞品对比"], df["标注员_竞品竞品对比"]
+        name = os.path.basename(round_file).replace(".xlsx", "_o3_part_allEval.xlsx")
+        df.to_excel(os.path.join(sampling_dir, name), index=False)
+
+    output_file, summary = run_sampling(file_path, str(tmp_path / "out"), "o3", evaluate, width=0.1, initial=30)
+    assert summary["strata"]["闲聊"]["status"] == "已收敛"
+    assert summary["evaluated"] == sum(evaluated) < 300
+    assert summary["overall"]["合格率"]["rate"] == 1.0
+    assert len(pd.read_excel(output_file)) == sum(evaluated)
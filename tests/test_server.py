@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from conftest import make_row
+import server as server_module
+from server import EvalServer, Job, make_handler
+from utils.budget import get_budget
+from utils.retry_policy import Outcome
+from utils.telemetry import CallResult
+
+
+@pytest.fixture
+def eval_server(monkeypatch):
+    monkeypatch.setattr(server_module, "load_rules", lambda: {})
+    server = EvalServer(max_jobs=1, cache_mode="off")
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def http_url(eval_server):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(eval_server))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def _post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.mark.parametrize("payload", [
+    {"dataset": "x.xlsx", "threads": None},
+    {"dataset": "x.xlsx", "threads": "many"},
+    {"dataset": "x.xlsx", "max_calls": "10"},
+    ["x.xlsx"],
+])
+def test_invalid_job_params_return_400(http_url, payload):
+    status, body = _post(f"{http_url}/jobs", payload)
+    assert status == 400
+    assert body["error"]
+
+
+def test_threads_error_names_the_parameter(eval_server):
+    with pytest.raises(ValueError, match="threads"):
+        eval_server.submit({"dataset": "x.xlsx", "threads": None})
+
+
+def test_job_calls_including_reflection_are_charged_to_job_budget(eval_server, monkeypatch, tmp_path):
+    seen = []
+
+    def learn_guidelines(rules, model, golden, **kwargs):
+        get_budget().charge("reflection", CallResult(model=model, outcome=Outcome.OK, total_tokens=100, attempts=1))
+        return "无"
+
+    def evaluate_dataset(*args, budget=None, **kwargs):
+        seen.append((budget, get_budget()))
+
+    monkeypatch.setattr(server_module, "learn_guidelines", learn_guidelines)
+    monkeypatch.setattr(server_module, "evaluate_dataset", evaluate_dataset)
+    monkeypatch.setattr(server_module, "finalize_outputs", lambda *args, **kwargs: None)
+    monkeypatch.setattr(server_module, "resolve_paths", lambda *args: ("in.xlsx", "", str(tmp_path), "out.xlsx"))
+    monkeypatch.setattr(eval_server, "_warm_up", lambda *args: None)
+    global_tokens = get_budget().snapshot()["usage"].get("run", {}).get("tokens", 0)
+
+    job = Job("x.xlsx", "o3", "v")
+    eval_server._run(job)
+
+    assert job.error is None
+    assert seen == [(job.budget, job.budget)]
+    assert job.budget.snapshot()["usage"]["run"]["tokens"] == 100
+    assert get_budget().snapshot()["usage"].get("run", {}).get("tokens", 0) == global_tokens
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_job_lifecycle_over_http(eval_server, http_url, monkeypatch, write_dataset, tmp_path):
+    file_path = write_dataset([make_row()])
+    release = threading.Event()
+    learned = []
+
+    def learn_guidelines(rules, model, golden, **kwargs):
+        learned.append(model)
+        return "无"
+
+    def evaluate_dataset(*args, on_progress=None, **kwargs):
+        on_progress(0, 1)
+        release.wait(5)
+        on_progress(1, 1)
+
+    monkeypatch.setattr(server_module, "learn_guidelines", learn_guidelines)
+    monkeypatch.setattr(server_module, "evaluate_dataset", evaluate_dataset)
+    monkeypatch.setattr(server_module, "finalize_outputs", lambda *args, **kwargs: None)
+    monkeypatch.setattr(server_module, "resolve_paths",
+                        lambda dataset, model, version: (file_path, "", str(tmp_path / version), "final.xlsx"))
+    monkeypatch.setattr(eval_server, "_warm_up", lambda *args: None)
+
+    status, job = _post(f"{http_url}/jobs", {"dataset": "data.xlsx", "version": "v1", "threads": 2})
+    assert status == 202 and job["status"] in ("queued", "running")
+    # 同一数据集、模型与版本不能同时跑两个
+    status, body = _post(f"{http_url}/jobs", {"dataset": "data.xlsx", "version": "v1"})
+    assert status == 400 and job["id"] in body["error"]
+
+    release.set()
+    deadline = time.time() + 5
+    while _get(f"{http_url}/jobs/{job['id']}")[1]["status"] != "done" and time.time() < deadline:
+        time.sleep(0.01)
+    status, body = _get(f"{http_url}/jobs/{job['id']}")
+    assert status == 200 and body["status"] == "done" and body["done"] == body["total"] == 1
+
+    # 第二个任务复用已学习的指南
+    status, second = _post(f"{http_url}/jobs", {"dataset": "data.xlsx", "version": "v2"})
+    assert status == 202
+    while _get(f"{http_url}/jobs/{second['id']}")[1]["status"] != "done" and time.time() < deadline:
+        time.sleep(0.01)
+    assert learned == ["o3"]
+    assert _get(f"{http_url}/health")[1]["learned_models"] == ["o3"]
+    assert _get(f"{http_url}/jobs/missing")[0] == 404
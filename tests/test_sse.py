@@ -0,0 +1,66 @@
+import json
+
+from utils.retry_policy import Outcome
+from utils.sse import DONE, JSONObjectDetector, SSEDecoder, extract_delta
+from utils.vivo_model import stream_deltas, stream_until_json
+
+
+def test_decoder_reassembles_multibyte_characters_split_across_chunks():
+    raw = 'data: {"data": {"content": "中文"}}\n\ndata: [DONE]\n\n'.encode("utf-8")
+    decoder = SSEDecoder()
+    events = []
+    for i in range(len(raw)):
+        events.extend(decoder.feed(raw[i:i + 1]))
+    assert events == [(None, '{"data": {"content": "中文"}}'), DONE]
+    assert decoder.closed
+
+
+def test_decoder_handles_event_names_comments_and_close():
+    decoder = SSEDecoder()
+    events = decoder.feed(b": keep-alive\r\nevent: delta\r\ndata: x\r\n\r\ndata: y\nevent: close\ndata: z\n")
+    assert events == [("delta", "x"), (None, "y"), DONE]
+
+
+def test_decoder_flushes_last_line_without_newline():
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: tail") == []
+    assert decoder.flush() == [(None, "tail")]
+
+
+def test_json_detector_ignores_braces_inside_strings():
+    detector = JSONObjectDetector()
+    assert detector.feed('思考中... {"理由": "含有 } 和 \\" 的') is None
+    assert detector.feed('文本", "嵌套": {"a": 1}} 之后的内容') == '{"理由": "含有 } 和 \\" 的文本", "嵌套": {"a": 1}}'
+    assert json.loads(detector.result)["嵌套"] == {"a": 1}
+
+
+def test_extract_delta_formats():
+    assert extract_delta('{"data": {"content": "a"}}')[0] == "a"
+    assert extract_delta('{"content": "b"}')[0] == "b"
+    assert extract_delta('{"choices": [{"delta": {"content": "c"}}]}')[0] == "c"
+    assert extract_delta("plain text") == ("plain text", None)
+
+
+def test_stream_deltas_concatenate_to_the_full_answer(gateway):
+    gw = gateway(stream_chunk=3, stream_interval=0)
+    gw.content_for = lambda data, shape: "流式返回的完整答案"
+    assert "".join(stream_deltas("你好", "o3", "s")) == "流式返回的完整答案"
+    assert gw.stats["stream"] == 1
+
+
+def test_stream_until_json_returns_as_soon_as_object_closes(gateway):
+    gw = gateway(stream_chunk=4, stream_interval=0.01)
+    gw.content_for = lambda data, shape: '推理过程 {"大模型A竞品对比": "胜"} ' + "后续不需要的内容" * 50
+    seen = []
+    result = stream_until_json("你好", "o3", "s", on_json=seen.append)
+    assert result.outcome == Outcome.OK and result.attempts == 1
+    assert result.content == '{"大模型A竞品对比": "胜"}' and seen == [result.content]
+    # 远早于流发完（约 100 个分块 × 0.01s）就返回
+    assert result.latency < 0.5
+
+
+def test_stream_until_json_without_object_is_empty(gateway):
+    gw = gateway(stream_interval=0)
+    gw.content_for = lambda data, shape: "没有 JSON 的回答"
+    result = stream_until_json("你好", "o3", "s")
+    assert result.outcome == Outcome.EMPTY and result.content == "没有 JSON 的回答"
@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import RULES, make_row
+from processor_threaded import process_data_multithread
+from utils.budget import new_budget
+from utils.stage_cache import StageCache, init_stage_cache, rules_fingerprint, single_stage_key
+
+
+@pytest.fixture
+def stage_cache(tmp_path):
+    cache = init_stage_cache("rw", path=str(tmp_path / "stage_cache.sqlite"))
+    yield cache
+    init_stage_cache("off")
+
+
+def test_key_depends_on_rules_and_one_side_of_the_dialogue():
+    fp = rules_fingerprint(RULES)
+    key = single_stage_key("o3", fp, "闲聊", "2025年1月", "历史", "回答")
+    assert key == single_stage_key("o3", fp, "闲聊", "2025年1月", "历史", "回答")
+    assert key != single_stage_key("o3", fp, "闲聊", "2025年1月", "历史", "新回答")
+    assert key != single_stage_key("o3", rules_fingerprint(dict(RULES, learned_guidelines="新指南")),
+                                   "闲聊", "2025年1月", "历史", "回答")
+
+
+def test_replay_mode_and_empty_results_are_not_written(tmp_path):
+    path = str(tmp_path / "s.sqlite")
+    StageCache(path).put("k", "o3", "single_b", {})
+    replay = StageCache(path, mode="replay")
+    replay.put("k2", "o3", "single_b", {"主要问题": "13无问题"})
+    assert not replay.contains("k") and not replay.contains("k2")
+
+
+def _run(write_dataset, tmp_path, name, answers_a, rules=RULES):
+    file_path = write_dataset([make_row(f"q{i}", answer_a=a, answer_b=f"b{i}") for i, a in enumerate(answers_a)],
+                              name=name)
+    process_data_multithread(file_path, str(tmp_path / "out"), "o3", rules, thread_num=2, dedup=False,
+                             budget=new_budget())
+
+
+def test_unchanged_competitor_labels_are_reused_across_versions(stage_cache, gateway, write_dataset, tmp_path):
+    gw = gateway()
+    _run(write_dataset, tmp_path, "v1.xlsx", ["a0", "a1"])
+    assert gw.stats["requests"] == 8 and stage_cache.latest_fingerprint("o3") == rules_fingerprint(RULES)
+
+    # 新版本只改了自研回答：竞品一侧的 single_b 直接复用
+    _run(write_dataset, tmp_path, "v2.xlsx", ["新a0", "新a1"])
+    assert gw.stats["requests"] == 8 + 6
+    assert stage_cache.hits == 2
+
+    # 规则变化后缓存自然失效
+    _run(write_dataset, tmp_path, "v3.xlsx", ["新a0", "新a1"], rules=dict(RULES, learned_guidelines="新指南"))
+    assert gw.stats["requests"] == 8 + 6 + 8
@@ -0,0 +1,95 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from utils.stage_graph import StageGraph
+
+_var = contextvars.ContextVar("stage_graph_test", default=None)
+
+
+def _row_graph(a, b, c):
+    return (StageGraph()
+            .add("single_a", a)
+            .add("single_b", b)
+            .add("sbs_analysis", c)
+            .add("final_judgment", lambda single_a, single_b, sbs_analysis: single_a + single_b + sbs_analysis,
+                 deps=("single_a", "single_b", "sbs_analysis")))
+
+
+def test_independent_stages_run_concurrently():
+    def slow(value):
+        def fn():
+            time.sleep(0.2)
+            return value
+        return fn
+
+    graph = _row_graph(slow("a"), slow("b"), slow("c"))
+    start = time.time()
+    results, errors = graph.run()
+    assert results["final_judgment"] == "abc" and errors == {}
+    assert time.time() - start < 0.5
+    assert graph.width == 3
+
+
+def test_undefined_dependency_is_rejected():
+    with pytest.raises(ValueError):
+        StageGraph().add("final_judgment", lambda single_a: single_a, deps=("single_a",))
+
+
+def test_fallback_keeps_the_row_and_records_the_error():
+    def fail():
+        raise RuntimeError("bad json")
+
+    graph = (StageGraph()
+             .add("sbs_analysis", fail, fallback={})
+             .add("final_judgment", lambda sbs_analysis: sbs_analysis, deps=("sbs_analysis",)))
+    results, errors = graph.run()
+    assert results == {"sbs_analysis": {}, "final_judgment": {}}
+    assert isinstance(errors["sbs_analysis"], RuntimeError)
+
+
+def test_required_stage_failure_raises():
+    def fail():
+        raise RuntimeError("bad json")
+
+    with pytest.raises(RuntimeError):
+        _row_graph(fail, lambda: "b", lambda: "c").run()
+
+
+def test_stages_see_the_callers_context():
+    seen = []
+    _var.set("budget-of-this-job")
+    StageGraph().add("single_a", lambda: seen.append((_var.get(), threading.current_thread().name))).run()
+    assert seen[0][0] == "budget-of-this-job" and seen[0][1].startswith("stage")
+
+
+def test_run_async_accepts_coroutines_and_cancels_on_failure():
+    cancelled = []
+
+    async def value(v):
+        await asyncio.sleep(0.01)
+        return v
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def fail():
+        raise RuntimeError("bad json")
+
+    results, _ = asyncio.run(_row_graph(lambda: value("a"), lambda: "b", lambda: value("c")).run_async())
+    assert results["final_judgment"] == "abc"
+
+    async def run_failing():
+        with pytest.raises(RuntimeError):
+            await _row_graph(fail, slow, lambda: "c").run_async()
+        await asyncio.sleep(0)
+
+    asyncio.run(run_failing())
+    assert cancelled == [1]
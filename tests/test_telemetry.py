@@ -0,0 +1,40 @@
+import json
+
+import evaluation
+from utils.retry_policy import Outcome
+from utils.telemetry import CallResult, CallStats, get_call_stats
+
+
+def test_fallback_counts_as_ok():
+    assert CallResult(outcome=Outcome.OK).ok and CallResult(outcome=Outcome.FALLBACK).ok
+    assert not CallResult(outcome=Outcome.EMPTY).ok and not CallResult().ok
+
+
+def test_call_stats_aggregate_per_stage(tmp_path):
+    stats = CallStats()
+    stats.record("single_a", CallResult(outcome=Outcome.OK, attempts=2, total_tokens=30, latency=1.0))
+    stats.record("single_a", CallResult(outcome=Outcome.TRANSIENT, attempts=3, latency=3.0))
+    stats.record("single_a", CallResult(outcome=Outcome.OK, cached=True, total_tokens=30))
+    stats.record(None, CallResult(outcome=Outcome.OK))
+
+    snapshot = stats.snapshot()
+    st = snapshot["single_a"]
+    assert (st["calls"], st["cached"], st["failed"], st["attempts"]) == (3, 1, 1, 5)
+    assert st["total_tokens"] == 60 and st["max_latency"] == 3.0
+    # 平均耗时只按真实调用计算
+    assert st["avg_latency"] == 2.0
+    assert snapshot["other"]["calls"] == 1
+
+    path = stats.dump(str(tmp_path))
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == snapshot
+
+
+def test_gateway_call_records_usage_latency_and_attempts(gateway):
+    gateway()
+    before = get_call_stats().snapshot().get("telemetry_test", {}).get("calls", 0)
+    result = evaluation.test_result("你好", "o3", stage="telemetry_test")
+    assert result.outcome == Outcome.OK and result.attempts == 1 and result.latency > 0
+    assert result.total_tokens == result.prompt_tokens + result.completion_tokens > 0
+    st = get_call_stats().snapshot()["telemetry_test"]
+    assert st["calls"] == before + 1 and st["total_tokens"] >= result.total_tokens
@@ -0,0 +1,128 @@
+import os
+import threading
+
+import pandas as pd
+
+from conftest import make_row
+from result_journal import STATUS_ERROR, STATUS_OK, make_record
+from utils.budget import new_budget
+from work_store import STATUS_DONE, STATUS_LEASED, STATUS_PENDING, WorkStore, run_coordinator, run_worker
+
+
+def _store(tmp_path):
+    return WorkStore(str(tmp_path / "work_store.sqlite"))
+
+
+def test_run_coordinator_accepts_run_budget(tmp_path, write_dataset):
+    # main.py --role coordinator 传入本次运行的预算；所有行已完成时直接物化结果
+    file_path = write_dataset([make_row("q0"), make_row("q1")])
+    store = _store(tmp_path)
+    store.create_job("job", {}, {0: 0.0, 1: -1.0})
+    for idx in store.lease("job", "w", 2):
+        store.complete("job", idx, make_record(idx, idx, STATUS_OK, result={"LLMs_裁决路径": "裁判模型"}))
+
+    budget = new_budget()
+    output_dir = str(tmp_path / "out")
+    path = run_coordinator(store, "job", file_path, output_dir, "o3", {}, poll_interval=0, budget=budget)
+
+    out_df = pd.read_excel(path)
+    assert out_df["LLMs_裁决路径"].tolist() == ["裁判模型", "裁判模型"]
+    assert os.path.exists(os.path.join(output_dir, "budget_coordinator.json"))
+    store.close()
+
+
+def test_lease_orders_by_priority_and_expired_leases_are_released(tmp_path):
+    store = _store(tmp_path)
+    store.create_job("job", {}, {0: 0.0, 1: 5.0, 2: 1.0})
+    assert store.lease("job", "a", 2, ttl=60) == [1, 2]
+    # 租约过期的行可以被其他 worker 重新租用
+    assert store.lease("job", "b", 5, ttl=-1) == [0]
+    assert store.lease("job", "c", 5, ttl=60) == [0]
+    counts = store.progress("job")
+    assert counts[STATUS_LEASED] == 3 and counts[STATUS_PENDING] == 0
+    assert counts["retried"] == 1
+    store.close()
+
+
+def test_run_worker_starts_budget_with_job_rows(tmp_path, write_dataset, monkeypatch, capsys):
+    file_path = write_dataset([make_row(f"q{i}") for i in range(3)])
+    store = _store(tmp_path)
+    store.create_job("job", {}, {0: 0.0, 1: 0.0, 2: 0.0})
+    monkeypatch.setattr("work_store.evaluate_row",
+                        lambda row, idx, *args, **kwargs: (make_record(idx, idx, STATUS_OK, result={}), []))
+    budget = new_budget()
+    budget.project_after = 2
+
+    done = run_worker(store, "job", file_path, str(tmp_path / "out"), "o3", thread_num=2, worker_id="w",
+                      poll_interval=0.01, budget=budget)
+
+    assert done == 3
+    assert store.progress("job")[STATUS_DONE] == 3
+    out = capsys.readouterr().out
+    assert "/3 行" in out and "/0 行" not in out
+    store.close()
+
+
+def test_error_rows_are_requeued_up_to_max_attempts(tmp_path):
+    store = _store(tmp_path)
+    store.create_job("job", {}, {0: 0.0})
+    error = make_record(0, 0, STATUS_ERROR, reason="未知严重错误")
+    for _ in range(2):
+        assert store.lease("job", "w", 1) == [0]
+        assert store.complete("job", 0, error, max_attempts=3) is False
+        assert store.progress("job")[STATUS_PENDING] == 1
+    # 第三次仍然失败：不再放回，作为剔除行完成
+    assert store.lease("job", "w", 1) == [0]
+    assert store.complete("job", 0, error, max_attempts=3) is True
+    assert store.progress("job")[STATUS_DONE] == 1 and store.lease("job", "w", 1) == []
+    store.close()
+
+
+def test_late_error_does_not_overwrite_a_done_row(tmp_path):
+    store = _store(tmp_path)
+    store.create_job("job", {}, {0: 0.0})
+    store.lease("job", "slow", 1, ttl=-1)
+    store.lease("job", "fast", 1)
+    store.complete("job", 0, make_record(0, 0, STATUS_OK, result={}))
+    assert store.complete("job", 0, make_record(0, 0, STATUS_ERROR, reason="超时")) is True
+    assert store.records("job")[0][0]["status"] == STATUS_OK
+    store.close()
+
+
+def test_release_returns_unfinished_leases(tmp_path):
+    store = _store(tmp_path)
+    store.create_job("job", {}, {0: 0.0, 1: 0.0})
+    store.lease("job", "a", 2)
+    store.release("job", "b", [0, 1])
+    assert store.progress("job")[STATUS_LEASED] == 2
+    store.release("job", "a", [0, 1])
+    assert store.lease("job", "c", 5) == [0, 1]
+    store.close()
+
+
+def test_concurrent_workers_evaluate_each_row_once(tmp_path, write_dataset, monkeypatch):
+    file_path = write_dataset([make_row(f"q{i}") for i in range(12)])
+    path = str(tmp_path / "work_store.sqlite")
+    WorkStore(path).create_job("job", {}, {i: 0.0 for i in range(12)})
+    evaluated = []
+    lock = threading.Lock()
+
+    def evaluate_row(row, idx, *args, **kwargs):
+        with lock:
+            evaluated.append(idx)
+        return make_record(idx, idx, STATUS_OK, result={}), []
+
+    monkeypatch.setattr("work_store.evaluate_row", evaluate_row)
+
+    def worker(name):
+        store = WorkStore(path)
+        run_worker(store, "job", file_path, str(tmp_path / "out"), "o3", thread_num=2, worker_id=name,
+                   poll_interval=0.01, budget=new_budget())
+        store.close()
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(evaluated) == list(range(12))
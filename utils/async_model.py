@@ -0,0 +1,122 @@
+"""
+vivo_GPT 的 asyncio 版本
+核心：
+  • 单个事件循环上可同时挂起数百个 LLM 请求，不再为每个在途请求占用一个线程
+  • 请求组装、响应分类、重试退避、按模型限流均与同步版 vivo_model 共用同一套逻辑
+  • 依赖 aiohttp（可选依赖，仅异步模式需要）
+"""
+
+import asyncio
+import time
+import traceback
+from typing import Optional
+
+try:
+    import aiohttp
+except ImportError:  # 同步流程不依赖 aiohttp
+    aiohttp = None
+
+import utils.BizLogger as BizLogger
+from utils.hedging import get_hedger
+from utils.rate_limiter import get_limiter
+from utils.retry_policy import Outcome, classify_response, describe_outcome, get_retry_policy
+from utils.telemetry import CallResult
+from utils.vivo_model import (build_request, extract_content, extract_usage, finish_route, print_request_info,
+                              print_response_info, route_model)
+
+DEFAULT_CONCURRENCY = 200
+
+_session: Optional["aiohttp.ClientSession"] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_async_session(limit: int = DEFAULT_CONCURRENCY) -> "aiohttp.ClientSession":
+    """当前事件循环共享的 ClientSession（keep-alive 连接池，上限 limit 条连接）"""
+    global _session, _session_loop
+    if aiohttp is None:
+        raise ImportError("异步模式需要安装 aiohttp：pip install aiohttp")
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit, keepalive_timeout=60)
+        _session = aiohttp.ClientSession(connector=connector)
+        _session_loop = loop
+    return _session
+
+
+async def close_async_session():
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session, _session_loop = None, None
+
+
+async def _async_send_with_retry(session, limiter, url, data, headers, params, timeout):
+    """与 vivo_model._send_with_retry 相同的分类与退避规则，等待期间让出事件循环"""
+    policy = get_retry_policy()
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    attempt = 0
+    while True:
+        attempt += 1
+        retry_after = None
+        start = time.time()
+        try:
+            async with limiter.async_acquire():
+                start = time.time()
+                async with session.post(url, json=data, headers=headers, params=params,
+                                        timeout=client_timeout) as response:
+                    if response.status == 200:
+                        res = await response.json(content_type=None)
+                    else:
+                        res = await response.text()
+                    outcome, retry_after = classify_response(response.status, res, response.headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"请求异常: {type(e).__name__}: {e}")
+            res = ""
+            outcome = Outcome.TRANSIENT
+        limiter.record(outcome, time.time() - start)
+        if not policy.should_retry(outcome, attempt):
+            if outcome != Outcome.OK:
+                print(f"请求失败（{describe_outcome(outcome)}），共尝试 {attempt} 次")
+            return res, outcome, attempt
+        delay = policy.backoff(outcome, attempt, retry_after)
+        print(f"检测到{describe_outcome(outcome)}，{delay:.1f}s 后进行第 {attempt} 次重试...")
+        await asyncio.sleep(delay)
+
+
+async def _async_call_once(prompt, model, sessionId, verbose=False, show_prompts=False):
+    url, data, headers, params, domain = build_request(prompt, model, sessionId)
+    print_request_info(prompt, model, sessionId, data, verbose, show_prompts)
+
+    session = get_async_session()
+    limiter = get_limiter(model, domain)
+
+    result = CallResult(model=model)
+    start = time.time()
+    try:
+        res, result.outcome, result.attempts = await _async_send_with_retry(session, limiter, url, data, headers,
+                                                                            params, timeout=1200)
+        BizLogger.log_info("vivo_model 请求结果:{}".format(res))
+        # 空响应时网关只有 msg，不作为正文返回
+        result.content = "" if result.outcome == Outcome.EMPTY else extract_content(res)
+        result.prompt_tokens, result.completion_tokens, result.total_tokens = extract_usage(res)
+        print_response_info(result.content, show_prompts)
+    except Exception:
+        print(traceback.print_exc())
+    result.latency = time.time() - start
+    return result
+
+
+async def async_call_model(prompt, model, sessionId, verbose=False, show_prompts=False):
+    """与 vivo_model.call_model 相同，返回 CallResult；对冲时落后的请求会被取消"""
+    target = route_model(model)
+    if target is None:
+        return CallResult(model=model, outcome=Outcome.CIRCUIT_OPEN)
+    result = await get_hedger().run_async(
+        target, lambda: _async_call_once(prompt, target, sessionId, verbose, show_prompts)
+    )
+    return finish_route(model, target, result)
+
+
+async def async_vivo_GPT(prompt, model, sessionId, verbose=False, show_prompts=False):
+    result = await async_call_model(prompt, model, sessionId, verbose=verbose, show_prompts=show_prompts)
+    return result.content
@@ -15,7 +15,7 @@ import urllib.parse
 #
 # sys.path.append("../../../")
 
-__all__ = ['gen_sign_headers']
+__all__ = ['gen_sign_headers', 'verify_sign_headers']
 
 
 # 随机字符串
@@ -70,4 +70,31 @@ def gen_sign_headers(app_id, app_key, method, uri, query):
         'X-AI-GATEWAY-NONCE': nonce,
         'X-AI-GATEWAY-SIGNED-HEADERS': "x-ai-gateway-app-id;x-ai-gateway-timestamp;x-ai-gateway-nonce",
         'X-AI-GATEWAY-SIGNATURE': signature
-    }
\ No newline at end of file
+    }
+
+
+# 校验签名头（本地模拟网关 mock_gateway.py 使用），返回 (是否通过, 失败原因)
+def verify_sign_headers(app_id, app_key, method, uri, query, headers, max_skew=300):
+    headers = {str(k).lower(): v for k, v in headers.items()}
+    if headers.get('x-ai-gateway-app-id') != str(app_id):
+        return False, 'app id 不匹配'
+    timestamp = headers.get('x-ai-gateway-timestamp', '')
+    nonce = headers.get('x-ai-gateway-nonce', '')
+    try:
+        skew = abs(time.time() - int(timestamp))
+    except ValueError:
+        return False, '时间戳格式错误'
+    if max_skew and skew > max_skew:
+        return False, '时间戳已过期'
+    signed_headers_string = 'x-ai-gateway-app-id:{}\nx-ai-gateway-timestamp:{}\n' \
+                            'x-ai-gateway-nonce:{}'.format(app_id, timestamp, nonce)
+    signing_string = '{}\n{}\n{}\n{}\n{}\n{}'.format(str(method).upper(),
+                                                     uri,
+                                                     gen_canonical_query_string(query),
+                                                     app_id,
+                                                     timestamp,
+                                                     signed_headers_string)
+    expected = gen_signature(app_key, signing_string.encode('utf-8'))
+    if not hmac.compare_digest(expected, headers.get('x-ai-gateway-signature', '')):
+        return False, '签名不匹配'
+    return True, ''
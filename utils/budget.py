@@ -0,0 +1,193 @@
+"""
+单次评测的 token / 调用次数 / 费用预算
+核心：
+  • 每次真实调用（缓存命中不计）按网关 usage 块的 totalTokens 记账，按运行整体与阶段分别累计；
+    流式调用拿不到 usage 时按字符数估算（CHARS_PER_TOKEN）
+  • 软上限：超过时打印一次警告；硬上限：超过后不再调度新行，已在评测的行照常完成，
+    评测结束后抛出 BudgetExceeded —— 结果日志中未完成的行在下次运行时续跑
+  • 完成 project_after 行后按已完成行的平均用量打印整次运行的预计用量，预计超出硬上限时提前提示
+  • 每次评测（main.py 的一次运行、server.py 的一个任务、work_store 的一个 worker）使用各自的 Budget，
+    由 use_budget 绑定到当前上下文，评测流程中的 get_budget() 取到的是本次评测的预算；
+    未绑定时退回全局预算（init_budget）
+  • 费用按模型配置中的 price（每千 token 单价，区分 prompt / completion）计算，未配置单价的模型不计费用
+
+配置（config/model.yaml，可省略；也可用 main.py --max-tokens / --max-calls / --max-cost 设置整体硬上限）：
+  budget:
+    max_tokens: 5000000
+    soft_tokens: 4000000
+    max_calls: 20000
+    max_cost: 300
+    project_after: 20
+    stages:
+      final_judgment:
+        max_calls: 5000
+  model:
+    o3:
+      price: {prompt: 0.01, completion: 0.04}
+"""
+
+import contextvars
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from config.config import config
+from utils.telemetry import CallResult
+
+METRICS = ("tokens", "calls", "cost")
+RUN_SCOPE = "run"
+
+# 拿不到 usage 时的估算：中文为主的提示词大约每 1.5 个字符 1 个 token
+CHARS_PER_TOKEN = 1.5
+
+
+class BudgetExceeded(Exception):
+    """预算硬上限已触发；已完成的结果已落盘，重新运行即可续跑"""
+
+
+class Budget:
+    def __init__(self, limits: Optional[dict] = None, stage_limits: Optional[Dict[str, dict]] = None,
+                 project_after: int = 20):
+        self.limits = {RUN_SCOPE: dict(limits or {})}
+        self.limits.update({stage: dict(lim or {}) for stage, lim in (stage_limits or {}).items()})
+        self.project_after = project_after
+        self.exceeded: Optional[str] = None
+        self._usage: Dict[str, Dict[str, float]] = {}
+        self._warned = set()
+        self._total_rows = 0
+        self._rows_done = 0
+        self._projected = False
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.exceeded is not None
+
+    # ---------- 记账 ----------
+    @staticmethod
+    def _cost(result: CallResult) -> float:
+        price = config["model"].get(result.model, {}).get("price") or {}
+        return (result.prompt_tokens * price.get("prompt", 0)
+                + result.completion_tokens * price.get("completion", 0)) / 1000
+
+    def charge(self, stage: Optional[str], result: CallResult, prompt_chars: int = 0):
+        """记一次调用；缓存命中或未真正发出请求的调用不计"""
+        if result.cached or result.attempts == 0:
+            return
+        tokens = result.total_tokens or int((prompt_chars + len(result.content or "")) / CHARS_PER_TOKEN)
+        cost = self._cost(result)
+        with self._lock:
+            for scope in (RUN_SCOPE, stage or "other"):
+                usage = self._usage.setdefault(scope, dict.fromkeys(METRICS, 0))
+                usage["tokens"] += tokens
+                usage["calls"] += 1
+                usage["cost"] += cost
+                self._check(scope, usage)
+
+    def _check(self, scope: str, usage: dict):
+        limits = self.limits.get(scope) or {}
+        name = "整体" if scope == RUN_SCOPE else f"阶段 {scope}"
+        for metric in METRICS:
+            hard, soft = limits.get(f"max_{metric}"), limits.get(f"soft_{metric}")
+            if hard and usage[metric] >= hard and self.exceeded is None:
+                self.exceeded = f"{name} {metric} 已用 {usage[metric]:g}，达到硬上限 {hard:g}"
+                print(f"[预算] {self.exceeded}：不再调度新行，在评测的行完成后停止")
+            elif soft and usage[metric] >= soft and (scope, metric) not in self._warned:
+                self._warned.add((scope, metric))
+                print(f"[预算] 警告：{name} {metric} 已用 {usage[metric]:g}，超过软上限 {soft:g}")
+
+    # ---------- 预计用量 ----------
+    def start(self, total_rows: int):
+        """评测开始时调用；total_rows 为本次需要调度的行数"""
+        with self._lock:
+            self._total_rows = total_rows
+            self._rows_done = 0
+            self._projected = False
+
+    def row_done(self):
+        with self._lock:
+            self._rows_done += 1
+            # 没有调用 start（不知道总行数）时不做预计
+            if self._projected or not self._total_rows \
+                    or self._rows_done < min(self.project_after, self._total_rows):
+                return
+            self._projected = True
+            usage = dict(self._usage.get(RUN_SCOPE) or dict.fromkeys(METRICS, 0))
+            rows_done, total_rows = self._rows_done, self._total_rows
+        scale = total_rows / rows_done
+        projected = {metric: usage[metric] * scale for metric in METRICS}
+        print(f"[预算] 已完成 {rows_done}/{total_rows} 行，预计本次共 {projected['tokens']:.0f} tokens、"
+              f"{projected['calls']:.0f} 次调用、费用 {projected['cost']:.2f}")
+        for metric in METRICS:
+            hard = self.limits[RUN_SCOPE].get(f"max_{metric}")
+            if hard and projected[metric] > hard:
+                rows = int(hard / (usage[metric] / rows_done)) if usage[metric] else total_rows
+                print(f"[预算] 预计 {metric} 将超出硬上限 {hard:g}，约完成 {rows} 行后停止")
+
+    # ---------- 汇总 ----------
+    def snapshot(self) -> dict:
+        with self._lock:
+            usage = {scope: {k: round(v, 4) for k, v in u.items()} for scope, u in self._usage.items()}
+        return {"limits": self.limits, "usage": usage, "exceeded": self.exceeded}
+
+    def print_summary(self):
+        usage = self.snapshot()["usage"].get(RUN_SCOPE)
+        if usage:
+            print(f"[预算] 本次用量：{usage['tokens']:g} tokens，{usage['calls']:g} 次调用，费用 {usage['cost']:.2f}"
+                  + (f"（{self.exceeded}）" if self.exceeded else ""))
+
+    def dump(self, output_dir: str, filename: str = "budget.json") -> str:
+        path = os.path.join(output_dir, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+# ========= 当前评测的预算 =========
+_budget: Optional[Budget] = None
+_budget_lock = threading.Lock()
+# 当前上下文绑定的预算；线程池 / 协程需复制上下文（contextvars.copy_context）才能继承
+_current: contextvars.ContextVar = contextvars.ContextVar("budget", default=None)
+
+
+def new_budget(max_tokens=None, max_calls=None, max_cost=None) -> Budget:
+    """按配置创建一份独立的预算，给出的整体硬上限优先"""
+    cfg = dict(config.get("budget") or {})
+    stage_limits = cfg.pop("stages", None)
+    project_after = cfg.pop("project_after", 20)
+    for metric, value in (("tokens", max_tokens), ("calls", max_calls), ("cost", max_cost)):
+        if value:
+            cfg[f"max_{metric}"] = value
+    return Budget(cfg, stage_limits, project_after)
+
+
+def init_budget(max_tokens=None, max_calls=None, max_cost=None) -> Budget:
+    """按配置创建新的全局预算，命令行给出的整体硬上限优先"""
+    global _budget
+    with _budget_lock:
+        _budget = new_budget(max_tokens, max_calls, max_cost)
+        return _budget
+
+
+@contextmanager
+def use_budget(budget: Budget):
+    """在当前上下文中把 get_budget() 指向 budget"""
+    token = _current.set(budget)
+    try:
+        yield budget
+    finally:
+        _current.reset(token)
+
+
+def get_budget() -> Budget:
+    """当前上下文绑定的预算；未绑定时返回全局预算"""
+    budget = _current.get()
+    if budget is not None:
+        return budget
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = new_budget()
+        return _budget
@@ -0,0 +1,121 @@
+"""
+按模型 / domain 的熔断器
+核心：
+  • closed   ：正常放行；窗口期内失败次数达到阈值即熔断（open）
+  • open     ：直接拒绝（fail fast），open_seconds 后进入半开
+  • half_open：只放行少量探测请求，成功则恢复 closed，失败则重新熔断
+  • 熔断时若模型配置了 fallback，则由 vivo_model 把该次调用路由到备用模型
+
+配置（config/model.yaml，可省略）：
+  circuit_breaker:         # 全局默认
+    failure_threshold: 5
+    window: 60             # 统计失败次数的时间窗口（秒）
+    open_seconds: 60
+    half_open_probes: 1
+  model:
+    o3:
+      fallback: gemini-2.5-pro
+      circuit_breaker:     # 按模型覆盖
+        failure_threshold: 3
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+from config.config import config
+from utils.retry_policy import Outcome
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 这些结果与服务健康无关，不计入失败
+_NEUTRAL_OUTCOMES = (Outcome.OK, Outcome.CONTEXT_LENGTH)
+
+
+class CircuitBreaker:
+    """线程安全的三态熔断器"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, window: float = 60,
+                 open_seconds: float = 60, half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.window = float(window)
+        self.open_seconds = float(open_seconds)
+        self.half_open_probes = max(1, int(half_open_probes))
+        self.state = CLOSED
+        self._failures = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否放行本次请求；半开状态下放行即占用一个探测名额"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+                print(f"[熔断] {self.name} 进入半开状态，开始探测")
+            if self._probes >= self.half_open_probes:
+                return False
+            self._probes += 1
+            return True
+
+    def record(self, outcome: str):
+        if outcome in _NEUTRAL_OUTCOMES:
+            self._on_success()
+        else:
+            self._on_failure()
+
+    def _on_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                print(f"[熔断] {self.name} 探测成功，恢复正常")
+            self.state = CLOSED
+            self._failures.clear()
+            self._probes = 0
+
+    def _on_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._trip(now)
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if self.state == CLOSED and len(self._failures) >= self.failure_threshold:
+                self._trip(now)
+
+    def _trip(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self._failures.clear()
+        print(f"[熔断] {self.name} 失败过多，熔断 {self.open_seconds:g}s")
+
+
+# ========= 全局注册表 =========
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def _breaker_config(model: str) -> dict:
+    cfg = dict(config.get("circuit_breaker") or {})
+    cfg.update(config["model"].get(model, {}).get("circuit_breaker") or {})
+    return cfg
+
+
+def get_breaker(model: str, domain: str) -> CircuitBreaker:
+    key = (model, domain)
+    with _registry_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(f"{model}@{domain}", **_breaker_config(model))
+            _breakers[key] = breaker
+        return breaker
@@ -0,0 +1,225 @@
+"""
+对冲请求（hedged requests），压缩裁判调用的长尾延迟
+核心：
+  • LatencyTracker：按模型记录最近的成功调用耗时，提供分位数
+  • Hedger        ：调用耗时超过该模型的 p 分位（默认 p95）时再发一份相同请求，谁先成功用谁；
+                    同步版无法中断已发出的 requests 调用，落后的一份完成后结果丢弃，但用量照常计入
+                    调用统计与预算（阶段 hedge_discarded）；异步版直接取消；
+                    额外请求数不超过总调用数的 max_extra_ratio
+  • 同步版按模型使用独立的线程池，大小为该模型限流器在途上限的两倍（每个在途请求至多一份对冲）
+
+配置（config/model.yaml，可省略；也可用 main.py --hedge 开启）：
+  hedging:
+    enabled: false
+    percentile: 95
+    min_samples: 20      # 样本不足时不对冲
+    min_delay: 10        # 对冲触发阈值下限（秒）
+    max_extra_ratio: 0.1
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+from config.config import config
+from utils.budget import get_budget
+from utils.retry_policy import Outcome
+from utils.telemetry import get_call_stats
+
+# 落后的对冲请求计入的阶段
+DISCARDED_STAGE = "hedge_discarded"
+
+# 限流器没有在途上限时，每个模型对冲线程池的大小
+DEFAULT_POOL_SIZE = 64
+
+
+class LatencyTracker:
+    """线程安全的滑动窗口耗时统计"""
+
+    def __init__(self, window: int = 500):
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, model: str, latency: float):
+        with self._lock:
+            self._samples[model].append(latency)
+
+    def percentile(self, model: str, p: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples[model])
+        if len(samples) < max(1, min_samples):
+            return None
+        pos = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[pos]
+
+
+class Hedger:
+    """fn / coro_factory 均返回 CallResult，outcome 为 Outcome.OK 视为成功"""
+
+    def __init__(self, enabled: bool = False, percentile: float = 95, min_samples: int = 20,
+                 min_delay: float = 10, max_extra_ratio: float = 0.1):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_extra_ratio = max_extra_ratio
+        self.tracker = LatencyTracker()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.discarded_tokens = 0
+        self._lock = threading.Lock()
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+
+    # -------------------------------------------------
+    def _threshold(self, model: str) -> Optional[float]:
+        if not self.enabled:
+            return None
+        value = self.tracker.percentile(model, self.percentile, self.min_samples)
+        return None if value is None else max(self.min_delay, value)
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.hedged + 1 > self.max_extra_ratio * self.calls:
+                return False
+            self.hedged += 1
+            return True
+
+    def _count_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def _count_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def _pool(self, model: str, limiter=None) -> ThreadPoolExecutor:
+        with self._lock:
+            if model not in self._executors:
+                slots = getattr(limiter, "max_inflight", None)
+                size = 2 * slots if slots else DEFAULT_POOL_SIZE
+                self._executors[model] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"hedge-{model}")
+            return self._executors[model]
+
+    def _discard(self, future, budget):
+        """落后的请求完成后把用量计入调用统计与预算"""
+        result = future.result()
+        with self._lock:
+            self.discarded_tokens += result.total_tokens
+        get_call_stats().record(DISCARDED_STAGE, result)
+        budget.charge(DISCARDED_STAGE, result)
+
+    # -------------------------------------------------
+    def run(self, model: str, fn: Callable, limiter=None) -> "CallResult":
+        """limiter 为该模型的 ModelLimiter，用于确定对冲线程池大小"""
+        self._count_call()
+        threshold = self._threshold(model)
+        start = time.time()
+        if threshold is None:
+            result = fn()
+            if result.outcome == Outcome.OK:
+                self.tracker.record(model, time.time() - start)
+            return result
+
+        pool = self._pool(model, limiter)
+        budget = get_budget()
+        # 在调用方的上下文中执行（预算等按上下文区分的状态）
+        primary = pool.submit(contextvars.copy_context().run, fn)
+        done, _ = wait([primary], timeout=threshold)
+        if done or not self._take_budget():
+            result = primary.result()
+            if result.outcome == Outcome.OK:
+                self.tracker.record(model, time.time() - start)
+            return result
+
+        print(f"[对冲] {model} 调用已超过 {threshold:.1f}s（p{self.percentile:g}），发出对冲请求")
+        hedge = pool.submit(contextvars.copy_context().run, fn)
+        pending = {primary, hedge}
+        fallback = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result.outcome == Outcome.OK:
+                    self.tracker.record(model, time.time() - start)
+                    if future is hedge:
+                        self._count_win()
+                    for other in {primary, hedge} - {future}:
+                        if other in pending:
+                            other.add_done_callback(lambda f: self._discard(f, budget))
+                        else:
+                            self._discard(other, budget)
+                    return result
+                if fallback is None:
+                    fallback = result
+                else:
+                    # 两份都失败：返回先完成的一份，另一份的用量同样计入
+                    self._discard(future, budget)
+        return fallback
+
+    async def run_async(self, model: str, coro_factory: Callable) -> "CallResult":
+        self._count_call()
+        threshold = self._threshold(model)
+        start = time.time()
+        if threshold is None:
+            result = await coro_factory()
+            if result.outcome == Outcome.OK:
+                self.tracker.record(model, time.time() - start)
+            return result
+
+        primary = asyncio.ensure_future(coro_factory())
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done or not self._take_budget():
+            result = await primary
+            if result.outcome == Outcome.OK:
+                self.tracker.record(model, time.time() - start)
+            return result
+
+        print(f"[对冲] {model} 调用已超过 {threshold:.1f}s（p{self.percentile:g}），发出对冲请求")
+        hedge = asyncio.ensure_future(coro_factory())
+        pending = {primary, hedge}
+        fallback = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.outcome == Outcome.OK:
+                        self.tracker.record(model, time.time() - start)
+                        if task is hedge:
+                            self._count_win()
+                        return result
+                    fallback = fallback or result
+            return fallback
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def print_stats(self):
+        if self.enabled:
+            print(f"[对冲] 调用 {self.calls} 次，发出对冲 {self.hedged} 次，对冲请求先返回 {self.hedge_wins} 次，"
+                  f"落后请求消耗 {self.discarded_tokens} tokens")
+
+
+# ========= 全局单例 =========
+_hedger: Optional[Hedger] = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    global _hedger
+    with _hedger_lock:
+        if _hedger is None:
+            cfg = config.get("hedging") or {}
+            _hedger = Hedger(
+                enabled=bool(cfg.get("enabled", False)),
+                percentile=cfg.get("percentile", 95),
+                min_samples=cfg.get("min_samples", 20),
+                min_delay=cfg.get("min_delay", 10),
+                max_extra_ratio=cfg.get("max_extra_ratio", 0.1),
+            )
+        return _hedger
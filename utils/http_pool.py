@@ -0,0 +1,148 @@
+"""
+模型网关 HTTP 连接池
+核心：
+  • 按 domain 维护共享的 requests.Session（keep-alive + urllib3 连接池），线程安全
+  • 连接池大小由并发线程数决定（main.py --threads）
+  • warm_up：启动时预先建立连接，避免首批请求集中握手
+  • stats   ：按 domain 汇总请求数、错误数、平均耗时与实际新建连接数
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+
+
+class HttpClientPool:
+    """按 domain 复用连接的 HTTP 客户端"""
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        self.pool_size = max(1, int(pool_size))
+        self._sessions: Dict[str, requests.Session] = {}
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------
+    def _session_for(self, domain: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(domain)
+            if session is None:
+                session = requests.Session()
+                # 重试交给上层（vivo_model）处理，这里只负责连接复用
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Connection": "keep-alive"})
+                self._sessions[domain] = session
+                self._adapters[domain] = adapter
+                self._stats[domain] = {"requests": 0, "errors": 0, "elapsed": 0.0}
+            return session
+
+    def _record(self, domain: str, elapsed: float, error: bool):
+        with self._lock:
+            st = self._stats[domain]
+            st["requests"] += 1
+            st["elapsed"] += elapsed
+            if error:
+                st["errors"] += 1
+
+    # -------------------------------------------------
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        domain = urlparse(url).netloc
+        session = self._session_for(domain)
+        start = time.time()
+        error = False
+        try:
+            return session.request(method, url, **kwargs)
+        except requests.RequestException:
+            error = True
+            raise
+        finally:
+            self._record(domain, time.time() - start, error)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    # -------------------------------------------------
+    def warm_up(self, domains: Iterable[str], connections: Optional[int] = None, timeout: float = 5):
+        """
+        为每个 domain 预先建立 connections 条连接（默认等于连接池大小）。
+        预热请求的响应内容无关紧要，只要连接被放回连接池即可；失败只打印警告。
+        """
+        connections = min(self.pool_size, connections or self.pool_size)
+
+        def _touch(domain):
+            try:
+                resp = self.request("HEAD", f"http://{domain}/", timeout=timeout)
+                resp.close()
+                return True
+            except requests.RequestException:
+                return False
+
+        for domain in dict.fromkeys(d for d in domains if d):
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                ok = sum(executor.map(_touch, [domain] * connections))
+            if ok:
+                print(f"连接池预热完成: {domain}（{ok}/{connections} 条连接）")
+            else:
+                print(f"[警告] 连接池预热失败: {domain}，将在首次请求时建立连接")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """返回 {domain: {requests, errors, avg_latency, connections, pool_size}}"""
+        out = {}
+        with self._lock:
+            for domain, st in self._stats.items():
+                adapter = self._adapters[domain]
+                pools = adapter.poolmanager.pools
+                opened = sum(getattr(pools[key], "num_connections", 0) for key in pools.keys())
+                out[domain] = {
+                    "requests": st["requests"],
+                    "errors": st["errors"],
+                    "avg_latency": round(st["elapsed"] / st["requests"], 3) if st["requests"] else 0.0,
+                    "connections": opened,
+                    "pool_size": self.pool_size,
+                }
+        return out
+
+    def print_stats(self):
+        for domain, st in self.stats().items():
+            print(f"[连接池] {domain}: 请求 {st['requests']} 次，错误 {st['errors']} 次，"
+                  f"平均耗时 {st['avg_latency']}s，新建连接 {st['connections']} 条（池大小 {st['pool_size']}）")
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._adapters.clear()
+            self._stats.clear()
+
+
+# ========= 全局单例 =========
+_pool: Optional[HttpClientPool] = None
+_pool_lock = threading.Lock()
+
+
+def init_http_pool(pool_size: int = DEFAULT_POOL_SIZE) -> HttpClientPool:
+    """按并发数（重新）创建全局连接池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = HttpClientPool(pool_size)
+        return _pool
+
+
+def get_http_pool() -> HttpClientPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HttpClientPool()
+        return _pool
@@ -0,0 +1,219 @@
+"""
+按模型 / domain 的限流调度器
+核心：
+  • TokenBucket   ：令牌桶，控制 qps 与突发量 burst
+  • ModelLimiter  ：令牌桶 + 在途请求数上限（max_inflight）；
+                    开启 adaptive 后在途上限按网关反馈 AIMD 自动调整：
+                    一轮（上限个数）健康的成功调用后加 increase，遇到限流 / 超时等临时错误乘以 decrease
+  • get_limiter   ：按 (模型, domain) 取进程内共享的限流器，
+                    process_data_multithread 的所有线程以及 SourceChecker / KnowledgeQAJudge
+                    都经由 vivo_GPT 共用同一份额度
+
+配置（config/model.yaml，均可省略；省略即不限流）：
+  rate_limit:              # 全局默认
+    qps: 2
+    burst: 4
+    max_inflight: 20
+  model:
+    o3:
+      rate_limit:          # 按模型覆盖
+        qps: 0.5
+        max_inflight: 8
+      # 自适应并发（也可用 main.py --adaptive 对所有模型开启），max_inflight 为上界
+      # adaptive: true
+      # min_inflight: 1
+      # initial_inflight: 4
+      # increase: 1
+      # decrease: 0.5
+      # latency_target: 60     # 单次调用超过该耗时（秒）不算健康，不加并发
+      # cooldown: 2            # 两次减半之间至少间隔（秒），避免同一波 429 连续减半
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Tuple
+
+from config.config import config
+from utils.retry_policy import Outcome
+
+# 开启自适应但未配置 max_inflight 时的上界
+DEFAULT_ADAPTIVE_MAX = 64
+# 触发减半的结果
+_CONGESTION_OUTCOMES = (Outcome.RATE_LIMIT, Outcome.TRANSIENT)
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶。reserve() 立即预占一个令牌并返回需要等待的秒数，
+    令牌余额允许为负，从而让并发请求按到达顺序排队而不是同时醒来。
+    """
+
+    def __init__(self, qps: float, burst: Optional[float] = None):
+        self.qps = float(qps)
+        self.capacity = float(burst) if burst else max(1.0, self.qps)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.qps)
+            self._last = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.qps
+
+
+class ModelLimiter:
+    """单个 (模型, domain) 的限流器：qps 令牌桶 + 在途请求数上限（可自适应）"""
+
+    def __init__(self, qps: Optional[float] = None, burst: Optional[float] = None,
+                 max_inflight: Optional[int] = None, adaptive: bool = False, min_inflight: int = 1,
+                 initial_inflight: Optional[int] = None, increase: int = 1, decrease: float = 0.5,
+                 latency_target: Optional[float] = None, cooldown: float = 2.0, name: str = ""):
+        self.name = name
+        self.bucket = TokenBucket(qps, burst) if qps else None
+        self.max_inflight = int(max_inflight) if max_inflight else None
+        self.adaptive = adaptive
+        self.min_inflight = max(1, int(min_inflight))
+        self.increase = max(1, int(increase))
+        self.decrease = float(decrease)
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        if adaptive:
+            self.max_inflight = self.max_inflight or DEFAULT_ADAPTIVE_MAX
+            initial = initial_inflight or max(self.min_inflight, self.max_inflight // 4)
+            self.limit = min(self.max_inflight, max(self.min_inflight, int(initial)))
+        else:
+            self.limit = self.max_inflight
+        self.inflight = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    # ---------- 在途请求数 ----------
+    def _full(self) -> bool:
+        return self.limit is not None and self.inflight >= self.limit
+
+    def try_enter(self) -> bool:
+        """非阻塞地占用一个在途名额，成功返回 True"""
+        with self._cond:
+            if self._full():
+                return False
+            self.inflight += 1
+            return True
+
+    def leave(self):
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify()
+
+    # ---------- 自适应（AIMD） ----------
+    def record(self, outcome: str, latency: float):
+        """按一次请求的结果调整在途上限；未开启 adaptive 时不做任何事"""
+        if not self.adaptive:
+            return
+        with self._cond:
+            if outcome in _CONGESTION_OUTCOMES:
+                now = time.monotonic()
+                if now - self._last_decrease < self.cooldown:
+                    return
+                self._last_decrease = now
+                self._successes = 0
+                new_limit = max(self.min_inflight, int(self.limit * self.decrease))
+                if new_limit < self.limit:
+                    print(f"[自适应并发] {self.name} 遇到{'限流' if outcome == Outcome.RATE_LIMIT else '超时/临时错误'}，"
+                          f"在途上限 {self.limit} → {new_limit}")
+                    self.limit = new_limit
+            elif outcome == Outcome.OK:
+                if self.latency_target and latency > self.latency_target:
+                    return
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_inflight:
+                    self._successes = 0
+                    self.limit = min(self.max_inflight, self.limit + self.increase)
+                    self._cond.notify_all()
+
+    def describe(self) -> str:
+        return f"{self.limit}/{self.max_inflight}" if self.adaptive else str(self.limit or "∞")
+
+    # ---------- qps ----------
+    def reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数（未配置 qps 时恒为 0）"""
+        return self.bucket.reserve() if self.bucket else 0.0
+
+    @contextmanager
+    def acquire(self):
+        """阻塞直到拿到在途名额和令牌；只有额度真正耗尽时才会等待"""
+        with self._cond:
+            while self._full():
+                self._cond.wait()
+            self.inflight += 1
+        try:
+            delay = self.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            yield
+        finally:
+            self.leave()
+
+    @asynccontextmanager
+    async def async_acquire(self, poll_interval: float = 0.05):
+        """协程版 acquire：等待期间让出事件循环，与线程共用同一份额度"""
+        while not self.try_enter():
+            await asyncio.sleep(poll_interval)
+        try:
+            delay = self.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield
+        finally:
+            self.leave()
+
+
+# ========= 全局注册表 =========
+_limiters: Dict[Tuple[str, str], ModelLimiter] = {}
+_registry_lock = threading.Lock()
+_adaptive_override = False
+
+
+def enable_adaptive():
+    """对之后创建的所有限流器开启自适应并发（main.py --adaptive）"""
+    global _adaptive_override
+    _adaptive_override = True
+
+
+def _limit_config(model: str) -> dict:
+    cfg = dict(config.get("rate_limit") or {})
+    cfg.update(config["model"].get(model, {}).get("rate_limit") or {})
+    return cfg
+
+
+def get_limiter(model: str, domain: str) -> ModelLimiter:
+    key = (model, domain)
+    with _registry_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            cfg = _limit_config(model)
+            limiter = ModelLimiter(
+                cfg.get("qps"), cfg.get("burst"), cfg.get("max_inflight"),
+                adaptive=bool(cfg.get("adaptive", False)) or _adaptive_override,
+                min_inflight=cfg.get("min_inflight", 1),
+                initial_inflight=cfg.get("initial_inflight"),
+                increase=cfg.get("increase", 1),
+                decrease=cfg.get("decrease", 0.5),
+                latency_target=cfg.get("latency_target"),
+                cooldown=cfg.get("cooldown", 2.0),
+                name=model,
+            )
+            _limiters[key] = limiter
+        return limiter
+
+
+def describe_limits() -> str:
+    """自适应限流器的当前在途上限，用于进度条后缀，如 "o3 12/64" """
+    with _registry_lock:
+        limiters = [l for l in _limiters.values() if l.adaptive]
+    return " ".join(f"{l.name} {l.describe()}" for l in limiters)
@@ -0,0 +1,182 @@
+"""
+LLM 响应持久化缓存（SQLite，默认位于 Results/llm_cache.sqlite）
+核心：
+  • key = sha256(模型名 + provider + config["model"][model]["params"] + prompt 原文)
+  • 只缓存网关判定为成功的响应；按 TTL 过期、按条数上限淘汰最久未访问的记录
+  • 三种模式：off（不使用）、rw（命中即返回，未命中调用模型后写入）、
+             replay（只读回放：只用缓存，未命中也不调用模型，返回空字符串）
+  • hits / misses / writes 计数，运行结束时打印
+
+配置（config/model.yaml，可省略）：
+  cache:
+    path: Results/llm_cache.sqlite
+    ttl_days: 30
+    max_entries: 200000
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from config.config import config
+
+CACHE_MODES = ("off", "rw", "replay")
+
+_root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(_root_dir, "Results", "llm_cache.sqlite")
+
+# 每写入多少条做一次过期清理与容量淘汰
+_EVICT_EVERY = 500
+
+
+def request_key(name: str, provider: str, params: Optional[dict], prompt: str) -> str:
+    """按网关请求体中的 model / provider / extra / prompt 计算 key（mock_gateway 回放录制响应时也用它）"""
+    payload = json.dumps([name, provider, params, prompt], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_key(model: str, prompt: str) -> str:
+    model_cfg = config["model"][model]
+    return request_key(model_cfg.get("name"), model_cfg.get("provider"), model_cfg.get("params"), prompt)
+
+
+class ResponseCache:
+    """线程安全的 SQLite 响应缓存"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, mode: str = "rw",
+                 ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        if mode not in CACHE_MODES or mode == "off":
+            raise ValueError(f"不支持的缓存模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL 便于多个进程同时读写同一缓存文件
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, content TEXT,"
+            " created_at REAL, accessed_at REAL)"
+        )
+        self._conn.commit()
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        return self.get_by_key(cache_key(model, prompt))
+
+    def contains(self, model: str, prompt: str) -> bool:
+        """只判断是否存在且未过期，不计入命中统计（planner.py 预估缓存命中时使用）"""
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM responses WHERE key = ?",
+                                     (cache_key(model, prompt),)).fetchone()
+        return row is not None and not (self.ttl_seconds and time.time() - row[0] > self.ttl_seconds)
+
+    def get_by_key(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.replay:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            return row[0]
+
+    def put(self, model: str, prompt: str, content: str):
+        if self.replay:
+            return
+        key = cache_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, content, now, now)
+            )
+            self._conn.commit()
+            self.writes += 1
+            if self.writes % _EVICT_EVERY == 0:
+                self._evict(now)
+
+    def delete(self, model: str, prompt: str):
+        """删除一条缓存（正文无法解析时由调用方剔除，避免重试与续跑反复回放同一坏响应）"""
+        if self.replay:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (cache_key(model, prompt),))
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (int(self.max_entries),)
+            )
+        self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def print_stats(self):
+        st = self.stats()
+        print(f"[响应缓存] 模式 {st['mode']}：命中 {st['hits']} 次，未命中 {st['misses']} 次，"
+              f"写入 {st['writes']} 条，命中率 {st['hit_rate']:.1%}")
+
+    def close(self):
+        with self._lock:
+            self._evict(time.time())
+            self._conn.close()
+
+
+# ========= 全局单例 =========
+_cache: Optional[ResponseCache] = None
+
+
+def init_response_cache(mode: str = "rw", path: Optional[str] = None) -> Optional[ResponseCache]:
+    """按模式初始化全局缓存；mode 为 off 时关闭缓存并返回 None"""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    if mode == "off":
+        return None
+    cfg = config.get("cache") or {}
+    ttl_days = cfg.get("ttl_days")
+    _cache = ResponseCache(
+        path=path or cfg.get("path") or DEFAULT_CACHE_PATH,
+        mode=mode,
+        ttl_seconds=ttl_days * 86400 if ttl_days else None,
+        max_entries=cfg.get("max_entries"),
+    )
+    return _cache
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _cache
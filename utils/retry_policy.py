@@ -0,0 +1,156 @@
+"""
+模型网关响应分类与重试策略
+核心：
+  • classify_response / classify_exception：把 HTTP 状态码、网关返回信息、网络异常归类为有限的几种结果
+  • RetryPolicy：指数退避 + 随机抖动（full jitter），尊重 Retry-After 提示，
+                 不可重试的错误（如 context_length_exceeded）直接返回，不再白白重试
+
+配置（config/model.yaml，可省略）：
+  retry:
+    max_attempts: 3
+    base_delay: 2
+    max_delay: 60
+"""
+
+import email.utils
+import random
+import time
+from typing import Any, Mapping, Optional, Tuple
+
+import requests
+
+from config.config import config
+
+
+class Outcome:
+    """一次请求的归类结果"""
+    OK = "ok"
+    RATE_LIMIT = "rate_limit"          # 429 / 网关限流
+    CONTEXT_LENGTH = "context_length"  # 超出上下文长度，重试无意义
+    TRANSIENT = "transient"            # 超时、网络抖动、5xx 等可恢复错误
+    EMPTY = "empty"                    # 200 但没有正文（网关偶发），重试，且不写入响应缓存
+    FATAL = "fatal"                    # 鉴权失败、参数错误等不可恢复错误
+    CIRCUIT_OPEN = "circuit_open"      # 模型已熔断且没有可用的备用模型，未发出请求
+    FALLBACK = "fallback"              # 原模型熔断，由备用模型成功返回
+
+    RETRYABLE = (RATE_LIMIT, TRANSIENT, EMPTY)
+
+
+# 网关 / 上游在报文中给出的错误提示（按优先级匹配）
+CONTEXT_LENGTH_MARKERS = ["context_length_exceeded", "maximum context length", "too many tokens"]
+RATE_LIMIT_MARKERS = ["429 Too Many Requests", "hit model rate limit", "qps request limit", "rate limit"]
+TRANSIENT_MARKERS = ["timeout", "An error occurred.", "http://nginx.org/r/error_log", "当前网络出现问题",
+                     "unknown error", "network error", "InternalServerError"]
+
+
+def _error_text(body: Any) -> str:
+    """提取用于匹配错误提示的文本；成功返回的正文不参与匹配，避免模型回答里的字眼触发重试"""
+    if isinstance(body, Mapping):
+        data = body.get("data")
+        parts = [str(body.get("msg", "")), str(body.get("code", "")), str(body.get("error", ""))]
+        if isinstance(data, Mapping) and not data.get("content"):
+            parts.append(str(data))
+        return " ".join(parts)
+    return str(body)
+
+
+def _has_content(body: Any) -> bool:
+    if not isinstance(body, Mapping):
+        return False
+    data = body.get("data")
+    return isinstance(data, Mapping) and bool(data.get("content"))
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]], body: Any = None) -> Optional[float]:
+    """解析 Retry-After 提示（秒数或 HTTP 日期），以及报文中的 retry_after / retryAfter 字段"""
+    value = None
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None and isinstance(body, Mapping):
+        value = body.get("retry_after", body.get("retryAfter"))
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(str(value))
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_response(status_code: int, body: Any,
+                      headers: Optional[Mapping[str, str]] = None) -> Tuple[str, Optional[float]]:
+    """
+    返回 (Outcome, retry_after 秒数或 None)
+    """
+    retry_after = parse_retry_after(headers, body)
+    if status_code == 200 and _has_content(body):
+        return Outcome.OK, None
+
+    text = _error_text(body)
+    lowered = text.lower()
+    if any(m.lower() in lowered for m in CONTEXT_LENGTH_MARKERS):
+        return Outcome.CONTEXT_LENGTH, None
+    if status_code == 429 or any(m.lower() in lowered for m in RATE_LIMIT_MARKERS):
+        return Outcome.RATE_LIMIT, retry_after
+    if status_code >= 500 or status_code in (408, 425) or any(m.lower() in lowered for m in TRANSIENT_MARKERS):
+        return Outcome.TRANSIENT, retry_after
+    if status_code != 200:
+        return Outcome.FATAL, None
+    # 200 但没有正文：不能把网关的 msg 当作模型回答
+    return Outcome.EMPTY, retry_after
+
+
+def classify_exception(exc: BaseException) -> str:
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return Outcome.TRANSIENT
+    if isinstance(exc, ValueError):
+        # 响应不是合法 JSON（常见于网关返回的 HTML 错误页）
+        return Outcome.TRANSIENT
+    return Outcome.FATAL
+
+
+class RetryPolicy:
+    """指数退避 + full jitter；限流错误的退避基数加倍"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 2.0, max_delay: float = 60.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+
+    def should_retry(self, outcome: str, attempt: int) -> bool:
+        """attempt 从 1 开始计数，表示已经完成的请求次数"""
+        return outcome in Outcome.RETRYABLE and attempt < self.max_attempts
+
+    def backoff(self, outcome: str, attempt: int, retry_after: Optional[float] = None) -> float:
+        base = self.base_delay * (2 if outcome == Outcome.RATE_LIMIT else 1)
+        cap = min(self.max_delay, base * (2 ** (attempt - 1)))
+        delay = random.uniform(0, cap)
+        if retry_after is not None:
+            # 服务端给出提示时至少等到提示时间，再叠加少量抖动错开各线程
+            delay = min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return delay
+
+
+def get_retry_policy() -> RetryPolicy:
+    cfg = config.get("retry") or {}
+    return RetryPolicy(
+        max_attempts=cfg.get("max_attempts", 3),
+        base_delay=cfg.get("base_delay", 2.0),
+        max_delay=cfg.get("max_delay", 60.0),
+    )
+
+
+def describe_outcome(outcome: str) -> str:
+    return {
+        Outcome.RATE_LIMIT: "限流",
+        Outcome.CONTEXT_LENGTH: "超出上下文长度",
+        Outcome.TRANSIENT: "网络/服务端临时错误",
+        Outcome.EMPTY: "空响应",
+        Outcome.FATAL: "不可恢复错误",
+        Outcome.CIRCUIT_OPEN: "模型已熔断",
+        Outcome.FALLBACK: "备用模型返回",
+    }.get(outcome, outcome)
@@ -0,0 +1,123 @@
+"""
+流式响应（SSE）增量解析
+核心：
+  • SSEDecoder        ：按字节增量喂入，按行切分后一次性 UTF-8 解码（换行符不会出现在多字节字符中间，
+                        无需逐行探测编码）；网关每行 data: 即一个完整事件，event:close / data:[DONE] 表示结束
+  • JSONObjectDetector：增量检测正文中第一个完整的顶层 JSON 对象（感知字符串与转义），
+                        裁判输出的 JSON 一旦闭合即可交给 result_parser.parse_result_json，无需等流关闭
+  • extract_delta     ：从单个事件中取出本次增量文本
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+DONE = object()
+
+
+class SSEDecoder:
+    """feed(bytes) 返回本次解析出的事件列表，元素为 (event, data)；流结束时返回 DONE"""
+
+    def __init__(self):
+        self._buf = b""
+        self._event = None
+        self.closed = False
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        self._buf += chunk
+        out = []
+        while not self.closed:
+            pos = self._buf.find(b"\n")
+            if pos < 0:
+                break
+            raw, self._buf = self._buf[:pos], self._buf[pos + 1:]
+            out.extend(self._line(raw.rstrip(b"\r").decode("utf-8", errors="replace")))
+        return out
+
+    def flush(self) -> List[Any]:
+        if self.closed or not self._buf:
+            return []
+        raw, self._buf = self._buf, b""
+        return self._line(raw.rstrip(b"\r").decode("utf-8", errors="replace"))
+
+    def _line(self, line: str) -> List[Any]:
+        if not line:
+            self._event = None
+            return []
+        if line.startswith(":"):
+            return []
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            self._event = value
+            if value == "close":
+                self.closed = True
+                return [DONE]
+            return []
+        if field == "data":
+            if value.strip() == "[DONE]":
+                self.closed = True
+                return [DONE]
+            return [(self._event, value)]
+        return []
+
+
+class JSONObjectDetector:
+    """增量检测第一个完整的顶层 JSON 对象；feed 返回对象文本，未完成时返回 None"""
+
+    def __init__(self):
+        self._text = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self.result: Optional[str] = None
+
+    def feed(self, text: str) -> Optional[str]:
+        if self.result is not None:
+            return self.result
+        for ch in text:
+            if not self._started:
+                if ch != "{":
+                    continue
+                self._started = True
+            self._text.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = "".join(self._text)
+                    return self.result
+        return None
+
+
+def extract_delta(data: str) -> Tuple[str, Optional[dict]]:
+    """
+    返回 (增量文本, 事件JSON)；兼容网关 data.content、顶层 content 与 OpenAI 风格的 choices[0].delta.content
+    """
+    try:
+        payload = json.loads(data)
+    except json.JSONDecodeError:
+        return data, None
+    if not isinstance(payload, dict):
+        return "", None
+    inner = payload.get("data")
+    if isinstance(inner, dict) and inner.get("content") is not None:
+        return inner["content"], payload
+    if payload.get("content") is not None:
+        return payload["content"], payload
+    choices = payload.get("choices")
+    if choices and isinstance(choices[0], dict):
+        delta = choices[0].get("delta") or {}
+        return delta.get("content") or "", payload
+    return "", payload
@@ -0,0 +1,143 @@
+"""
+阶段级结果缓存（SQLite，默认位于 Results/stage_cache.sqlite），跨数据集版本复用单模型打标结果
+核心：
+  • 两轮评测之间竞品回答通常不变、只有自研回答变化，竞品一侧的 single_b 打标可以直接复用
+  • key = sha256(版本 + 裁判模型 + 规则指纹 + 度量一级分类 + prompt_time + 该侧对话内容)，
+    规则指纹覆盖整份 rules（含反思阶段生成的 learned_guidelines），规则或指南变化后自然失效；
+    修改 create_single_model_prompt 的模板时请把 STAGE_CACHE_VERSION 加一
+  • 缓存解析后的 JSON 结果，与 response_cache（按 prompt 原文缓存原始响应）相互独立
+  • 每个裁判模型记录最近一次使用的规则指纹，planner.py 据此预估新数据集的调用量
+  • 与 --cache 共用模式：off 不使用；rw 读写；replay 只读
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from config.config import config
+from utils.response_cache import CACHE_MODES
+
+STAGE_CACHE_VERSION = 1
+
+# 可以跨行复用结果的阶段（只依赖单侧对话）
+SINGLE_STAGES = ("single_a", "single_b")
+
+_root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STAGE_CACHE_PATH = os.path.join(_root_dir, "Results", "stage_cache.sqlite")
+
+
+def rules_fingerprint(rules: dict) -> str:
+    payload = json.dumps(rules, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def single_stage_key(model: str, fingerprint: str, dimension: str, run_time: str,
+                     history_text: str, resp_text: str) -> str:
+    """单侧打标结果的 key；history_text / resp_text 为 _format_histories 格式化后的该侧对话"""
+    payload = json.dumps([STAGE_CACHE_VERSION, model, fingerprint, dimension, run_time, history_text, resp_text],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """线程安全的 SQLite 阶段结果缓存"""
+
+    def __init__(self, path: str = DEFAULT_STAGE_CACHE_PATH, mode: str = "rw"):
+        if mode not in CACHE_MODES or mode == "off":
+            raise ValueError(f"不支持的缓存模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stage_results ("
+            " key TEXT PRIMARY KEY, model TEXT, stage TEXT, result TEXT, created_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " model TEXT PRIMARY KEY, fingerprint TEXT, used_at REAL)"
+        )
+        self._conn.commit()
+
+    @property
+    def readonly(self) -> bool:
+        return self.mode == "replay"
+
+    def contains(self, key: str) -> bool:
+        """只判断是否存在，不计入命中统计（planner 使用）"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM stage_results WHERE key = ?", (key,)).fetchone() is not None
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM stage_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, model: str, stage: str, result: dict):
+        if self.readonly or not result:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stage_results (key, model, stage, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, stage, json.dumps(result, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+            self.writes += 1
+
+    def remember_fingerprint(self, model: str, fingerprint: str):
+        if self.readonly:
+            return
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO fingerprints (model, fingerprint, used_at) VALUES (?, ?, ?)",
+                               (model, fingerprint, time.time()))
+            self._conn.commit()
+
+    def latest_fingerprint(self, model: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT fingerprint FROM fingerprints WHERE model = ?", (model,)).fetchone()
+        return row[0] if row else None
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        print(f"[阶段缓存] 模式 {self.mode}：复用单模型打标 {self.hits} 次，未命中 {self.misses} 次，"
+              f"写入 {self.writes} 条，复用率 {rate:.1%}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ========= 全局单例 =========
+_stage_cache: Optional[StageCache] = None
+
+
+def init_stage_cache(mode: str = "rw", path: Optional[str] = None) -> Optional[StageCache]:
+    """按模式初始化全局阶段缓存；mode 为 off 时关闭并返回 None"""
+    global _stage_cache
+    if _stage_cache is not None:
+        _stage_cache.close()
+        _stage_cache = None
+    if mode == "off":
+        return None
+    cfg = config.get("cache") or {}
+    _stage_cache = StageCache(path=path or cfg.get("stage_path") or DEFAULT_STAGE_CACHE_PATH, mode=mode)
+    return _stage_cache
+
+
+def get_stage_cache() -> Optional[StageCache]:
+    return _stage_cache
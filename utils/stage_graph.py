@@ -0,0 +1,106 @@
+"""
+单行评测的阶段依赖图（DAG）
+核心：
+  • 每个节点是一次阶段调用（single_a / single_b / sbs_analysis / final_judgment ...），
+    声明依赖后，依赖已就绪的节点立即并发执行；节点函数以依赖节点的结果作为同名关键字参数
+  • 节点可设置 fallback：失败时以 fallback 作为结果继续（异常记入 errors），未设置则整行失败
+  • run 在线程池中执行（同步流程），run_async 在事件循环中执行（异步流程，节点函数返回协程）；
+    run 的节点在调用方上下文的副本中执行，当前评测的预算等上下文变量随之传递
+  • 全局限流仍由 rate_limiter 统一负责，这里只决定“哪些调用可以同时发出”
+"""
+
+import asyncio
+import contextvars
+import inspect
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+_REQUIRED = object()
+
+
+class StageGraph:
+    def __init__(self):
+        self._nodes: Dict[str, Tuple[Callable, Tuple[str, ...], Any]] = {}
+
+    def add(self, name: str, fn: Callable, deps: Sequence[str] = (), fallback: Any = _REQUIRED) -> "StageGraph":
+        for dep in deps:
+            if dep not in self._nodes:
+                raise ValueError(f"阶段 {name} 依赖的 {dep} 尚未定义")
+        self._nodes[name] = (fn, tuple(deps), fallback)
+        return self
+
+    @property
+    def width(self) -> int:
+        """没有依赖的节点数，即同时在途的最大调用数"""
+        return sum(1 for _, deps, _ in self._nodes.values() if not deps)
+
+    def _ready(self, results: dict, started: set):
+        return [name for name, (_, deps, _) in self._nodes.items()
+                if name not in started and all(d in results for d in deps)]
+
+    def _settle(self, name: str, exc: BaseException, results: dict, errors: dict):
+        fallback = self._nodes[name][2]
+        if fallback is _REQUIRED:
+            raise exc
+        errors[name] = exc
+        results[name] = fallback
+
+    # -------------------------------------------------
+    def run(self, executor: Optional[ThreadPoolExecutor] = None) -> Tuple[Dict[str, Any], Dict[str, BaseException]]:
+        """返回 (各节点结果, 使用了 fallback 的节点异常)；必需节点失败时直接抛出其异常"""
+        executor = executor or get_stage_executor()
+        results, errors, started, running = {}, {}, set(), {}
+        while len(results) < len(self._nodes):
+            for name in self._ready(results, started):
+                fn, deps, _ = self._nodes[name]
+                started.add(name)
+                running[executor.submit(contextvars.copy_context().run, fn, **{d: results[d] for d in deps})] = name
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    self._settle(name, e, results, errors)
+        return results, errors
+
+    async def run_async(self) -> Tuple[Dict[str, Any], Dict[str, BaseException]]:
+        """run 的协程版本；必需节点失败时取消其余在途节点并抛出异常"""
+        results, errors, started, running = {}, {}, set(), {}
+
+        async def call(fn, kwargs):
+            value = fn(**kwargs)
+            return await value if inspect.isawaitable(value) else value
+
+        try:
+            while len(results) < len(self._nodes):
+                for name in self._ready(results, started):
+                    fn, deps, _ = self._nodes[name]
+                    started.add(name)
+                    running[asyncio.ensure_future(call(fn, {d: results[d] for d in deps}))] = name
+                done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        results[name] = task.result()
+                    except Exception as e:
+                        self._settle(name, e, results, errors)
+        finally:
+            for task in running:
+                task.cancel()
+        return results, errors
+
+
+# ========= 全局阶段线程池 =========
+# 与行级线程池分开，避免行任务占满线程后阶段任务排不上队（死锁）
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_stage_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=256, thread_name_prefix="stage")
+        return _executor
@@ -0,0 +1,94 @@
+"""
+模型调用结果与按阶段的调用统计
+核心：
+  • CallResult：一次模型调用的结果（正文、token 用量、耗时、尝试次数、实际应答模型、结果归类）
+  • CallStats ：线程安全地按阶段（single_a / single_b / sbs_analysis / final_judgment / reflection ...）
+                汇总调用次数、缓存命中、失败数、token 与耗时，评测结束后写入输出目录的 call_stats.json
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from utils.retry_policy import Outcome
+
+# 视为拿到可用正文的结果归类
+SUCCESS_OUTCOMES = (Outcome.OK, Outcome.FALLBACK)
+
+
+@dataclass
+class CallResult:
+    content: str = ""
+    model: str = ""
+    outcome: str = Outcome.FATAL
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    latency: float = 0.0
+    attempts: int = 0
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.outcome in SUCCESS_OUTCOMES
+
+
+class CallStats:
+    """按阶段汇总 CallResult"""
+
+    _FIELDS = ("calls", "cached", "failed", "attempts", "prompt_tokens", "completion_tokens", "total_tokens")
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: Optional[str], result: CallResult):
+        stage = stage or "other"
+        with self._lock:
+            st = self._stages.setdefault(stage, dict({k: 0 for k in self._FIELDS}, latency=0.0, max_latency=0.0))
+            st["calls"] += 1
+            st["cached"] += int(result.cached)
+            st["failed"] += int(not result.ok)
+            st["attempts"] += result.attempts
+            st["prompt_tokens"] += result.prompt_tokens
+            st["completion_tokens"] += result.completion_tokens
+            st["total_tokens"] += result.total_tokens
+            st["latency"] += result.latency
+            st["max_latency"] = max(st["max_latency"], result.latency)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            out = {}
+            for stage, st in self._stages.items():
+                st = dict(st)
+                live = st["calls"] - st["cached"]
+                st["avg_latency"] = round(st["latency"] / live, 3) if live else 0.0
+                st["latency"] = round(st["latency"], 3)
+                st["max_latency"] = round(st["max_latency"], 3)
+                out[stage] = st
+            return out
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def dump(self, output_dir: str, filename: str = "call_stats.json") -> str:
+        path = os.path.join(output_dir, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def print_summary(self):
+        for stage, st in self.snapshot().items():
+            print(f"[调用统计] {stage}: 调用 {st['calls']} 次（缓存 {st['cached']}，失败 {st['failed']}，"
+                  f"请求 {st['attempts']} 次），tokens {st['total_tokens']}，"
+                  f"平均耗时 {st['avg_latency']}s，最长 {st['max_latency']}s")
+
+
+_call_stats = CallStats()
+
+
+def get_call_stats() -> CallStats:
+    return _call_stats
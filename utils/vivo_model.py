@@ -1,102 +1,72 @@
 import json
 import uuid
-import chardet
 import requests
 from utils.auth_util import gen_sign_headers
 import time
 import datetime
 from config.config import APP_ID, APP_KEY, URI, DOMAIN, config
 import traceback
-import socket
 import utils.BizLogger as BizLogger
+from utils.http_pool import get_http_pool
+from utils.circuit_breaker import get_breaker
+from utils.hedging import get_hedger
+from utils.rate_limiter import get_limiter
+from utils.sse import DONE as SSE_DONE, JSONObjectDetector, SSEDecoder, extract_delta
+from utils.telemetry import CallResult
+from utils.retry_policy import Outcome, classify_exception, classify_response, describe_outcome, get_retry_policy
 
 current_time = datetime.datetime.now()
 time_string = current_time.strftime("%Y-%m-%d %H:%M")
 
-errors = ["timeout", "An error occurred.", "429 Too Many Requests", "http://nginx.org/r/error_log ",
-          "hit model rate limit", "当前网络出现问题", "qps request limit", "hit model rate limit", "unknown error",
-          "network error", "context_length_exceeded", "InternalServerError"]
-
-
-# def vivo_GPT(prompt, model, sessionId, history=[], verbose=False):
-#
-#     METHOD = 'POST'
-#     params = {
-#         'requestId': str(uuid.uuid4())
-#     }
-#     data = {
-#         'prompt': prompt,
-#         # "messages": history,
-#         'task_type': 'chatgpt',
-#         "model": config["model"][model]["name"],
-#         "provider": config["model"][model]["provider"],
-#         'sessionId': sessionId,
-#     }
-#     if "params" in config["model"][model].keys():
-#         param = config["model"][model]["params"]
-#         data["extra"] = param
-#     # 使用 verbose 开关控制打印行为
-#     if verbose:
-#         # 为了保持终端清爽，即使在详细模式下也只打印部分Prompt
-#         truncated_prompt = prompt[:200] + '...' if len(prompt) > 200 else prompt
-#         print(f"\n--- Calling Model: {model} ---")
-#         print(f"Prompt (truncated): {truncated_prompt}")
-#     #     print(f"Request Body: {json.dumps(data, ensure_ascii=False)}") # 如需完整请求体，可取消此行注释
-#     else:
-#         # 在非详细模式下，可以完全不打印，或只打印一个点来表示正在工作
-#         # print('.', end='', flush=True) # 取消注释则每次调用打印一个点
-#         pass
-#     headers = gen_sign_headers(APP_ID, APP_KEY, METHOD, URI, params)
-#     url = 'http://{}{}'.format(DOMAIN, URI)
-#     # 配置化domain
-#     # if "domain" in config["model"][model].keys():
-#     #     domain = config["model"][model]["domain"]
-#     #     url = 'http://{}{}'.format(domain, URI)
-#     time.sleep(5)
-#     print(json.dumps(data, ensure_ascii=False))
-#     # BizLogger.log_info("vivo_model 请求参数:{}".format(json.dumps(data, ensure_ascii=False)))
-#     content = ""
-#     try:
-#         # s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-#         # s.connect((url, "8080"))
-#         response = requests.post(url, json=data, headers=headers, params=params, timeout=600)
-#         if response.status_code == 200:
-#             res = response.json()
-#         else:
-#             res = response.text
-#         i = 1
-#         while any(err in str(res) for err in errors) and i < 3:
-#             print(f"检测到错误或限流，正在进行第 {i} 次重试...")
-#             time.sleep(5)  # 在重试前等待
-#             response = requests.post(url, json=data, headers=headers, params=params, timeout=600)
-#             if response.status_code == 200:
-#                 res = response.json()
-#             else:
-#                 res = response.text
-#             i += 1
-#         # print(res)
-#         BizLogger.log_info("vivo_model 请求结果:{}".format(res))
-#         if "data" not in res:
-#             content = res
-#         else:
-#             con = res["data"]
-#             if con is None:
-#                 content = res["data"]
-#             else:
-#                 if "content" in con.keys() and con["content"]:
-#                     content = con["content"]
-#                 else:
-#                     content = res["msg"]
-#         print(content)
-#     except:
-#         print(traceback.print_exc())
-#     # finally:
-#     #     s.close()
-#     return content
-#
 
-def vivo_GPT(prompt, model, sessionId, history=[], verbose=False, show_prompts=False):
-    METHOD = 'POST'
+def resolve_domain(model):
+    """模型配置中有自己的 'domain' 时覆盖全局默认 DOMAIN"""
+    return config["model"].get(model, {}).get("domain", DOMAIN)
+
+
+def _send_with_retry(http, limiter, url, data, headers, params, timeout, stream=False):
+    """
+    统一的发送与重试：按 retry_policy 对每次响应分类，可重试的错误指数退避（带抖动、尊重 Retry-After），
+    不可重试的错误（如 context_length_exceeded）立即返回。
+    返回 (res, outcome, attempts)，res 为 JSON(dict) 或原始文本；网络异常耗尽重试时 res 为空字符串。
+    stream=True 时 HTTP 200 直接返回未读取的 response（由调用方逐块读取并关闭），其余状态码照常分类重试。
+    """
+    policy = get_retry_policy()
+    attempt = 0
+    while True:
+        attempt += 1
+        retry_after = None
+        start = time.time()
+        try:
+            with limiter.acquire():
+                start = time.time()
+                response = http.post(url, json=data, headers=headers, params=params, timeout=timeout, stream=stream)
+            if stream and response.status_code == 200:
+                res, outcome = response, Outcome.OK
+            else:
+                res = response.json() if response.status_code == 200 else response.text
+                outcome, retry_after = classify_response(response.status_code, res, response.headers)
+        except (requests.RequestException, ValueError) as e:
+            print(f"请求异常: {type(e).__name__}: {e}")
+            res = ""
+            outcome = classify_exception(e)
+        # 自适应并发：把本次请求的结果反馈给限流器
+        limiter.record(outcome, time.time() - start)
+        if not policy.should_retry(outcome, attempt):
+            if outcome != Outcome.OK:
+                print(f"请求失败（{describe_outcome(outcome)}），共尝试 {attempt} 次")
+            return res, outcome, attempt
+        delay = policy.backoff(outcome, attempt, retry_after)
+        print(f"检测到{describe_outcome(outcome)}，{delay:.1f}s 后进行第 {attempt} 次重试...")
+        time.sleep(delay)
+
+
+def build_request(prompt, model, sessionId, uri=None):
+    """
+    组装一次网关请求，返回 (url, data, headers, params, domain)
+    Domain：模型配置中的 'domain' 优先于全局默认值
+    """
+    uri = uri or URI
     params = {
         'requestId': str(uuid.uuid4())
     }
@@ -108,18 +78,37 @@ def vivo_GPT(prompt, model, sessionId, history=[], verbose=False, show_prompts=F
         "provider": config["model"][model]["provider"],
         'sessionId': sessionId,
     }
-    # (小优化：'in a_dict' 比 'in a_dict.keys()' 更高效且Pythonic)
     if "params" in config["model"][model]:
-        param = config["model"][model]["params"]
-        data["extra"] = param
+        data["extra"] = config["model"][model]["params"]
+    headers = gen_sign_headers(APP_ID, APP_KEY, 'POST', uri, params)
+    domain = resolve_domain(model)
+    url = f'http://{domain}{uri}'
+    return url, data, headers, params, domain
 
+
+def extract_content(res):
+    """从网关响应中取出模型正文；没有正文时返回 msg 或整个响应字符串"""
+    if "data" not in res:
+        return res
+    con = res["data"]
+    if con and con.get("content"):
+        return con["content"]
+    return res.get("msg", str(res))
+
+
+def extract_usage(res):
+    """从网关响应中取出 token 用量，返回 (promptTokens, completionTokens, totalTokens)，缺失时为 0"""
+    con = res.get("data") if isinstance(res, dict) else None
+    usage = (con or {}).get("usage") or {} if isinstance(con, dict) else {}
+    return (int(usage.get("promptTokens") or 0), int(usage.get("completionTokens") or 0),
+            int(usage.get("totalTokens") or 0))
+
+
+def print_request_info(prompt, model, sessionId, data, verbose, show_prompts):
     if verbose:
         truncated_prompt = prompt[:200] + '...' if len(prompt) > 200 else prompt
         print(f"\n--- Calling Model: {model} ---")
         print(f"Prompt (truncated): {truncated_prompt}")
-    else:
-        pass
-
     # 控制prompt输出的显示
     if show_prompts:
         print(json.dumps(data, ensure_ascii=False))
@@ -127,126 +116,192 @@ def vivo_GPT(prompt, model, sessionId, history=[], verbose=False, show_prompts=F
         print(f"调用模型: {model} (sessionId: {sessionId[:8]}...)")
 
 
-    headers = gen_sign_headers(APP_ID, APP_KEY, METHOD, URI, params)
-
-    # --- 核心修改开始：动态确定 Domain ---
-    # 1. 首先，使用全局默认的 DOMAIN
-    request_domain = DOMAIN
+def print_response_info(content, show_prompts):
+    # 控制响应输出的显示
+    if show_prompts:
+        print(content)
+    else:
+        print(f"响应长度: {len(content)} 字符")
+        if len(content) < 100:
+            print(f"响应内容: {content}")
+        else:
+            print(f"响应内容: {content[:50]}...{content[-50:]}")
 
-    # 2. 检查当前模型配置中是否有自己的 'domain' 键
-    if "domain" in config["model"][model]:
-        # 3. 如果有，就用模型自己的 domain 覆盖掉默认值
-        request_domain = config["model"][model]["domain"]
 
-    # 4. 使用最终确定的 request_domain 来构建 URL
-    url = f'http://{request_domain}{URI}'  # 使用 f-string，更现代易读
-    # --- 核心修改结束 ---
+def _call_once(prompt, model, sessionId, verbose=False, show_prompts=False):
+    url, data, headers, params, domain = build_request(prompt, model, sessionId)
+    print_request_info(prompt, model, sessionId, data, verbose, show_prompts)
 
-    time.sleep(5)
-    # BizLogger.log_info("vivo_model 请求参数:{}".format(json.dumps(data, ensure_ascii=False)))
+    http = get_http_pool()
+    # 按 (模型, domain) 共享的限流器，只有额度耗尽时才会等待
+    limiter = get_limiter(model, domain)
 
-    content = ""
+    result = CallResult(model=model)
+    start = time.time()
     try:
-        response = requests.post(url, json=data, headers=headers, params=params, timeout=1200)
-
-        # --- 您原有的响应处理和重试逻辑（保持不变）---
-        if response.status_code == 200:
-            res = response.json()
-        else:
-            res = response.text
-        i = 1
-        while any(err in str(res) for err in errors) and i < 3:
-            print(f"检测到错误或限流，正在进行第 {i} 次重试...")
-            time.sleep(5)
-            response = requests.post(url, json=data, headers=headers, params=params, timeout=1200)
-            if response.status_code == 200:
-                res = response.json()
-            else:
-                res = response.text
-            i += 1
-
+        res, result.outcome, result.attempts = _send_with_retry(http, limiter, url, data, headers, params,
+                                                                timeout=1200)
         BizLogger.log_info("vivo_model 请求结果:{}".format(res))
-
-        if "data" not in res:
-            content = res
-        else:
-            con = res["data"]
-            if con is None:
-                content = res["data"]
-            else:
-                # (小优化：使用 .get() 方法，更安全，避免因 'content' 键不存在而报错)
-                if con.get("content"):
-                    content = con["content"]
-                else:
-                    content = res.get("msg", str(res))  # 如果 msg 也没有，就返回整个响应字符串
-
-        # 控制响应输出的显示
-        if show_prompts:
-            print(content)
-        else:
-            print(f"响应长度: {len(content)} 字符")
-            if len(content) < 100:
-                print(f"响应内容: {content}")
-            else:
-                print(f"响应内容: {content[:50]}...{content[-50:] if len(content) > 100 else ''}")
+        # 空响应时网关只有 msg，不作为正文返回
+        result.content = "" if result.outcome == Outcome.EMPTY else extract_content(res)
+        result.prompt_tokens, result.completion_tokens, result.total_tokens = extract_usage(res)
+        print_response_info(result.content, show_prompts)
     except:
         print(traceback.print_exc())
+    result.latency = time.time() - start
+    return result
 
-    return content
 
+def route_model(model):
+    """
+    熔断路由：返回本次实际调用的模型。
+    模型已熔断时改用配置的 fallback 模型；没有可用的备用模型时返回 None（快速失败）
+    """
+    if get_breaker(model, resolve_domain(model)).allow():
+        return model
+    fallback = config["model"][model].get("fallback")
+    if fallback in config["model"] and get_breaker(fallback, resolve_domain(fallback)).allow():
+        print(f"[熔断] {model} 已熔断，本次调用切换到备用模型 {fallback}")
+        return fallback
+    print(f"[熔断] {model} 已熔断且没有可用的备用模型，快速失败")
+    return None
 
-def streaming_vivo_GPT(prompt, model, sessionId, show_prompts=False):
-    METHOD = 'POST'
-    params = {
-        'requestId': str(uuid.uuid4())
-    }
-    data = {
-        'prompt': prompt,
-        'task_type': 'chatgpt',
-        "model": config["model"][model]["name"],
-        "provider": config["model"][model]["provider"],
-        'sessionId': sessionId,
-    }
-    if "params" in config["model"][model].keys():
-        param = config["model"][model]["params"]
-        data["extra"] = param
-    print(f"modelname：{model}")
-    global URI
-    __URI = URI + "/stream"
-    headers = gen_sign_headers(APP_ID, APP_KEY, METHOD, __URI, params)
-    url = 'http://{}{}'.format(DOMAIN, __URI)
-    time.sleep(0.5)
-    # 控制prompt输出的显示
-    if show_prompts:
-        print(json.dumps(data, ensure_ascii=False))
+
+def finish_route(model, target, result):
+    """把调用结果计入目标模型的熔断器；备用模型成功返回时标记为 FALLBACK（不写入响应缓存）"""
+    get_breaker(target, resolve_domain(target)).record(result.outcome)
+    if target != model and result.outcome == Outcome.OK:
+        result.outcome = Outcome.FALLBACK
+    return result
+
+
+def call_model(prompt, model, sessionId, verbose=False, show_prompts=False):
+    """
+    统一的模型调用入口，返回 CallResult（正文、token 用量、耗时、尝试次数、实际应答模型、结果归类）
+    开启对冲时，耗时超过该模型历史分位数的调用会再发一份请求，取先成功者
+    """
+    target = route_model(model)
+    if target is None:
+        return CallResult(model=model, outcome=Outcome.CIRCUIT_OPEN)
+    result = get_hedger().run(target, lambda: _call_once(prompt, target, sessionId, verbose, show_prompts),
+                              limiter=get_limiter(target, resolve_domain(target)))
+    return finish_route(model, target, result)
+
+
+def vivo_GPT(prompt, model, sessionId, history=[], verbose=False, show_prompts=False):
+    return call_model(prompt, model, sessionId, verbose=verbose, show_prompts=show_prompts).content
+
+
+def _iter_chunks(response, size=8192):
+    """
+    逐块读取流式响应：read1 有多少读多少，立即返回。
+    网关不使用分块传输（Connection: close、无 Content-Length）时，iter_content(chunk_size=None) 会一直读到流结束
+    """
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size=None)
+        return
+    while True:
+        chunk = read1(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _stream_data(prompt, model, sessionId, show_prompts, result):
+    """
+    流式调用的公共部分：熔断路由 + 重试建立连接，逐个产出 SSE 事件的 data 字段（str）。
+    result（CallResult）记录实际应答模型、尝试次数与建立连接的结果归类；
+    调用方提前停止迭代时连接会被关闭并归还连接池
+    """
+    target = route_model(model)
+    if target is None:
+        result.outcome = Outcome.CIRCUIT_OPEN
+        return
+    url, data, headers, params, domain = build_request(prompt, target, sessionId, uri=URI + "/stream")
+    print_request_info(prompt, target, sessionId, data, False, show_prompts)
     BizLogger.log_info("vivo_model 请求参数:{}".format(json.dumps(data, ensure_ascii=False)))
-    content = ""
+    response, outcome, result.attempts = _send_with_retry(get_http_pool(), get_limiter(target, domain), url, data,
+                                                          headers, params, timeout=600, stream=True)
+    result.model = target
+    result.outcome = outcome
+    get_breaker(target, domain).record(outcome)
+    if outcome != Outcome.OK:
+        print(f"流式请求失败（{describe_outcome(outcome)}）: {str(response)[:200]}")
+        return
+
     try:
-        # s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # s.connect((url, "8080"))
-        print("data:", data)
-        print("headers:", headers)
-        response = requests.post(url, json=data, headers=headers, params=params, timeout=600, stream=True)
-        if response.status_code == 200:
-            first_line = True
-            for line in response.iter_lines():
-                if line:
-                    if first_line:
-                        encoding = 'utf-8'
-                        first_line = False
-                    else:
-                        encoding = chardet.detect(line)['encoding']
-                    line = line.decode(encoding, errors='ignore')
-                    print(line)
-                    if not "event:close" in line or not 'data:[DONE]' in line:
-                        line = line.split("data:")[1]
-                        yield json.loads(line)
-        else:
-            res = response.text
-            print(res)
+        decoder = SSEDecoder()
+        for chunk in _iter_chunks(response):
+            for event in decoder.feed(chunk):
+                if event is SSE_DONE:
+                    return
+                yield event[1]
+        for event in decoder.flush():
+            if event is not SSE_DONE:
+                yield event[1]
+    finally:
+        # 关闭后连接才会回到连接池
+        response.close()
 
-    except:
-        print(traceback.print_exc())
+
+def streaming_vivo_GPT(prompt, model, sessionId, show_prompts=False):
+    """
+    流式调用模型，逐个产出网关事件（json 解析后的 dict，与旧接口一致）。
+    使用 SSEDecoder 增量解析（UTF-8，不再逐行探测编码），经熔断路由与重试策略建立连接
+    """
+    for payload in _stream_data(prompt, model, sessionId, show_prompts, CallResult(model=model)):
+        try:
+            yield json.loads(payload)
+        except json.JSONDecodeError:
+            continue
+
+
+def stream_deltas(prompt, model, sessionId, show_prompts=False, result=None):
+    """
+    流式调用模型，逐个产出增量文本（str）；传入 result 时记录尝试次数、实际应答模型与 token 用量
+    """
+    result = result if result is not None else CallResult(model=model)
+    for payload in _stream_data(prompt, model, sessionId, show_prompts, result):
+        delta, event = extract_delta(payload)
+        if event is not None:
+            usage = extract_usage(event)
+            if usage[2]:
+                result.prompt_tokens, result.completion_tokens, result.total_tokens = usage
+        if delta:
+            yield delta
+
+
+def stream_until_json(prompt, model, sessionId, on_json=None, show_prompts=False):
+    """
+    流式调用，正文中第一个顶层 JSON 对象一闭合就停止读取并返回，不等待流结束。
+    返回 CallResult：拿到 JSON 时 content 为对象文本、outcome 为 OK（备用模型应答时为 FALLBACK），
+    否则 content 为已收到的正文；on_json 在 JSON 闭合时以对象文本为参数被调用
+    """
+    result = CallResult(model=model)
+    detector = JSONObjectDetector()
+    parts = []
+    start = time.time()
+    stream = stream_deltas(prompt, model, sessionId, show_prompts=show_prompts, result=result)
+    try:
+        for delta in stream:
+            parts.append(delta)
+            if detector.feed(delta) is not None:
+                if on_json is not None:
+                    on_json(detector.result)
+                break
+    finally:
+        stream.close()
+    result.latency = time.time() - start
+    if detector.result is not None:
+        result.content = detector.result
+        result.outcome = Outcome.OK if result.model == model else Outcome.FALLBACK
+    else:
+        result.content = "".join(parts)
+        if result.outcome == Outcome.OK:
+            # 连接正常但流结束时仍没有完整 JSON
+            result.outcome = Outcome.EMPTY
+    return result
 
 
 def local_GPT(prompt, url="http://10.222.8.126:31272/api/generation_sync "):
@@ -274,70 +329,17 @@ def local_GPT(prompt, url="http://10.222.8.126:31272/api/generation_sync "):
 
 
 def vivo_GPT_Token(prompt, model, sessionId, show_prompts=False):
-    METHOD = 'POST'
-    params = {
-        'requestId': str(uuid.uuid4())
-    }
-    data = {
-        'prompt': prompt,
-        'task_type': 'chatgpt',
-        "model": config["model"][model]["name"],
-        "provider": config["model"][model]["provider"],
-        'sessionId': sessionId,
-    }
-    if "params" in config["model"][model].keys():
-        param = config["model"][model]["params"]
-        data["extra"] = param
-    print(f"modelname：{model}")
-    headers = gen_sign_headers(APP_ID, APP_KEY, METHOD, URI, params)
-    url = 'http://{}{}'.format(DOMAIN, URI)
-    time.sleep(5)
-    # 控制prompt输出的显示
-    if show_prompts:
-        print(json.dumps(data, ensure_ascii=False))
-    BizLogger.log_info("vivo_model 请求参数:{}".format(json.dumps(data, ensure_ascii=False)))
-    content = ""
-    try:
-        # s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # s.connect((url, "8080"))
-        response = requests.post(url, json=data, headers=headers, params=params, timeout=600)
-        if response.status_code == 200:
-            res = response.json()
-        else:
-            res = response.text
-        i = 1
-        while any(item in res for item in errors) and i < 3:
-            print("进入重试")
-            response = requests.post(url, json=data, headers=headers, params=params, timeout=600)
-            if response.status_code == 200:
-                res = response.json()
-            else:
-                res = response.text
-            i = i + 1
-        print(res)
-        BizLogger.log_info("vivo_model 请求结果:{}".format(res))
-        result = {}
-        if "data" not in res:
-            content = res
-        else:
-            con = res["data"]
-            if con is None:
-                content = res["data"]
-            else:
-                if "content" in con.keys() and con["content"]:
-                    content = con["content"]
-                    result['promptToken'] = con['usage']['promptTokens']
-                    result['completionToken'] = con['usage']['completionTokens']
-                    result['totalToken'] = con['usage']['totalTokens']
-                else:
-                    content = res["msg"]
-        print(content)
-        result['result'] = content
-        print(json.dumps(result, ensure_ascii=False))
-    except:
-        print(traceback.print_exc())
-    # finally:
-    #     s.close()
+    """
+    兼容旧接口：返回 {'result': 正文, 'promptToken', 'completionToken', 'totalToken'}（成功时才有 token 字段）
+    """
+    call = call_model(prompt, model, sessionId, show_prompts=show_prompts)
+    result = {}
+    if call.ok and call.total_tokens:
+        result['promptToken'] = call.prompt_tokens
+        result['completionToken'] = call.completion_tokens
+        result['totalToken'] = call.total_tokens
+    result['result'] = call.content
+    print(json.dumps(result, ensure_ascii=False))
     return result
 
 
@@ -363,12 +365,6 @@ def get130BResult(messages):
 
 if __name__ == '__main__':
     #     # vivo_GPT("中国共产党领导人是谁", "chatgpt", str(uuid.uuid4()))
-    #     i = 1
-    #     if i == 1:
-    #         res = "{'message':'network error'}"
-    #     while any(item in res for item in errors) and i < 3:
-    #         print("进入重试")
-    #         i = i + 1
     #     shit = streaming_vivo_GPT("你是?", "chatgpt", str(uuid.uuid4()))
     #     for _ in shit:
     #         print(_)
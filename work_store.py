@@ -0,0 +1,338 @@
+import os
+import json
+import contextvars
+import time
+import socket
+import sqlite3
+import threading
+import pandas as pd
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dedup import fan_out, group_duplicates, print_dedup_summary, write_duplicate_map
+from output_writer import initialize_output, result_name
+from processor_threaded import evaluate_row
+from result_journal import STATUS_ERROR, ResultJournal, apply_journal, dataset_fingerprint, journal_path_for
+from row_scheduler import estimate_costs
+from utils.telemetry import get_call_stats
+from utils.budget import get_budget, use_budget
+
+"""
+多进程 / 多机分片评测：共享的租约式任务库（SQLite 文件，放在各机器都能访问的共享目录）
+角色（main.py --role）：
+  • coordinator：完成反思学习后建立任务（写入 rules、逐行任务、重复映射），等待所有行完成，
+                 再把结果物化为 {model}_part_all 结果文件，继续执行合并与一致性分析
+  • worker     ：从任务库读取 coordinator 的 rules，按空闲线程数租用行、评测、写回结果；
+                 评测期间定期续租，进程退出（或机器宕机）后租约过期，其他 worker 会重新租用这些行；
+                 严重错误的行放回待租，与单机续跑一样重新评测，一行最多租出 max_attempts 次，之后按错误结果完成
+任务库可以重复使用：coordinator 重启时已完成的行保持完成，只补充新行。
+跨机器共享时依赖共享文件系统对 SQLite 文件锁的支持，因此不开启 WAL。
+"""
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+
+DEFAULT_LEASE_TTL = 600
+# 一行最多租出的次数（含租约过期后的重新租出）；达到后严重错误的结果不再重试
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def job_name(version, file_path, model_name):
+    return f"{version}/{os.path.basename(file_path)}/{model_name}"
+
+
+def _to_plain(value):
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class WorkStore:
+    """租约式任务库；每个方法都是一个独立事务，可被多个进程、多个线程同时调用"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._tx() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                         " job TEXT PRIMARY KEY, rules TEXT, duplicates TEXT, created_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases ("
+                         " job TEXT, row_idx INTEGER, priority REAL, status TEXT, worker TEXT,"
+                         " lease_until REAL, attempts INTEGER DEFAULT 0, record TEXT, log TEXT,"
+                         " PRIMARY KEY (job, row_idx))")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_leases_status ON leases (job, status, priority)")
+
+    @contextmanager
+    def _tx(self):
+        # BEGIN IMMEDIATE 先拿写锁，保证租用时的“查询 + 更新”对其他进程是原子的
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ---------- coordinator ----------
+    def create_job(self, job, rules, priorities, duplicates=None):
+        """
+        建立（或补充）任务：priorities 为 {行号: 优先级}，优先级高的行先被租出；
+        duplicates 为 dedup 的重复映射，物化结果时复制给重复行
+        """
+        dup_json = json.dumps({str(k): v for k, v in (duplicates or {}).items()}, ensure_ascii=False,
+                              default=_to_plain)
+        with self._tx() as conn:
+            conn.execute("INSERT OR REPLACE INTO jobs (job, rules, duplicates, created_at) VALUES (?, ?, ?, ?)",
+                         (job, json.dumps(rules, ensure_ascii=False, default=str), dup_json, time.time()))
+            conn.executemany(
+                "INSERT OR IGNORE INTO leases (job, row_idx, priority, status) VALUES (?, ?, ?, ?)",
+                [(job, int(idx), float(priority), STATUS_PENDING) for idx, priority in priorities.items()]
+            )
+
+    def get_job(self, job):
+        """返回 (rules, duplicates)；任务尚未建立时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT rules, duplicates FROM jobs WHERE job = ?", (job,)).fetchone()
+        if row is None:
+            return None
+        duplicates = {int(k): [tuple(d) for d in v] for k, v in json.loads(row[1] or "{}").items()}
+        return json.loads(row[0]), duplicates
+
+    def progress(self, job):
+        """各状态的行数，以及被重新租出过（租约过期或上次严重错误）的行数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM leases WHERE job = ? GROUP BY status",
+                                      (job,)).fetchall()
+            retried = self._conn.execute("SELECT COUNT(*) FROM leases WHERE job = ? AND attempts > 1",
+                                         (job,)).fetchone()[0]
+        counts = {STATUS_PENDING: 0, STATUS_LEASED: 0, STATUS_DONE: 0}
+        counts.update(dict(rows))
+        counts["retried"] = retried
+        return counts
+
+    def records(self, job):
+        """已完成行的 (结果记录, 错误日志行)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT record, log FROM leases WHERE job = ? AND status = ? ORDER BY row_idx",
+                                      (job, STATUS_DONE)).fetchall()
+        return [(json.loads(record), json.loads(log or "[]")) for record, log in rows]
+
+    # ---------- worker ----------
+    def lease(self, job, worker, n, ttl=DEFAULT_LEASE_TTL):
+        """租用至多 n 行（待评测的行，或租约已过期的行），返回行号列表"""
+        if n <= 0:
+            return []
+        now = time.time()
+        with self._tx() as conn:
+            rows = conn.execute(
+                "SELECT row_idx FROM leases WHERE job = ? AND"
+                " (status = ? OR (status = ? AND lease_until < ?))"
+                " ORDER BY priority DESC, row_idx LIMIT ?",
+                (job, STATUS_PENDING, STATUS_LEASED, now, int(n))
+            ).fetchall()
+            idxs = [r[0] for r in rows]
+            conn.executemany(
+                "UPDATE leases SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1"
+                " WHERE job = ? AND row_idx = ?",
+                [(STATUS_LEASED, worker, now + ttl, job, idx) for idx in idxs]
+            )
+        return idxs
+
+    def renew(self, job, worker, idxs, ttl=DEFAULT_LEASE_TTL):
+        if not idxs:
+            return
+        with self._tx() as conn:
+            conn.executemany(
+                "UPDATE leases SET lease_until = ? WHERE job = ? AND row_idx = ? AND status = ? AND worker = ?",
+                [(time.time() + ttl, job, int(idx), STATUS_LEASED, worker) for idx in idxs]
+            )
+
+    def complete(self, job, idx, record, log_lines=(), max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        写回一行结果；租约过期后被其他 worker 重复评测的行，以最后写回的结果为准（严重错误不覆盖已完成的结果）
+        严重错误（STATUS_ERROR）且租出次数未达 max_attempts 的行放回待租；返回该行是否已完成
+        """
+        with self._tx() as conn:
+            status, attempts = conn.execute("SELECT status, attempts FROM leases WHERE job = ? AND row_idx = ?",
+                                            (job, int(idx))).fetchone()
+            if record["status"] == STATUS_ERROR and status == STATUS_DONE:
+                return True
+            done = record["status"] != STATUS_ERROR or attempts >= max_attempts
+            conn.execute(
+                "UPDATE leases SET status = ?, lease_until = NULL, record = ?, log = ? WHERE job = ? AND row_idx = ?",
+                (STATUS_DONE if done else STATUS_PENDING, json.dumps(record, ensure_ascii=False, default=_to_plain),
+                 json.dumps(list(log_lines), ensure_ascii=False), job, int(idx))
+            )
+        return done
+
+    def release(self, job, worker, idxs):
+        """worker 正常退出时把未完成的租约还回去，不必等租约过期"""
+        if not idxs:
+            return
+        with self._tx() as conn:
+            conn.executemany(
+                "UPDATE leases SET status = ?, worker = NULL, lease_until = NULL"
+                " WHERE job = ? AND row_idx = ? AND status = ? AND worker = ?",
+                [(STATUS_PENDING, job, int(idx), STATUS_LEASED, worker) for idx in idxs]
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _load_dataset(file_path):
+    df = pd.read_excel(file_path)
+    # 与 initialize_output 一致：没有 id 列时按行号补上
+    if "id" not in df.columns:
+        df.insert(0, "id", range(len(df)))
+    return df
+
+
+def _print_progress(job, counts):
+    total = counts[STATUS_PENDING] + counts[STATUS_LEASED] + counts[STATUS_DONE]
+    print(f"[任务库] {job}：完成 {counts[STATUS_DONE]}/{total}，租出 {counts[STATUS_LEASED]}，"
+          f"待租 {counts[STATUS_PENDING]}，重新租出（租约过期或出错重试）{counts['retried']} 行")
+
+
+def run_coordinator(store, job, file_path, output_dir, model_name, rules, schedule="file", dedup=True,
+                    poll_interval=30, budget=None):
+    """
+    建立任务并等待所有 worker 完成，然后把结果物化为 {model}_part_all 结果文件（供 merge_thread_outputs 合并）
+    返回结果文件路径；budget 为本次运行的预算（省略时使用全局预算），结束时汇总 coordinator 一侧的用量
+    """
+    budget = budget or get_budget()
+    with use_budget(budget):
+        df = _load_dataset(file_path)
+        todo_df, duplicates = df, {}
+        if dedup:
+            todo_df, duplicates = group_duplicates(df)
+            print_dedup_summary(len(df), duplicates)
+        # ljf 时估算成本高的行先被租出，否则按文件顺序
+        if schedule == "ljf":
+            priorities = estimate_costs(todo_df).to_dict()
+        else:
+            priorities = {idx: -float(idx) for idx in todo_df.index}
+        store.create_job(job, rules, priorities, duplicates)
+        print(f"[任务库] 已建立任务 {job}（{len(priorities)} 行），等待 worker 租用：{store.path}")
+
+        while True:
+            counts = store.progress(job)
+            _print_progress(job, counts)
+            if counts[STATUS_PENDING] + counts[STATUS_LEASED] == 0:
+                break
+            time.sleep(poll_interval)
+
+        os.makedirs(output_dir, exist_ok=True)
+        out_df, output_file_path, log_file_path, _, _ = initialize_output(
+            file_path, output_dir, result_name(model_name), df
+        )
+        records, log_lines = [], []
+        for record, lines in store.records(job):
+            records.append(record)
+            records.extend(fan_out(record, duplicates.get(record["idx"], ())))
+            log_lines.extend(lines)
+        # 同时写一份结果日志，与单机流程的产物一致（可用 result_journal 命令行再次物化）
+        with ResultJournal(journal_path_for(output_file_path), dataset_fingerprint(df)) as journal:
+            journal.append_many(records)
+        apply_journal(out_df, records)
+        out_df.to_excel(output_file_path, index=False)
+        if log_lines:
+            with open(log_file_path, "a", encoding="utf-8") as f:
+                f.writelines(log_lines)
+        if dedup:
+            write_duplicate_map(output_dir, df, duplicates)
+    print(f"[任务库] 所有行已完成，结果已写入: {output_file_path}")
+    budget.print_summary()
+    budget.dump(output_dir, "budget_coordinator.json")
+    return output_file_path
+
+
+def run_worker(store, job, file_path, output_dir, model_name, thread_num=5, worker_id=None,
+               lease_ttl=DEFAULT_LEASE_TTL, verbose=False, show_prompts=False, stream=False, decision="llm",
+               poll_interval=10, budget=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    租用 -> 评测 -> 写回，直到任务中没有待评测或租出的行；返回本 worker 完成的行数
+    本 worker 的预算（budget，省略时使用全局预算）硬上限触发后不再租用新行，手上的行完成后退出，剩余行留给其他 worker
+    """
+    worker_id = worker_id or default_worker_id()
+    job_info = store.get_job(job)
+    while job_info is None:
+        print(f"[任务库] 等待 coordinator 建立任务 {job} ...")
+        time.sleep(poll_interval)
+        job_info = store.get_job(job)
+    rules, _ = job_info
+    df = _load_dataset(file_path)
+
+    held = set()
+    held_lock = threading.Lock()
+    stop = threading.Event()
+
+    def heartbeat():
+        # 每 1/3 个租约时长续租一次，评测慢的行也不会被其他 worker 抢走
+        while not stop.wait(lease_ttl / 3):
+            with held_lock:
+                idxs = list(held)
+            store.renew(job, worker_id, idxs, lease_ttl)
+
+    beat = threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True)
+    beat.start()
+    print(f"[任务库] worker {worker_id} 开始租用任务 {job}（{thread_num} 线程）")
+    budget = budget or get_budget()
+    counts = store.progress(job)
+    budget.start(counts[STATUS_PENDING] + counts[STATUS_LEASED])
+    done = 0
+    running = {}
+    try:
+        with ThreadPoolExecutor(max_workers=thread_num) as executor:
+            while True:
+                # 只租空闲线程数这么多的行，避免租着行排队、耽误其他 worker
+                free = 0 if budget.exhausted else thread_num - len(running)
+                for idx in store.lease(job, worker_id, free, lease_ttl):
+                    with held_lock:
+                        held.add(idx)
+                    with use_budget(budget):
+                        context = contextvars.copy_context()
+                    running[executor.submit(context.run, evaluate_row, df.loc[idx], idx, model_name, rules,
+                                            verbose=verbose, show_prompts=show_prompts, stream=stream,
+                                            decision=decision)] = idx
+                if not running:
+                    if budget.exhausted:
+                        print(f"[任务库] worker {worker_id} 预算已用尽（{budget.exceeded}），停止租用")
+                        break
+                    counts = store.progress(job)
+                    if counts[STATUS_PENDING] + counts[STATUS_LEASED] == 0:
+                        break
+                    # 剩余的行都被其他 worker 租着，等它们完成或租约过期
+                    time.sleep(poll_interval)
+                    continue
+                finished, _ = wait(list(running), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    idx = running.pop(future)
+                    record, log_lines = future.result()
+                    finished_row = store.complete(job, idx, record, log_lines, max_attempts)
+                    with held_lock:
+                        held.discard(idx)
+                    if not finished_row:
+                        print(f"[任务库] 行 {idx} 严重错误（{record.get('reason', '')}），已放回待租")
+                        continue
+                    done += 1
+                    budget.row_done()
+                    if done % 50 == 0:
+                        _print_progress(job, store.progress(job))
+    finally:
+        stop.set()
+        with held_lock:
+            store.release(job, worker_id, list(held))
+    print(f"[任务库] worker {worker_id} 完成 {done} 行")
+    os.makedirs(output_dir, exist_ok=True)
+    get_call_stats().dump(output_dir, f"call_stats_{worker_id}.json")
+    budget.print_summary()
+    budget.dump(output_dir, f"budget_{worker_id}.json")
+    return done